@@ -0,0 +1,206 @@
+#Runs get_paper_info over a long list of urls, writing each row of the output
+#CSV as soon as it is ready. Every finished or failed url is recorded in a
+#checkpoint file, so a run that crashes or is stopped with Ctrl-C can be
+#started again and only the urls that are left get fetched.
+#At the end of every run the time spent in each stage is written to
+#<output>.metrics.json and <output>.prom, see instrumentation.py.
+#Rows are also appended to a Parquet dataset next to the CSV, e.g. output.parquet/,
+#with one part file per run, see columnar.py.
+#Urls are grouped by canonical.canonical_url, so a paper listed under several
+#variants of its url is fetched once, from a url of its page rather than its PDF,
+#and its record written for each of them.
+#Records are kept in <output>.index.jsonl, so later runs don't fetch them again.
+#Only records with every one of REQUIRED_FIELDS are kept there, so a paper whose
+#page came back incomplete is fetched again by a later run.
+#PubMed articles are looked up in batches with the E-utilities instead of page
+#by page, see get_paper_info.iter_paper_info
+#
+#Usage: python batch_runner.py filtered_papers.csv output.csv
+import argparse
+import csv
+import json
+import pathlib
+import sys
+
+import pyarrow as pa
+
+import canonical
+import columnar
+import fetcher as fetching
+import get_paper_info
+import http_cache
+import instrumentation
+import pubmed
+
+COLUMNS = ['url', 'title', 'doi', 'abstract', 'full_doc_link', 'is_open_access']
+#what get_paper_info returns for a url, stored for each paper in the index
+FIELDS = COLUMNS[1:]
+#fields a record must have to be kept in the index, the ones a HIT can't do without
+REQUIRED_FIELDS = ('title', 'abstract')
+#the Parquet copy has the row number and the publisher as well, which is dictionary encoded
+PARQUET_SCHEMA = columnar.make_schema(['row'] + COLUMNS + ['publisher'],
+                                      {'row': pa.int64(), 'is_open_access': pa.bool_()})
+
+
+def is_complete(record):
+    # True for a record of the index with every one of REQUIRED_FIELDS
+    return record is not None and all(record.get(field) for field in REQUIRED_FIELDS)
+
+
+class Checkpoint(object):
+    # status of every url handled so far, stored one JSON object per line in path
+    def __init__(self, path):
+        self.path = pathlib.Path(path)
+        self.done = set()
+        self.failed = {}
+        if self.path.exists():
+            with self.path.open('r') as in_file:
+                for line in in_file:
+                    entry = json.loads(line)
+                    if entry['status'] == 'done':
+                        self.done.add(entry['url'])
+                        self.failed.pop(entry['url'], None)
+                    else:
+                        self.failed[entry['url']] = entry['error']
+        self.out_file = self.path.open('a')
+
+    def record(self, url, status, error=None):
+        if status == 'done':
+            self.done.add(url)
+            self.failed.pop(url, None)
+        else:
+            self.failed[url] = error
+        self.out_file.write(json.dumps({'url': url, 'status': status, 'error': error}) + '\n')
+        self.out_file.flush()
+
+    def close(self):
+        self.out_file.close()
+
+
+def run(urls, output_csv, checkpoint_path=None, concurrency=8, per_host=2, retry_failed=False,
+        profile_slowest=0, parquet_dir=None, index_path=None):
+    '''
+    Appends a row to output_csv for every url in urls that isn't already done.
+
+    Parameters
+    urls : list of paper urls
+    output_csv : CSV file the rows are appended to, with the columns in COLUMNS
+    checkpoint_path : file recording the urls that are done or failed,
+        defaults to output_csv with '.checkpoint.jsonl' added. If it doesn't
+        exist yet, a new run is started and output_csv is overwritten
+    retry_failed : fetch urls that failed in an earlier run again
+    profile_slowest : write cProfile profiles of this many of the slowest urls
+        to <output_csv>.profiles/
+    parquet_dir : directory of the Parquet copy of the rows, defaults to
+        output_csv with its suffix changed to .parquet. Each run adds a part
+        file, and a new run removes the parts of the old one. Rows are written
+        to it in batches, so a process that is killed outright can lose its
+        last rows there, but not in output_csv
+    index_path : canonical.PaperIndex file of the records of papers already
+        fetched, defaults to output_csv with '.index.jsonl' added
+
+    Returns the Checkpoint, whose done and failed attributes hold the results.
+    A row is written before its url is marked as done, so a crash between the
+    two can leave a url in output_csv twice, but never drops it.
+    '''
+    output_csv = pathlib.Path(output_csv)
+    if checkpoint_path is None:
+        checkpoint_path = output_csv.with_name(output_csv.name + '.checkpoint.jsonl')
+    resuming = pathlib.Path(checkpoint_path).exists()
+    checkpoint = Checkpoint(checkpoint_path)
+
+    pending = [url for url in urls
+               if url not in checkpoint.done and (retry_failed or url not in checkpoint.failed)]
+
+    if index_path is None:
+        index_path = output_csv.with_name(output_csv.name + '.index.jsonl')
+    index = canonical.PaperIndex(index_path)
+    keys = {url: canonical.canonical_url(url) for url in pending}
+    #each paper that isn't in the index is fetched once, from the first of its urls that
+    #isn't a PDF, since the PDF has none of the fields. Papers keep the order their first
+    #url comes in, whichever url is fetched
+    first_urls = {}
+    for url in pending:
+        key = keys[url]
+        if is_complete(index.get(key)):
+            continue
+        if key not in first_urls or (canonical.is_pdf_url(first_urls[key]) and not canonical.is_pdf_url(url)):
+            first_urls[key] = url
+    to_fetch = list(first_urls.values())
+    print('%d urls done, %d failed earlier, %d to do, %d papers to fetch'
+          % (len(checkpoint.done), len(checkpoint.failed), len(pending), len(to_fetch)))
+
+    write_header = not resuming or not output_csv.exists() or output_csv.stat().st_size == 0
+    #rows are numbered like the index column DataFrame.to_csv writes
+    row_number = len(checkpoint.done)
+    instrumentation.metrics.reset()
+    instrumentation.metrics.profile_slowest = profile_slowest
+    if parquet_dir is None:
+        parquet_dir = columnar.alongside(output_csv)
+    part = columnar.new_part(parquet_dir, clear=not resuming)
+    with output_csv.open('a' if resuming else 'w', newline='') as out_file, \
+            columnar.ColumnarWriter(part, PARQUET_SCHEMA) as parquet_writer, \
+            fetching.Fetcher(concurrency=concurrency, per_host=per_host,
+                             cache=http_cache.default_cache) as batch_fetcher, \
+            pubmed.EUtils() as eutils:
+        writer = csv.writer(out_file)
+        if write_header:
+            writer.writerow([''] + COLUMNS)
+
+        results = get_paper_info.iter_paper_info(to_fetch, fetcher=batch_fetcher, eutils=eutils)
+        errors = {}
+        #records fetched in this run that are written out but not kept in the index
+        incomplete = {}
+        try:
+            for url in pending:
+                key = keys[url]
+                record = index.get(key)
+                if not is_complete(record):
+                    record = incomplete.get(key)
+                if record is None and key not in errors:
+                    #the url fetched for the first paper that isn't known yet is always the next result
+                    fetched_url, result = next(results)
+                    if isinstance(result, Exception):
+                        errors[key] = repr(result)
+                    else:
+                        record = dict(zip(FIELDS, result), url=fetched_url)
+                        if is_complete(record):
+                            index.set(key, record)
+                        else:
+                            incomplete[key] = record
+                if record is None:
+                    print('failed %s: %s' % (url, errors[key]), file=sys.stderr)
+                    checkpoint.record(url, 'failed', errors[key])
+                    continue
+                print(url)
+                values = [record[field] for field in FIELDS]
+                writer.writerow([row_number, url] + values)
+                out_file.flush()
+                parquet_writer.write([row_number, url] + values + [get_paper_info.which_journal(url)])
+                checkpoint.record(url, 'done')
+                row_number += 1
+        finally:
+            checkpoint.close()
+            instrumentation.metrics.export(output_csv)
+
+    return checkpoint
+
+
+if __name__ == "__main__":
+    import pandas as pd
+
+    parser = argparse.ArgumentParser(description='Fetch paper info for every URL in a CSV, resuming where the last run stopped')
+    parser.add_argument('input_csv', type=str, help='CSV file with a URL column, e.g. filtered_papers.csv')
+    parser.add_argument('output_csv', type=str, help='CSV file the results are appended to')
+    parser.add_argument('--checkpoint', type=str, default=None, help='checkpoint file, defaults to <output_csv>.checkpoint.jsonl')
+    parser.add_argument('--concurrency', type=int, default=8, help='number of pages to download at the same time')
+    parser.add_argument('--retry-failed', action='store_true', help='fetch urls that failed in an earlier run again')
+    parser.add_argument('--index', type=str, default=None,
+                        help='records of the papers already fetched, defaults to <output_csv>.index.jsonl')
+    parser.add_argument('--profile-slowest', type=int, default=0, metavar='N',
+                        help='profile every url and keep the profiles of the N slowest')
+    args = parser.parse_args()
+
+    urls = pd.read_csv(args.input_csv)['URL'].tolist()
+    run(urls, args.output_csv, args.checkpoint, concurrency=args.concurrency, retry_failed=args.retry_failed,
+        profile_slowest=args.profile_slowest, index_path=args.index)
@@ -0,0 +1,73 @@
+#Benchmark of clean_airtable.clean_multiple_urls on synthetic Airtable exports.
+#The rows are copies of airtable_papers.csv with unique titles and DOIs,
+#so nothing is removed as a duplicate. The original iterrows version is quadratic
+#and is only timed on the smaller exports
+#
+#Usage: python bench_clean.py [--sizes 2500 10000 100000 1000000] [--loop-max 10000]
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+import clean_airtable
+
+
+def clean_multiple_urls_loop(df):
+    # the original row by row version of clean_airtable.clean_multiple_urls
+    rows_lst = []
+    for index, row in df.iterrows():
+        rows_lst.append(list(row))
+        urls = row['Primary lit site'].split('\n')
+        if len(urls) >= 2:
+            rows_lst.remove(list(row))
+            for url in urls:
+                if len(url) > 2:
+                    data = [row['DOI'], row['Paper title'], row['Abstract'], row['Journal'], url,
+                            row['Functions Level I'], row['Functions Level II'], row['Functions Level III- NEW'],
+                            row['Functions Level III-OLD'], row['Link to press release']]
+                    rows_lst.append(data)
+    return pd.DataFrame(rows_lst).drop_duplicates()
+
+
+def synthetic_export(n_rows, source='airtable_papers.csv', seed=0):
+    # n_rows sampled from the real export, made unique by numbering every row
+    df = pd.read_csv(source)
+    df = df[df[clean_airtable.URL_COLUMN].notna()]
+    rows = np.random.default_rng(seed).integers(0, len(df), n_rows)
+    df = df.iloc[rows].reset_index(drop=True)
+
+    suffix = pd.Series(np.arange(n_rows)).astype(str)
+    df['Paper title'] = df['Paper title'].fillna('') + ' #' + suffix
+    df['DOI'] = '10.9999/' + suffix
+    df[clean_airtable.URL_COLUMN] = df[clean_airtable.URL_COLUMN] + '?row=' + suffix
+    return df
+
+
+def time_it(func, df):
+    start = time.perf_counter()
+    result = func(df)
+    return time.perf_counter() - start, len(result)
+
+
+def run(sizes=(2500, 10000, 100000, 1000000), loop_max=10000):
+    for n_rows in sizes:
+        df = synthetic_export(n_rows)
+        seconds, n_out = time_it(clean_airtable.clean_multiple_urls, df)
+        line = '%9d rows -> %9d  vectorized %7.3fs %11.0f rows/s' % (n_rows, n_out, seconds, n_rows / seconds)
+        if n_rows <= loop_max:
+            loop_seconds, loop_out = time_it(clean_multiple_urls_loop, df)
+            assert loop_out == n_out
+            line += '   iterrows %7.2fs  %6.0fx' % (loop_seconds, loop_seconds / seconds)
+        print(line)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark clean_airtable on synthetic exports')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[2500, 10000, 100000, 1000000],
+                        help='numbers of rows in the synthetic exports')
+    parser.add_argument('--loop-max', type=int, default=10000,
+                        help='largest export to time the original iterrows version on')
+    args = parser.parse_args()
+
+    run(args.sizes, args.loop_max)
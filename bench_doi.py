@@ -0,0 +1,58 @@
+#Benchmark of DOI extraction on the fixture pages in fixtures/pages.
+#Compares the regular expression scan in doi_extract.py with the two tree based
+#versions pull_doi used before it: BeautifulSoup with html.parser, and lxml
+#
+#Usage: python bench_doi.py [--repeat 20]
+import argparse
+
+from bs4 import BeautifulSoup
+
+import bench_parse
+import doi_extract
+import parsing
+
+
+def pull_doi_bs4(html):
+    # the original pull_doi: parse with BeautifulSoup and take the first doi.org link
+    soup = BeautifulSoup(html, 'html.parser')
+    for a in soup.find_all('a', href=True):
+        if 'doi.org' in a['href']:
+            return a['href'].split('doi.org/')[1]
+    return ''
+
+
+def pull_doi_lxml(html):
+    # the same search on an lxml tree
+    tree = parsing.parse_html(html)
+    for link in tree.xpath("//a[contains(@href, 'doi.org')]/@href"):
+        return link.split('doi.org/')[1]
+    return ''
+
+
+def run(repeat=20):
+    fixtures = bench_parse.load_fixtures()
+    pages = [html for _, _, html in fixtures]
+    raw_pages = [html.encode('utf-8') for html in pages]
+
+    results = {
+        'bs4 pull_doi': bench_parse.pages_per_second(pull_doi_bs4, pages, repeat),
+        'lxml pull_doi': bench_parse.pages_per_second(pull_doi_lxml, pages, repeat),
+        'doi_extract (str)': bench_parse.pages_per_second(doi_extract.best_doi, pages, repeat),
+        'doi_extract (bytes)': bench_parse.pages_per_second(doi_extract.best_doi, raw_pages, repeat),
+    }
+
+    baseline = results['bs4 pull_doi']
+    for name, rate in results.items():
+        print('%-20s %9.1f pages/s  %6.1fx' % (name, rate, rate / baseline))
+
+    for (publisher, _, _), html in zip(fixtures, pages):
+        print('%-9s bs4: %-42s doi_extract: %s' % (publisher, pull_doi_bs4(html), doi_extract.best_doi(html)))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark DOI extraction on the fixture pages')
+    parser.add_argument('--repeat', type=int, default=20, help='number of passes over the fixture pages')
+    args = parser.parse_args()
+
+    run(args.repeat)
@@ -0,0 +1,93 @@
+#Memory benchmark of iter_paper_info on a long list of urls, answered offline from
+#the synthetic fixture pages. Every url is a fixture url with its own ?bench=N query,
+#so each is downloaded, parsed and extracted again. Prints the resident memory
+#every --every urls and the peak at the end, which should stay flat however many
+#urls there are
+#
+#Usage: python bench_memory.py [--urls 100000] [--every 10000]
+import argparse
+import collections
+import itertools
+import os
+import re
+import resource
+
+import get_paper_info
+import replay
+import scheduler as scheduling
+
+#urls of the fixture pages get_paper_info can extract
+PUBLISHERS = set(get_paper_info.paper_info_classes)
+#the query making each url different. Links made from the url, e.g. <url>?bench=7.pdf, keep it
+BENCH_QUERY = re.compile(r'\?bench=\d+')
+#the replayed hosts answer at once, so they needn't be spread out
+RATE = 1e9
+
+
+class FixtureAdapter(replay.ReplayAdapter):
+    # answers a url from the fixtures with its ?bench=N query dropped
+    def __init__(self, manifest_path=replay.MANIFEST):
+        super(FixtureAdapter, self).__init__(manifest_path)
+        #only the last requests are kept, a list would grow with the run
+        self.requests_seen = collections.deque(maxlen=100)
+
+    def entry(self, url):
+        return super(FixtureAdapter, self).entry(BENCH_QUERY.sub('', url))
+
+
+def fixture_urls(manifest):
+    return [url for url in manifest if get_paper_info.which_journal(url) in PUBLISHERS]
+
+
+def bench_urls(base_urls, count):
+    # generator of count urls, so the list of urls itself takes no memory
+    for n, url in zip(range(count), itertools.cycle(base_urls)):
+        yield '%s?bench=%d' % (url, n)
+
+
+def rss_mb():
+    # resident memory of this process now, from /proc on Linux, else the peak so far
+    try:
+        with open('/proc/self/statm') as in_file:
+            return int(in_file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except OSError:
+        return peak_rss_mb()
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run(count=100000, every=10000, concurrency=8):
+    '''
+    Returns [(urls done, resident MB)] every every urls, and the peak resident MB.
+    '''
+    samples = []
+    with replay.replaying():
+        adapter = FixtureAdapter()
+        urls = bench_urls(fixture_urls(adapter.manifest), count)
+        with replay.replay_fetcher(adapter) as offline_fetcher:
+            offline_fetcher.concurrency = concurrency
+            offline_fetcher.scheduler = scheduling.Scheduler(max_concurrency=concurrency, rate=RATE)
+            done = 0
+            for url, result in get_paper_info.iter_paper_info(urls, fetcher=offline_fetcher):
+                if isinstance(result, Exception):
+                    raise result
+                done += 1
+                if done % every == 0:
+                    samples.append((done, rss_mb()))
+                    print('%8d urls  %7.1f MB' % samples[-1], flush=True)
+    peak = peak_rss_mb()
+    print('peak %.1f MB' % peak)
+    return samples, peak
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Measure memory of iter_paper_info over many urls')
+    parser.add_argument('--urls', type=int, default=100000, help='number of urls to run')
+    parser.add_argument('--every', type=int, default=10000, help='urls between memory readings')
+    parser.add_argument('--concurrency', type=int, default=8, help='pages downloaded at the same time')
+    args = parser.parse_args()
+
+    run(args.urls, args.every, args.concurrency)
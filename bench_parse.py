@@ -0,0 +1,68 @@
+#Benchmark of parsing and extracting the fixture pages in fixtures/pages.
+#Compares the old BeautifulSoup html.parser and BeautifulSoup lxml parses with
+#the lxml tree PaperInfo uses now, followed by PaperInfo.extract()
+#
+#Usage: python bench_parse.py [--repeat 20]
+import argparse
+import pathlib
+import time
+
+import pandas as pd
+from bs4 import BeautifulSoup
+
+import get_paper_info
+import parsing
+
+FIXTURES_DIR = pathlib.Path(__file__).parent / 'fixtures' / 'pages'
+
+#publishers in the same order as the rows of test_papers_jq.csv
+PUBLISHERS = ['pubmed', 'nature', 'jeb', 'pnas', 'springer', 'rsp']
+
+
+def load_fixtures():
+    # returns a list of (publisher, url, html) for every fixture page
+    df = pd.read_csv(pathlib.Path(__file__).parent / 'test_papers_jq.csv')
+    fixtures = []
+    for publisher, url in zip(PUBLISHERS, df['URL']):
+        html = (FIXTURES_DIR / (publisher + '.html')).read_text(encoding='utf-8')
+        fixtures.append((publisher, url, html))
+    return fixtures
+
+
+def pages_per_second(func, pages, repeat):
+    # run func on every page repeat times and return how many pages it handled per second
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for page in pages:
+            func(page)
+    return repeat * len(pages) / (time.perf_counter() - start)
+
+
+def extract(fixture):
+    publisher, url, html = fixture
+    return get_paper_info.paper_info_classes[publisher](url, html=html).extract()
+
+
+def run(repeat=20):
+    fixtures = load_fixtures()
+    pages = [html for _, _, html in fixtures]
+
+    results = {
+        'bs4 html.parser parse': pages_per_second(lambda html: BeautifulSoup(html, 'html.parser'), pages, repeat),
+        'bs4 lxml parse': pages_per_second(lambda html: BeautifulSoup(html, 'lxml'), pages, repeat),
+        'lxml parse': pages_per_second(parsing.parse_html, pages, repeat),
+        'lxml parse + extract': pages_per_second(extract, fixtures, repeat),
+    }
+
+    baseline = results['bs4 html.parser parse']
+    for name, rate in results.items():
+        print('%-24s %8.1f pages/s  %5.1fx' % (name, rate, rate / baseline))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark parsing of the fixture pages')
+    parser.add_argument('--repeat', type=int, default=20, help='number of passes over the fixture pages')
+    args = parser.parse_args()
+
+    run(args.repeat)
@@ -0,0 +1,124 @@
+#Benchmark suite on the synthetic fixture pages in fixtures/.
+#Reports pages per second for parsing each page, for every get_* extractor of
+#its publisher on the parsed page, for PaperInfo.extract() and for DOI extraction.
+#Results can be saved as a JSON baseline. A later run compared with the baseline
+#exits with status 1 when any benchmark got slower by more than the threshold.
+#Baselines depend on the machine, so save one before comparing on a new machine
+#
+#Usage:
+#   python bench_suite.py --save bench_baseline.json
+#   python bench_suite.py --compare bench_baseline.json [--threshold 0.2]
+import argparse
+import json
+import platform
+import sys
+import time
+
+import lxml
+
+import bench_parse
+import doi_extract
+import get_paper_info
+import parsing
+
+#each benchmark is run for at least MIN_TIME seconds per round, and the best of ROUNDS is kept
+MIN_TIME = 0.2
+ROUNDS = 5
+THRESHOLD = 0.2
+
+
+def calls_per_second(func, min_time=MIN_TIME, rounds=ROUNDS):
+    # best rate over several rounds, which is much steadier than the average
+    best = 0.0
+    for _ in range(rounds):
+        calls = 0
+        start = time.perf_counter()
+        while True:
+            func()
+            calls += 1
+            elapsed = time.perf_counter() - start
+            if elapsed >= min_time:
+                break
+        best = max(best, calls / elapsed)
+    return best
+
+
+def benchmarks():
+    # (name, function) of every benchmark, e.g. ('get_title/pnas', ...)
+    for publisher, url, html in bench_parse.load_fixtures():
+        paper = get_paper_info.paper_info_classes[publisher](url, html=html)
+        yield 'parse/%s' % publisher, lambda html=html: parsing.parse_html(html)
+        for field in paper.fields:
+            yield 'get_%s/%s' % (field, publisher), getattr(paper, 'get_' + field)
+        yield 'extract/%s' % publisher, paper.extract
+        yield 'doi_extract/%s' % publisher, lambda html=html: doi_extract.best_doi(html)
+
+
+def run(min_time=MIN_TIME, rounds=ROUNDS, only=None):
+    '''
+    Runs the benchmarks and returns {name: pages per second}.
+
+    Parameters
+    min_time : seconds each round of a benchmark runs for
+    rounds : rounds per benchmark, the fastest one counts
+    only : run only benchmarks whose name starts with this, e.g. 'get_title'
+    '''
+    results = {}
+    for name, func in benchmarks():
+        if only is None or name.startswith(only):
+            results[name] = calls_per_second(func, min_time, rounds)
+    return results
+
+
+def environment():
+    return {'python': platform.python_version(), 'lxml': lxml.__version__, 'machine': platform.machine()}
+
+
+def save(results, path):
+    with open(path, 'w') as out_file:
+        json.dump({'environment': environment(), 'results': results}, out_file, indent=2, sort_keys=True)
+        out_file.write('\n')
+
+
+def load(path):
+    with open(path) as in_file:
+        return json.load(in_file)['results']
+
+
+def compare(results, baseline, threshold=THRESHOLD):
+    '''
+    Returns a list of (name, baseline rate, new rate) for every benchmark in
+    both results and baseline that is slower by more than threshold (0.2 = 20%).
+    '''
+    return [(name, baseline[name], rate) for name, rate in sorted(results.items())
+            if name in baseline and rate < baseline[name] * (1 - threshold)]
+
+
+def report(results, baseline=None):
+    for name, rate in sorted(results.items()):
+        line = '%-28s %10.1f pages/s' % (name, rate)
+        if baseline and name in baseline:
+            line += '  %+6.1f%%' % (100 * (rate / baseline[name] - 1))
+        print(line)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark parsing and extraction on the fixture pages')
+    parser.add_argument('--save', metavar='JSON', help='save the results as a baseline')
+    parser.add_argument('--compare', metavar='JSON', help='compare with a saved baseline')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD,
+                        help='slowdown that counts as a regression, 0.2 = 20%%')
+    parser.add_argument('--only', help='only run benchmarks starting with this, e.g. get_title')
+    parser.add_argument('--min-time', type=float, default=MIN_TIME, help='seconds per round')
+    args = parser.parse_args()
+
+    results = run(args.min_time, only=args.only)
+    baseline = load(args.compare) if args.compare else None
+    report(results, baseline)
+    if args.save:
+        save(results, args.save)
+    if baseline:
+        regressions = compare(results, baseline, args.threshold)
+        for name, before, after in regressions:
+            print('REGRESSION %s: %.1f -> %.1f pages/s' % (name, before, after))
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,111 @@
+#A pool of headless Chrome browsers for the Selenium scrapers.
+#Each worker thread owns one browser and takes pages from a shared work queue,
+#so N browsers load N pages at the same time. The threads only wait on the
+#browser processes, which do the actual work, so threads are enough here.
+#Browsers are replaced after a set number of pages, or after an error, to keep
+#memory leaks and crashed tabs from building up over a long run
+import os
+import queue
+import threading
+
+
+def chrome_driver(path_to_driver=None, page_load_timeout=30):
+    '''
+    Starts a headless Chrome driven by chromedriver.
+
+    Parameters
+    path_to_driver : path to the chromedriver executable. Defaults to the
+        CHROMEDRIVER_PATH environment variable, or chromedriver on the PATH
+    page_load_timeout : seconds to wait for a page before driver.get raises
+    '''
+    from selenium import webdriver
+    from selenium.webdriver.chrome.service import Service
+
+    options = webdriver.ChromeOptions()
+    options.add_argument('--ignore-certificate-errors')
+    options.add_argument('--incognito')
+    options.add_argument('--headless')
+
+    path_to_driver = path_to_driver or os.environ.get('CHROMEDRIVER_PATH')
+    service = Service(path_to_driver) if path_to_driver else Service()
+    driver = webdriver.Chrome(service=service, options=options)
+    driver.set_page_load_timeout(page_load_timeout)
+    return driver
+
+
+class BrowserPool(object):
+    def __init__(self, size=None, driver_factory=None, pages_per_driver=50):
+        '''
+        Parameters
+        size : number of browsers running at the same time, defaults to the number of cores
+        driver_factory : function with no arguments returning a new driver,
+            defaults to chrome_driver
+        pages_per_driver : number of pages a browser loads before it is replaced
+        '''
+        self.size = size or os.cpu_count() or 1
+        self.driver_factory = driver_factory or chrome_driver
+        self.pages_per_driver = pages_per_driver
+
+    def map(self, func, items, return_exceptions=False):
+        '''
+        Calls func(driver, item) for every item, spread over the browsers in the pool.
+
+        Results come back in the same order as items. If return_exceptions is
+        True, an exception raised for an item is put in its place in the results,
+        otherwise the first one is raised once every item has been tried.
+        '''
+        items = list(items)
+        results = [None] * len(items)
+        work = queue.Queue()
+        for index, item in enumerate(items):
+            work.put((index, item))
+
+        workers = [threading.Thread(target=self.worker, args=(func, work, results))
+                   for _ in range(min(self.size, len(items)))]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        if not return_exceptions:
+            for result in results:
+                if isinstance(result, Exception):
+                    raise result
+        return results
+
+    def worker(self, func, work, results):
+        # take items off the work queue until it is empty, using one browser at a time
+        driver = None
+        pages = 0
+        try:
+            while True:
+                try:
+                    index, item = work.get_nowait()
+                except queue.Empty:
+                    return
+
+                if driver is not None and pages >= self.pages_per_driver:
+                    quit_quietly(driver)
+                    driver = None
+                try:
+                    if driver is None:
+                        driver = self.driver_factory()
+                        pages = 0
+                    results[index] = func(driver, item)
+                    pages += 1
+                except Exception as e:
+                    results[index] = e
+                    #a page that timed out or crashed can leave the browser unusable
+                    if driver is not None:
+                        quit_quietly(driver)
+                        driver = None
+        finally:
+            if driver is not None:
+                quit_quietly(driver)
+
+
+def quit_quietly(driver):
+    try:
+        driver.quit()
+    except Exception:
+        pass
@@ -0,0 +1,188 @@
+#Canonical keys for papers, so that every variant of a paper's URL is fetched only once.
+#The Airtable exports have the same paper under many URLs, e.g.
+#   http://www.pnas.org/content/103/15/5764.full?m
+#   https://www.pnas.org/content/103/15/5764
+#   https://pnas.org/content/103/15/5764.full.pdf
+#which all get the key 'pnas.org/content/103/15/5764'. URLs with a DOI in them,
+#like doi.org and Springer links, get 'doi:<doi>', and PubMed links 'pubmed:<pmid>'.
+#A PaperIndex stores the extracted record of each key in a JSON lines file, so a
+#paper seen in an earlier run isn't fetched again either
+import json
+import pathlib
+import re
+import threading
+from urllib.parse import parse_qsl, unquote, urlencode, urlsplit
+
+import doi_extract
+
+#query parameters that only say where a link was clicked, matched exactly, so that
+#parameters picking the article, like spage or page, are kept
+TRACKING_PARAMS = {'spMailingID', 'spUserID', 'spJobID', 'spReportId', 'origin', 'rss', 'proof', 'via',
+                   'cookieSet', 'fbclid', 'gclid'}
+#and the families of them, e.g. utm_source, WT.ec_id, mc_cid
+TRACKING_PREFIXES = ('utm_', 'WT.', 'mc_')
+#host prefixes that serve the same pages as the bare domain
+HOST_PREFIXES = ('www.', 'm.')
+#endings of the same article's other views, e.g. 5764.full.pdf, 5764.abstract, nature08943.pdf
+VIEW_SUFFIX = re.compile(r'(\.full|\.abstract|\.short|\.long|\.full\.pdf|\.pdf|\.epdf|\.html?|/full|/abstract|/pdf|/epdf)+$',
+                         re.IGNORECASE)
+#paths of the PDF of an article rather than its page, e.g. 5764.full.pdf or /doi/pdf/10.1098/rsif.2009.0203
+PDF_PATH = re.compile(r'(\.e?pdf|/e?pdf)/?$|/doi/e?pdf/', re.IGNORECASE)
+#the journal's code in the path of a HighWire PDF, e.g. /content/jexbio/203/23/3585.full.pdf
+HIGHWIRE_PDF = re.compile(r'^/content/[a-z]+/(\d+/)', re.IGNORECASE)
+#a DOI making up the end of the path, e.g. /article/10.1007/s10886-009-9707-4 or /doi/full/10.1098/rsif.2009.0203
+DOI_PATH = re.compile(r'/(?:article|chapter|doi(?:/(?:full|abs|pdf|epdf))?)/(10\.\d{4,9}/.+)$', re.IGNORECASE)
+DOI_HOSTS = {'doi.org', 'dx.doi.org'}
+PUBMED_PATH = {'pubmed.ncbi.nlm.nih.gov': re.compile(r'^/(\d+)$'), 'ncbi.nlm.nih.gov': re.compile(r'^/pubmed/(\d+)$')}
+
+
+def canonical_doi(doi):
+    # given a DOI, or a doi.org link, return it in lowercase without anything around it, None if there isn't one
+    doi = doi_extract.clean_doi(unquote(doi).encode('utf-8')) if doi else None
+    return doi_extract.doi_key(doi) if doi else None
+
+
+def is_pdf_url(url):
+    # True for a link to the PDF of an article, which has none of the fields its page has
+    return bool(PDF_PATH.search(urlsplit(url.strip()).path))
+
+
+def canonical_host(host):
+    host = host.lower().rstrip('.')
+    for prefix in HOST_PREFIXES:
+        if host.startswith(prefix):
+            return host[len(prefix):]
+    return host
+
+
+def is_tracking(name):
+    return name in TRACKING_PARAMS or name.startswith(TRACKING_PREFIXES)
+
+
+def canonical_query(query):
+    # the query without tracking parameters and flags without a value, sorted
+    params = [(name, value) for name, value in parse_qsl(query, keep_blank_values=True)
+              if value and not is_tracking(name)]
+    return urlencode(sorted(params))
+
+
+def canonical_url(url):
+    '''
+    Returns the key of the paper a url points to, the same for every variant
+    of the url, e.g. 'doi:10.1007/s10886-009-9707-4', 'pubmed:19113150' or
+    'pnas.org/content/103/15/5764'.
+
+    Parameters
+    url : url of the paper, with or without its scheme
+    '''
+    url = url.strip()
+    if '://' not in url:
+        url = 'https://' + url
+    parts = urlsplit(url)
+    host = canonical_host(parts.hostname or '')
+    path = unquote(parts.path).rstrip('/')
+
+    if host in DOI_HOSTS:
+        doi = canonical_doi(path.lstrip('/'))
+        if doi:
+            return 'doi:' + doi
+    if host in PUBMED_PATH:
+        match = PUBMED_PATH[host].match(path)
+        if match:
+            return 'pubmed:' + match.group(1)
+
+    path = VIEW_SUFFIX.sub('', path)
+    match = DOI_PATH.search(path)
+    if match:
+        doi = canonical_doi(match.group(1))
+        if doi:
+            return 'doi:' + doi
+    path = HIGHWIRE_PDF.sub(r'/content/\1', path)
+
+    query = canonical_query(parts.query)
+    return host + path + ('?' + query if query else '')
+
+
+def group_by_key(urls):
+    # {key: [urls with that key, in order]}, in the order each key was first seen
+    groups = {}
+    for url in urls:
+        groups.setdefault(canonical_url(url), []).append(url)
+    return groups
+
+
+def row_keys(url_cells):
+    '''
+    Returns a key for every row of an export without an id column, in order,
+    from its cell of urls: the canonical urls of the urls in the cell, one per
+    line, joined by a space. The second, third... row with the same key gets
+    '#2', '#3'... after it. pipeline.py and the change detection in
+    detecting_changes_in_airtable_downloads/ both key such exports with it, so
+    the ids in a changed_data.csv are the ids of the pipeline's rows.
+
+    Parameters
+    url_cells : the url column of the export, empty or missing cells give ''
+    '''
+    seen = {}
+    keys = []
+    for cell in url_cells:
+        urls = cell.split('\n') if isinstance(cell, str) else []
+        #blank lines between the urls of a cell, see clean_airtable.clean_multiple_urls
+        key = ' '.join(canonical_url(url) for url in urls if len(url.strip()) > 2)
+        seen[key] = seen.get(key, 0) + 1
+        keys.append(key if seen[key] == 1 else '%s#%d' % (key, seen[key]))
+    return keys
+
+
+class PaperIndex(object):
+    # record extracted for each canonical key, stored one JSON object per line in path.
+    # Only where each key's line starts is kept in memory, records are read back when asked for
+    def __init__(self, path):
+        self.path = pathlib.Path(path)
+        self._offsets = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        offsets = {}
+        if self.path.exists():
+            with self.path.open('rb') as in_file:
+                offset = 0
+                for line in in_file:
+                    offsets[json.loads(line)['key']] = offset
+                    offset += len(line)
+        return offsets
+
+    def offsets(self):
+        # called under the lock
+        if self._offsets is None:
+            self._offsets = self.load()
+        return self._offsets
+
+    def get(self, key):
+        with self._lock:
+            offset = self.offsets().get(key)
+            if offset is None:
+                return None
+            with self.path.open('rb') as in_file:
+                in_file.seek(offset)
+                return json.loads(in_file.readline())['record']
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self.offsets()
+
+    def __len__(self):
+        with self._lock:
+            return len(self.offsets())
+
+    def set(self, key, record):
+        '''
+        Stores the record of a key, e.g. {'url': ..., 'title': ..., 'doi': ...}.
+        A key stored again replaces the earlier record.
+        '''
+        line = (json.dumps({'key': key, 'record': record}) + '\n').encode('utf-8')
+        with self._lock:
+            offsets = self.offsets()
+            with self.path.open('ab') as out_file:
+                offsets[key] = out_file.tell()
+                out_file.write(line)
@@ -1,35 +1,55 @@
+#Cleans the CSV exported from Airtable: drops rows without a URL and gives every
+#URL in a multi-URL 'Primary lit site' cell its own row.
+#
+#Usage: python clean_airtable.py (reads airtable_papers.csv, writes cleaned_airtable.csv
+#and a columnar copy, cleaned_airtable.parquet, see columnar.py)
+import numpy as np
 import pandas as pd
-df = pd.read_csv('airtable_papers.csv')
-print(df.columns)
-#Dropping all rows without any URL
-df = df[df['Primary lit site'].notna()]
+
+import columnar
+
+URL_COLUMN = 'Primary lit site'
+
+#a paper appearing twice with the same DOI, title and URL is the same row,
+#even when the two copies were labelled differently
+KEY_COLUMNS = ['DOI', 'Paper title', URL_COLUMN]
+
 
 #Cleaning function
-def clean_multiple_urls(df):
-    rows_lst = []
-    for index, row in df.iterrows():
-        rows_lst.append(list(row))
-        #Retrieving list of URLS, and only operating if it has multiple
-        urls = row['Primary lit site'].split('\n')
-    
-        if len(urls) >= 2:
-            rows_lst.remove(list(row))
-            #If it has multiple URLS, drop that row for now
-            #df = df.drop(index=index)
-            #Create new row for each URL with same data in all other columns
-            for url in urls:
-                if len(url) > 2:
-                    data = [row['DOI'], row['Paper title'], row['Abstract'], row['Journal'], url,
-                    row['Functions Level I'], row['Functions Level II'], row['Functions Level III- NEW'],
-                    row['Functions Level III-OLD'], row['Link to press release']
-                    ]
-                    #Append new rows to dataframe
-                    rows_lst.append(data)
-    return pd.DataFrame(rows_lst).drop_duplicates()
-
-df = clean_multiple_urls(df)
-
-#Resetting index
-df = df.reset_index()
-#Outputting to clean csv
-df.to_csv('cleaned_airtable.csv')
\ No newline at end of file
+def clean_multiple_urls(df, url_column=URL_COLUMN, key_columns=KEY_COLUMNS):
+    '''
+    Splits cells of `url_column` holding several URLs, one per line, into one
+    row per URL, copying every other column. Pieces of 2 characters or less
+    (blank lines) are dropped. Rows are then deduplicated on the key columns,
+    keeping the first. The index of each row is the index of the row it came from.
+
+    Parameters
+    df : DataFrame from the Airtable export, with no missing URLs
+    url_column : name of the column holding the URLs
+    key_columns : columns identifying a row, those missing from df are ignored
+    '''
+    urls = df[url_column].str.split('\n')
+    counts = urls.str.len().to_numpy()
+
+    #explode keeps rows in order, with the pieces of each cell next to each other
+    exploded = df.assign(**{url_column: urls}).explode(url_column)
+    from_multiple = np.repeat(counts >= 2, counts)
+    keep = ~from_multiple | (exploded[url_column].str.len() > 2).to_numpy()
+
+    key_columns = [column for column in key_columns if column in df.columns]
+    return exploded[keep].drop_duplicates(key_columns or None)
+
+
+if __name__ == '__main__':
+    df = pd.read_csv('airtable_papers.csv')
+    print(df.columns)
+    #Dropping all rows without any URL
+    df = df[df[URL_COLUMN].notna()]
+
+    df = clean_multiple_urls(df)
+
+    #Resetting index
+    df = df.reset_index()
+    #Outputting to clean csv
+    df.to_csv('cleaned_airtable.csv')
+    columnar.write_frame(df, 'cleaned_airtable.parquet')
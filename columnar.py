@@ -0,0 +1,227 @@
+#Columnar copies of the CSV outputs, in Parquet or Arrow IPC.
+#A ColumnarWriter appends rows in record batches as they arrive, so the whole
+#table never has to be in memory. Publisher and journal columns are dictionary
+#encoded (each distinct name is stored once) and, in Parquet, abstracts are
+#compressed with zstd. read_columns loads only the columns asked for and reads
+#CSV files too, so a reader can be given either. Arrow IPC files are written
+#uncompressed and memory-mapped, so the columns that aren't asked for are never read.
+#The format is picked from the suffix: .parquet, or .arrow/.feather for Arrow IPC.
+#A directory is read as a Parquet dataset made of every part-*.parquet file in it
+import pathlib
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+#columns stored as dictionaries and the compression of every other column, matched case-insensitively
+DICTIONARY_COLUMNS = {'publisher', 'journal'}
+COMPRESSED_COLUMNS = {'abstract': 'zstd'}
+DEFAULT_COMPRESSION = 'snappy'
+BATCH_SIZE = 1000
+ARROW_SUFFIXES = {'.arrow', '.feather'}
+
+
+def is_dictionary(name):
+    return name.lower() in DICTIONARY_COLUMNS
+
+
+def column_type(name, value_type=None):
+    # Arrow type of a column, strings unless value_type says otherwise
+    if is_dictionary(name):
+        return pa.dictionary(pa.int32(), pa.string())
+    return value_type or pa.string()
+
+
+def make_schema(columns, types=None):
+    '''
+    Parameters
+    columns : names of the columns, in order
+    types : column name -> Arrow type for the columns that aren't strings,
+            e.g. {'is_open_access': pa.bool_()}
+    '''
+    types = types or {}
+    return pa.schema([(name, column_type(name, types.get(name))) for name in columns])
+
+
+def is_arrow(path):
+    return pathlib.Path(path).suffix.lower() in ARROW_SUFFIXES
+
+
+class ColumnarWriter(object):
+    def __init__(self, path, schema, batch_size=BATCH_SIZE):
+        '''
+        Writes rows to a Parquet or Arrow IPC file, batch_size rows at a time.
+
+        Parameters
+        path : file to write, .parquet, .arrow or .feather
+        schema : pyarrow schema of the rows, see make_schema
+        batch_size : rows held in memory before they are written
+        '''
+        self.path = pathlib.Path(path)
+        self.schema = schema
+        self.batch_size = batch_size
+        self.rows = []
+        #value -> code of every dictionary column. Codes are given out in the order values
+        #are first seen, so each batch's dictionary only adds to the one before it, which
+        #is all an Arrow IPC file allows
+        self.dictionaries = {field.name: {} for field in schema if pa.types.is_dictionary(field.type)}
+        if is_arrow(self.path):
+            self.sink = pa.OSFile(str(self.path), 'wb')
+            #uncompressed, so a reader can use the mapped file's pages as they are, see read_table
+            options = pa.ipc.IpcWriteOptions(compression=None, emit_dictionary_deltas=True)
+            self.writer = pa.ipc.new_file(self.sink, schema, options=options)
+        else:
+            self.sink = None
+            self.writer = pq.ParquetWriter(
+                str(self.path), schema,
+                compression={name: COMPRESSED_COLUMNS.get(name.lower(), DEFAULT_COMPRESSION)
+                             for name in schema.names},
+                use_dictionary=[name for name in schema.names if is_dictionary(name)])
+
+    def write(self, row):
+        # row is a sequence of values in the order of the schema
+        self.rows.append(row)
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def write_table(self, table):
+        # a whole pyarrow Table with the writer's columns, e.g. from pa.Table.from_pandas
+        self.flush()
+        arrays = [self.array(table.column(field.name).to_pylist(), field) if field.name in self.dictionaries
+                  else table.column(field.name).cast(field.type) for field in self.schema]
+        self.writer.write_table(pa.Table.from_arrays(arrays, schema=self.schema))
+
+    def flush(self):
+        if not self.rows:
+            return
+        columns = list(zip(*self.rows))
+        arrays = [self.array(values, field) for values, field in zip(columns, self.schema)]
+        self.writer.write_table(pa.Table.from_arrays(arrays, schema=self.schema))
+        self.rows = []
+
+    def array(self, values, field):
+        if field.name not in self.dictionaries:
+            return pa.array(values, field.type)
+        codes = self.dictionaries[field.name]
+        indices = [None if value is None else codes.setdefault(value, len(codes)) for value in values]
+        return pa.DictionaryArray.from_arrays(pa.array(indices, field.type.index_type),
+                                              pa.array(list(codes), field.type.value_type))
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+        if self.sink is not None:
+            self.sink.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def as_text(column):
+    # an object column with every value that isn't missing turned into a string
+    return column.map(lambda value: None if value is None or value is pd.NA
+                      or (isinstance(value, float) and value != value) else str(value))
+
+
+def write_frame(df, path, batch_size=BATCH_SIZE * 10):
+    '''
+    Writes a DataFrame to Parquet or Arrow IPC, batch_size rows at a time,
+    with every object column stored as strings. An object column holding
+    values of several types, e.g. numbers and text, is written as text.
+
+    Parameters
+    df : DataFrame to write, its index is dropped
+    path : file to write, .parquet, .arrow or .feather
+    '''
+    df = df.set_axis([str(name) for name in df.columns], axis=1)
+    try:
+        inferred = pa.Schema.from_pandas(df, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        #Arrow has no type for a column of mixed values, so those columns become text
+        mixed = {}
+        for name in df.columns:
+            if df[name].dtype == object:
+                try:
+                    pa.array(df[name], from_pandas=True)
+                except (pa.ArrowInvalid, pa.ArrowTypeError):
+                    mixed[name] = as_text(df[name])
+        df = df.assign(**mixed)
+        inferred = pa.Schema.from_pandas(df, preserve_index=False)
+    #columns inferred as text, or empty, are strings, and any others keep their type
+    types = {field.name: field.type for field in inferred
+             if not (pa.types.is_string(field.type) or pa.types.is_large_string(field.type)
+                     or pa.types.is_null(field.type))}
+    with ColumnarWriter(path, make_schema(df.columns, types)) as writer:
+        for start in range(0, len(df), batch_size):
+            writer.write_table(pa.Table.from_pandas(df.iloc[start:start + batch_size], preserve_index=False))
+
+
+def alongside(csv_path, suffix='.parquet'):
+    # path of the columnar copy of a CSV file, e.g. cleaned_airtable.parquet for cleaned_airtable.csv
+    return pathlib.Path(csv_path).with_suffix(suffix)
+
+
+def new_part(directory, clear=False):
+    '''
+    Returns the path of the next part-*.parquet file in a dataset directory,
+    creating the directory. With clear, the parts already there are removed.
+    '''
+    directory = pathlib.Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    parts = sorted(directory.glob('part-*.parquet'))
+    if clear:
+        for part in parts:
+            part.unlink()
+        parts = []
+    return directory / ('part-%05d.parquet' % len(parts))
+
+
+def read_table(path, columns=None):
+    # the columns of a Parquet file, dataset directory or Arrow IPC file as a pyarrow Table
+    path = pathlib.Path(path)
+    if path.is_dir():
+        return pq.ParquetDataset(sorted(str(part) for part in path.glob('part-*.parquet'))).read(columns=columns)
+    if is_arrow(path):
+        #the batches point into the mapped file, and only the columns asked for are
+        #kept, so the pages of the others are never read
+        reader = pa.ipc.open_file(pa.memory_map(str(path), 'r'))
+        batches = [reader.get_batch(i) for i in range(reader.num_record_batches)]
+        schema = reader.schema
+        if columns is not None:
+            batches = [batch.select(columns) for batch in batches]
+            schema = pa.schema([schema.field(name) for name in columns])
+        return pa.Table.from_batches(batches, schema)
+    return pq.read_table(str(path), columns=columns, memory_map=True)
+
+
+def read_columns(path, columns=None):
+    '''
+    Returns a DataFrame with only the given columns of a file.
+
+    Parameters
+    path : .parquet or .arrow/.feather file, directory of Parquet parts, or CSV file
+    columns : names of the columns to read, None for all of them
+    '''
+    path = pathlib.Path(path)
+    if path.suffix.lower() == '.csv':
+        df = pd.read_csv(path, usecols=columns)
+        return df[columns] if columns is not None else df
+    return read_table(path, columns).to_pandas()
+
+
+def iter_batches(path, columns=None, batch_size=BATCH_SIZE * 10):
+    # DataFrames of at most batch_size rows, for readers that don't need the whole table at once
+    path = pathlib.Path(path)
+    if path.suffix.lower() == '.csv':
+        for df in pd.read_csv(path, usecols=columns, chunksize=batch_size):
+            yield df[columns] if columns is not None else df
+        return
+    if path.is_dir() or is_arrow(path):
+        for batch in read_table(path, columns).to_batches(batch_size):
+            yield batch.to_pandas()
+        return
+    for batch in pq.ParquetFile(str(path), memory_map=True).iter_batches(batch_size, columns=columns):
+        yield batch.to_pandas()
@@ -0,0 +1,38 @@
+#Compacts `ops_log` so `detect_changes.py` doesn't have to read old lines again.
+#By default the whole log is moved into a gzip compressed segment in
+#`ops_log_segments/` and a checkpoint of the latest state is written, so the
+#full audit trail is kept. With `--checkpoint-only` the log is left as it is
+#and only a new checkpoint is written
+#
+#Usage:
+#   python compact_log.py [--log ops_log] [--checkpoint-only]
+
+import argparse
+import pathlib
+
+import ops_log_index
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(description="Checkpoint and rotate the ops log")
+    parser.add_argument("--log", default="ops_log", help="path of the ops log")
+    parser.add_argument("--checkpoint-only", action="store_true",
+                        help="write a checkpoint without rotating the log")
+    return parser.parse_args(args)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if not pathlib.Path(args.log).exists():
+        raise RuntimeError("No ops log at %s" % args.log)
+
+    if args.checkpoint_only:
+        latest, tail_lines = ops_log_index.load_latest(args.log)
+        ops_log_index.write_checkpoint(args.log, latest)
+        print("Checkpointed %d ids after reading %d log lines" % (len(latest), tail_lines))
+    else:
+        segment_path = ops_log_index.rotate(args.log)
+        if segment_path is None:
+            print("%s is empty, nothing to move" % args.log)
+        else:
+            print("Moved %s to %s" % (args.log, segment_path))
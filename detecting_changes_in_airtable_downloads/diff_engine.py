@@ -0,0 +1,109 @@
+#Vectorized comparison of a snapshot with the `ops_log`, used by `detect_changes.py`.
+#Both sides are loaded into typed pandas columns, sorted by id and joined with a
+#binary search, so created, updated and deleted rows are all found with array
+#operations instead of a Python loop over every id
+
+import numpy as np
+import pandas as pd
+
+SNAPSHOT_COLUMNS = ["id", "journal_title", "author", "last_mod"]
+OPS_LOG_COLUMNS = SNAPSHOT_COLUMNS + ["rev", "operation"]
+
+#last_mod is parsed into datetime64 while reading and written back the way
+#str(datetime) writes it. Floats are read and written with full precision,
+#the same as Python's float() and str()
+DTYPES = {
+    "id": "int64",
+    "journal_title": "float64",
+    "author": "float64",
+    "last_mod": "datetime64[us]",
+    "rev": "int64",
+    "operation": "object",
+}
+READ_OPTIONS = {"parse_dates": ["last_mod"], "date_format": "ISO8601", "float_precision": "round_trip"}
+
+
+def read_snapshot(path):
+    #read a snapshot CSV into typed columns, sorted by id
+    df = pd.read_csv(path, dtype={column: DTYPES[column] for column in SNAPSHOT_COLUMNS if column != "last_mod"},
+                     **READ_OPTIONS)
+    return df[SNAPSHOT_COLUMNS].sort_values("id", kind="stable", ignore_index=True)
+
+
+def read_ops_log(path):
+    #read every line of the headerless ops log into typed columns, in the order written
+    try:
+        df = pd.read_csv(path, header=None, names=OPS_LOG_COLUMNS,
+                         dtype={column: dtype for column, dtype in DTYPES.items() if column != "last_mod"},
+                         **READ_OPTIONS)
+    except pd.errors.EmptyDataError:
+        df = pd.DataFrame({column: pd.Series(dtype=DTYPES[column]) for column in OPS_LOG_COLUMNS})
+    if df.empty:
+        #reading from the end of a file doesn't raise EmptyDataError, but leaves the
+        #dates unparsed
+        df = df.astype(DTYPES)
+    return df
+
+
+def latest_revisions(ops_log):
+    #because `id` isn't unique in the log, keep only the last line for each `id`,
+    #which holds its latest revision
+    latest = ops_log.drop_duplicates("id", keep="last")
+    return latest.sort_values("id", kind="stable", ignore_index=True)
+
+
+def diff(snapshot, latest):
+    '''
+    Compares a snapshot with the latest revision of every id in the log.
+
+    Parameters
+    snapshot : DataFrame from read_snapshot
+    latest : DataFrame from latest_revisions
+
+    Returns a DataFrame with the columns in OPS_LOG_COLUMNS holding the
+    created rows, then the deleted rows, then the updated rows, each sorted by id
+    '''
+    snapshot_ids = snapshot["id"].to_numpy()
+    log_ids = latest["id"].to_numpy()
+
+    #sorted merge join: where each snapshot id would go in the sorted log ids
+    position = np.searchsorted(log_ids, snapshot_ids)
+    if len(log_ids):
+        clipped = np.minimum(position, len(log_ids) - 1)
+        in_log = log_ids[clipped] == snapshot_ids
+    else:
+        clipped = position
+        in_log = np.zeros(len(snapshot_ids), dtype=bool)
+
+    #ids from the snapshot that aren't in the log, new rows of data are always rev 1
+    created = snapshot.loc[~in_log, SNAPSHOT_COLUMNS].assign(rev=1, operation="created")
+
+    #ids that are both in the log and snapshot, updated if the snapshot is newer
+    matched = clipped[in_log]
+    newer = snapshot["last_mod"].to_numpy()[in_log] > latest["last_mod"].to_numpy()[matched]
+    updated = snapshot.loc[in_log, SNAPSHOT_COLUMNS][newer].assign(
+        rev=latest["rev"].to_numpy()[matched][newer] + 1, operation="updated")
+
+    #ids from the log that aren't in the snapshot, deleted unless the log already says so
+    in_snapshot = np.zeros(len(log_ids), dtype=bool)
+    in_snapshot[matched] = True
+    gone = ~in_snapshot & (latest["operation"].to_numpy() != "deleted")
+    deleted = latest.loc[gone, SNAPSHOT_COLUMNS].assign(rev=latest["rev"].to_numpy()[gone] + 1, operation="deleted")
+
+    changes = pd.concat([created, deleted, updated], ignore_index=True)
+    return changes.astype({"rev": "int64"})[OPS_LOG_COLUMNS]
+
+
+def write_changes(changes, changed_data_path, ops_log_path):
+    #overwrite `changed_data.csv` with the latest changes and append them to `ops_log`,
+    #each in a single write. `changed_data.csv` keeps its original layout: the
+    #snapshot header, then rows with the operation but not the rev
+    changes = changes.assign(last_mod=changes["last_mod"].map(str))
+    with open(changed_data_path, "w") as out_file:
+        out_file.write(",".join(SNAPSHOT_COLUMNS) + "\n")
+        changes.drop(columns="rev").to_csv(out_file, header=False, index=False, lineterminator="\n",
+                                           float_format=str)
+
+    if len(changes):
+        with open(ops_log_path, "a") as ops_file:
+            changes.to_csv(ops_file, header=False, index=False, lineterminator="\n", float_format=str)
@@ -0,0 +1,180 @@
+#Finds the rows that changed between two snapshots of any CSV export, whatever
+#its columns, e.g. `airtable_papers.csv`. `diff_engine.py` only knows the
+#four columns of `source-data.csv` and only sees an update when `last_mod` is
+#newer, so it misses edits that don't touch the timestamp.
+#
+#Here every value is read as text and normalized (no surrounding whitespace,
+#runs of whitespace as one space, empty for missing) and each row gets a 64-bit
+#fingerprint of its values from `pd.util.hash_pandas_object`, computed on
+#BATCH_ROWS rows at a time. The two snapshots are joined on id and only rows
+#whose fingerprints differ have their values compared, to name the columns that
+#changed. Comparing wide exports with long abstracts so costs little more than
+#hashing them.
+#
+#Changes are written in the layout of `changed_data.csv`: a header, then a row
+#for every changed id with the operation after the other values
+#   id,changed_columns
+#   12,Abstract;Journal,updated
+#
+#Rows are joined on the id column. An export without one, like `airtable_papers.csv`,
+#needs its url column, e.g. "Primary lit site", and each row's id is then the
+#canonical urls of the row, see `canonical.row_keys` in the directory above. These
+#are the ids ../pipeline.py gives the rows, so it can read the changes. The row
+#number isn't used: a row inserted or removed would shift every row after it and
+#show them all as updated.
+#
+#Usage:
+#   python fingerprint_diff.py old.csv new.csv [--id-column id] [--output changed_data.csv]
+#   python fingerprint_diff.py old.csv new.csv --url-column "Primary lit site"
+#   python fingerprint_diff.py --store snapshots     (the two latest snapshots in the store)
+
+import argparse
+import io
+import sys
+
+import numpy as np
+import pandas as pd
+
+import snapshot_store
+from snapshot_store import canonical
+
+ID_COLUMN = "id"
+#rows hashed at a time, which bounds the temporary arrays of hash_pandas_object
+BATCH_ROWS = 100_000
+CHANGES_COLUMNS = ["id", "changed_columns"]
+#separates the names of the changed columns of a row
+SEPARATOR = ";"
+
+
+def read_export(path, id_column=ID_COLUMN, url_column=None):
+    '''
+    Reads a CSV export into normalized text columns indexed by id. An export
+    without the id column is indexed by the canonical urls in url_column, see
+    canonical.row_keys, and raises ValueError if there is none.
+
+    Parameters
+    path : path or open text file of the CSV export, which may start with a BOM
+    id_column : column identifying a row
+    url_column : column of the urls identifying a row when there is no id column.
+        It is compared like the others, so a row whose urls change is
+        deleted and created again
+    '''
+    df = pd.read_csv(path, dtype=str, keep_default_na=False, encoding="utf-8-sig")
+    if id_column in df.columns:
+        ids = df.pop(id_column).str.strip()
+    elif url_column:
+        if url_column not in df.columns:
+            raise ValueError("%s has no %s column" % (path, url_column))
+        ids = pd.Series(canonical.row_keys(df[url_column]))
+    else:
+        raise ValueError("%s has no %s column, give the column of the urls identifying a row, "
+                         "e.g. --url-column \"Primary lit site\"" % (path, id_column))
+    df = normalize(df)
+    df.index = pd.Index(ids.to_numpy(), name=ID_COLUMN)
+    if not df.index.is_unique:
+        raise ValueError("%s has repeated ids in column %s" % (path, id_column))
+    return df
+
+
+def normalize(df):
+    #values with whitespace differences that a reader wouldn't see removed
+    return df.apply(lambda column: column.str.replace(r"\s+", " ", regex=True).str.strip())
+
+
+def fingerprint(df):
+    #64-bit fingerprint of every row of normalized text columns, in the order of the columns
+    hashes = np.empty(len(df), dtype=np.uint64)
+    for start in range(0, len(df), BATCH_ROWS):
+        batch = df.iloc[start:start + BATCH_ROWS]
+        hashes[start:start + len(batch)] = pd.util.hash_pandas_object(batch, index=False).to_numpy()
+    return hashes
+
+
+def diff(old, new):
+    '''
+    Compares two exports from read_export.
+
+    Returns a DataFrame with the columns id, changed_columns and operation
+    holding the created rows, then the deleted rows, then the updated rows, in
+    the order of the snapshot they are in. changed_columns names the columns
+    that differ, joined by SEPARATOR, and is empty for created and deleted rows.
+    A column only one of the snapshots has counts as empty in the other.
+    '''
+    columns = sorted(set(old.columns) | set(new.columns))
+    old = old.reindex(columns=columns, fill_value="")
+    new = new.reindex(columns=columns, fill_value="")
+
+    #where each new id is in the old snapshot, -1 if it isn't
+    position = old.index.get_indexer(new.index)
+    in_old = position >= 0
+    in_new = np.zeros(len(old), dtype=bool)
+    in_new[position[in_old]] = True
+
+    #only ids in both snapshots are hashed, a created or deleted row is known without it
+    differs = fingerprint(old.iloc[position[in_old]]) != fingerprint(new[in_old])
+    updated_old = old.iloc[position[in_old][differs]]
+    updated_new = new[in_old][differs]
+    changed = updated_old.to_numpy() != updated_new.to_numpy()
+    names = np.array(columns, dtype=object)
+
+    created = pd.DataFrame({"id": new.index[~in_old], "changed_columns": "", "operation": "created"})
+    deleted = pd.DataFrame({"id": old.index[~in_new], "changed_columns": "", "operation": "deleted"})
+    updated = pd.DataFrame({"id": updated_new.index,
+                            "changed_columns": [SEPARATOR.join(names[row]) for row in changed],
+                            "operation": "updated"})
+    return pd.concat([created, deleted, updated], ignore_index=True)
+
+
+def write_changes(changes, changed_data):
+    #overwrite `changed_data.csv`, a path or an open text file, with the changes.
+    #The header leaves out the operation like diff_engine.write_changes, so pipeline.py reads either
+    if not hasattr(changed_data, "write"):
+        with open(changed_data, "w", newline="") as out_file:
+            return write_changes(changes, out_file)
+    changed_data.write(",".join(CHANGES_COLUMNS) + "\n")
+    changes.to_csv(changed_data, header=False, index=False, lineterminator="\n")
+
+
+def diff_store(store, id_column=None, url_column=None):
+    '''
+    Compares the two latest snapshots of a snapshot_store.SnapshotStore, or
+    the only one with an empty export if there is just one. Rows are
+    identified like the store does unless id_column or url_column is given.
+    '''
+    id_column = id_column or store.manifest["id_column"]
+    url_column = url_column or store.url_column
+    new = read_export(io.StringIO(store.rebuild(-1)), id_column, url_column)
+    if len(store.names) > 1:
+        old = read_export(io.StringIO(store.rebuild(-2)), id_column, url_column)
+    else:
+        old = new.iloc[:0]
+    return diff(old, new)
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(description="Find the rows and columns that changed between two CSV exports")
+    parser.add_argument("old", nargs="?", help="CSV export before the changes")
+    parser.add_argument("new", nargs="?", help="CSV export after the changes")
+    parser.add_argument("--store", default=None, help="compare the two latest snapshots in this snapshot store instead")
+    parser.add_argument("--id-column", default=None,
+                        help="column identifying a row. Defaults to id, or to the id column of the store")
+    parser.add_argument("--url-column", default=None,
+                        help="column of the urls identifying a row, for exports without an id column. "
+                             "Defaults to the url column of the store")
+    parser.add_argument("--output", default="changed_data.csv", help="CSV file the changes are written to, - for standard output")
+    args = parser.parse_args(args)
+    if not args.store and not (args.old and args.new):
+        parser.error("give the old and new CSV exports, or --store")
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.store:
+        changes = diff_store(snapshot_store.SnapshotStore(args.store), args.id_column, args.url_column)
+    else:
+        id_column = args.id_column or ID_COLUMN
+        changes = diff(read_export(args.old, id_column, args.url_column),
+                       read_export(args.new, id_column, args.url_column))
+    write_changes(changes, sys.stdout if args.output == "-" else args.output)
+    print(changes["operation"].value_counts().to_string() if len(changes) else "No changes", file=sys.stderr)
@@ -0,0 +1,212 @@
+#Checkpoints of the latest revision of every id in `ops_log`, so `detect_changes.py`
+#doesn't have to replay the whole log on every run.
+#
+#A checkpoint is two files next to the log:
+#   ops_log.checkpoint.npy - NumPy structured array holding the latest
+#                            (id, journal_title, author, last_mod, rev, operation)
+#                            of every id, sorted by id. It is memory-mapped when read
+#   ops_log.checkpoint.json - how many bytes of `ops_log` the array covers, and
+#                             which rotated log segments came before it
+#Only the lines of `ops_log` written after the checkpoint have to be read.
+#Old lines can be moved out of `ops_log` into compressed segments with
+#`compact_log.py`, which keeps the full audit trail in `ops_log_segments/`.
+#Without a usable checkpoint the state is rebuilt from every segment in that
+#directory plus the live log
+
+import gzip
+import io
+import json
+import os
+import pathlib
+import shutil
+
+import numpy as np
+import pandas as pd
+
+import diff_engine
+
+OPERATIONS = ["created", "updated", "deleted"]
+
+CHECKPOINT_DTYPE = np.dtype([
+    ("id", "<i8"),
+    ("journal_title", "<f8"),
+    ("author", "<f8"),
+    ("last_mod", "<M8[us]"),
+    ("rev", "<i8"),
+    ("operation", "u1"),
+])
+
+#write a new checkpoint once this many log lines have been added since the last one
+CHECKPOINT_EVERY = 100000
+
+
+def checkpoint_paths(log_path):
+    log_path = pathlib.Path(log_path)
+    return (log_path.with_name(log_path.name + ".checkpoint.npy"),
+            log_path.with_name(log_path.name + ".checkpoint.json"))
+
+
+def read_checkpoint_info(log_path):
+    #returns the checkpoint's metadata, or None if there is no usable checkpoint
+    array_path, info_path = checkpoint_paths(log_path)
+    if not array_path.exists() or not info_path.exists():
+        return None
+    info = json.loads(info_path.read_text())
+    #the log was replaced or cut short since the checkpoint, so it can't be trusted
+    log_size = pathlib.Path(log_path).stat().st_size if pathlib.Path(log_path).exists() else 0
+    if info["log_offset"] > log_size:
+        return None
+    return info
+
+
+def to_frame(array):
+    #convert a checkpoint array into the DataFrame layout of diff_engine.latest_revisions
+    df = pd.DataFrame({name: array[name] for name in CHECKPOINT_DTYPE.names if name != "operation"})
+    df["operation"] = np.array(OPERATIONS, dtype=object)[array["operation"]]
+    return df[diff_engine.OPS_LOG_COLUMNS]
+
+
+def to_array(latest):
+    array = np.empty(len(latest), dtype=CHECKPOINT_DTYPE)
+    for name in CHECKPOINT_DTYPE.names:
+        if name == "operation":
+            array[name] = pd.Categorical(latest["operation"], categories=OPERATIONS).codes
+        else:
+            array[name] = latest[name].to_numpy()
+    return array
+
+
+def read_tail(log_path, offset):
+    #read the lines of the log after the first `offset` bytes
+    with open(log_path, "rb") as in_file:
+        in_file.seek(offset)
+        return diff_engine.read_ops_log(in_file)
+
+
+def load_latest(log_path):
+    '''
+    Returns the latest revision of every id in the log, like
+    diff_engine.latest_revisions(history(log_path)), and the number of log
+    lines that had to be read after the checkpoint, or in all if there was
+    no usable checkpoint.
+    '''
+    info = read_checkpoint_info(log_path)
+    if info is None:
+        ops_log = history(log_path)
+        return diff_engine.latest_revisions(ops_log), len(ops_log)
+
+    array = np.load(checkpoint_paths(log_path)[0], mmap_mode="r")
+    tail = read_tail(log_path, info["log_offset"])
+    latest = pd.concat([to_frame(array), tail], ignore_index=True)
+    return diff_engine.latest_revisions(latest), len(tail)
+
+
+def write_checkpoint(log_path, latest, segments=None, log_offset=None):
+    #save `latest` as the state of the first `log_offset` bytes of the log,
+    #by default everything currently in it
+    array_path, info_path = checkpoint_paths(log_path)
+    if segments is None:
+        segments = [path.name for path in segment_paths(log_path)]
+    if log_offset is None:
+        log_offset = pathlib.Path(log_path).stat().st_size
+    info = {
+        "log_offset": log_offset,
+        "ids": len(latest),
+        "segments": segments,
+    }
+
+    #write to temporary files first so a crash never leaves half a checkpoint
+    tmp_array_path = array_path.with_name(array_path.name + ".tmp.npy")
+    np.save(tmp_array_path, to_array(latest))
+    os.replace(tmp_array_path, array_path)
+    tmp_info_path = info_path.with_name(info_path.name + ".tmp")
+    tmp_info_path.write_text(json.dumps(info))
+    os.replace(tmp_info_path, info_path)
+
+
+def update_checkpoint(log_path, latest, changes, tail_lines):
+    #after `changes` were appended to the log, checkpoint the new state if the
+    #log has grown by CHECKPOINT_EVERY lines since the last checkpoint
+    if tail_lines + len(changes) < CHECKPOINT_EVERY:
+        return False
+    latest = diff_engine.latest_revisions(pd.concat([latest, changes], ignore_index=True))
+    write_checkpoint(log_path, latest)
+    return True
+
+
+def segments_dir(log_path):
+    log_path = pathlib.Path(log_path)
+    return log_path.with_name(log_path.name + "_segments")
+
+
+def segment_paths(log_path):
+    #the rotated segments of the log in the order they were written. The directory
+    #is the record of them, so they are found even without a checkpoint
+    log_path = pathlib.Path(log_path)
+    return sorted(segments_dir(log_path).glob("%s.[0-9]*.gz" % log_path.name))
+
+
+def copied_prefix(log_path, segments=None, chunk_size=1024 * 1024):
+    #bytes at the start of the log that are already the whole of the last segment.
+    #That only happens when `rotate` stopped after writing the segment and before
+    #emptying the log, and those bytes must not be read or rotated twice
+    segments = segment_paths(log_path) if segments is None else segments
+    if not segments or not pathlib.Path(log_path).exists():
+        return 0
+    copied = 0
+    with gzip.open(segments[-1], "rb") as segment_file, open(log_path, "rb") as log_file:
+        while True:
+            segment_chunk = segment_file.read(chunk_size)
+            if not segment_chunk:
+                return copied
+            if log_file.read(len(segment_chunk)) != segment_chunk:
+                return 0
+            copied += len(segment_chunk)
+
+
+def rotate(log_path):
+    '''
+    Moves everything in the log into a new gzip compressed segment in
+    `<log>_segments/`, checkpoints the state at that point and starts an
+    empty log. Returns the path of the new segment, or of the last one if
+    there was nothing new to move.
+
+    Running it again after it stopped part way doesn't copy any line twice:
+    lines already in the last segment are left out of the new one.
+    '''
+    log_path = pathlib.Path(log_path)
+    latest, _ = load_latest(log_path)
+    segments = segment_paths(log_path)
+    offset = copied_prefix(log_path, segments)
+
+    directory = segments_dir(log_path)
+    directory.mkdir(exist_ok=True)
+    if log_path.stat().st_size > offset:
+        number = int(segments[-1].name.split(".")[-2]) + 1 if segments else 1
+        segment_path = directory / ("%s.%06d.gz" % (log_path.name, number))
+        #the segment only appears under its name once it is complete
+        tmp_path = segment_path.with_name(segment_path.name + ".tmp")
+        with open(log_path, "rb") as in_file, gzip.open(tmp_path, "wb") as out_file:
+            in_file.seek(offset)
+            shutil.copyfileobj(in_file, out_file)
+        os.replace(tmp_path, segment_path)
+        segments.append(segment_path)
+
+    #the checkpoint for the empty log is written before the log is emptied. If the
+    #run stops in between, the log still starts with the last segment, which
+    #copied_prefix skips
+    write_checkpoint(log_path, latest, [path.name for path in segments], log_offset=0)
+    open(log_path, "w").close()
+    return segments[-1] if segments else None
+
+
+def history(log_path):
+    #every line ever written to the log, from the rotated segments and then the live log
+    parts = []
+    segments = segment_paths(log_path)
+    for segment in segments:
+        with gzip.open(segment, "rb") as in_file:
+            parts.append(diff_engine.read_ops_log(in_file))
+    if pathlib.Path(log_path).exists():
+        parts.append(read_tail(log_path, copied_prefix(log_path, segments)))
+    return pd.concat(parts, ignore_index=True) if parts else diff_engine.read_ops_log(io.StringIO(""))
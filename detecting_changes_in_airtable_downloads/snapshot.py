@@ -1,12 +1,21 @@
-#copies data from `source-data.csv` to
-#to a new csv file, to simulate taking a 
-#snapshot of data from a different system
-#new file is named `snapshot_<ISO-8601>`
-
-import shutil
-import datetime
-
-timestamp = datetime.datetime.now()
-timestamp = timestamp.strftime("%Y-%m-%d_%H-%M-%S")
-filename = f"snapshot_{timestamp}.csv"
-shutil.copy("source-data.csv", filename)
\ No newline at end of file
+#stores the data in `source-data.csv` as a new snapshot,
+#to simulate taking a snapshot of data from a different system
+#snapshot is named `snapshot_<ISO-8601>` and kept in the `snapshots/`
+#store as the rows changed since the last snapshot, see `snapshot_store.py`.
+#`python snapshot.py --copy` copies the file to `snapshot_<ISO-8601>.csv`
+#the way snapshots used to be taken
+
+import shutil
+import sys
+import datetime
+
+import snapshot_store
+
+timestamp = datetime.datetime.now()
+timestamp = timestamp.strftime("%Y-%m-%d_%H-%M-%S")
+name = f"snapshot_{timestamp}"
+if "--copy" in sys.argv[1:]:
+    shutil.copy("source-data.csv", f"{name}.csv")
+else:
+    entry = snapshot_store.SnapshotStore().add("source-data.csv", name)
+    print(f"Stored {name} as {entry['file']}")
@@ -0,0 +1,322 @@
+#Keeps every snapshot of `source-data.csv` as one full base plus a compressed
+#delta per snapshot, instead of a full copy each time, so the store grows with
+#the rows that change rather than with the size of the table.
+#
+#The store is a directory, `snapshots/` by default, holding
+#   manifest.json          - the id column or url column, and for every snapshot in
+#                            order its name, file, header and row count
+#   base_000000.csv.gz     - the first snapshot in full. A snapshot whose header
+#                            differs from the one before is stored in full as well
+#   delta_000001.csv.gz    - the rows of a snapshot that changed since the one before:
+#                            "+" and the row for a created or updated id, "-" and the
+#                            id for a deleted one, and "=" and every id in order if the
+#                            rows were reordered. In a store with a url column the
+#                            id is written between the "+" and the row
+#   hashes.json            - a 64-bit hash of every row of the latest snapshot by id,
+#                            so a new snapshot is compared without reading the old one
+#`rebuild` gives back any snapshot, and `iter_delta` streams the changes between
+#any two snapshots while only holding the rows of the ids that changed.
+#
+#An export without an id column, like `airtable_papers.csv`, needs the column of
+#its urls instead, e.g. `--url-column "Primary lit site"`. A row's id is then
+#the canonical urls of the row, see `canonical.row_keys` in the directory above,
+#which is how ../pipeline.py keys the export's rows too. It doesn't change when
+#other rows are added, removed or moved. The row number would.
+#
+#Usage:
+#   python snapshot_store.py add source-data.csv [--name snapshot_2020-12-30_15-49-24]
+#   python snapshot_store.py --store airtable add ../airtable_papers.csv --url-column "Primary lit site"
+#   python snapshot_store.py list
+#   python snapshot_store.py rebuild snapshot_2020-12-30_15-49-24 out.csv
+#   python snapshot_store.py delta snapshot_2020-12-30_15-49-24 snapshot_2021-01-06_15-49-24
+
+import argparse
+import csv
+import gzip
+import hashlib
+import io
+import json
+import os
+import pathlib
+import sys
+
+#canonical.py of the scrapers, one directory up, keys exports without an id column
+sys.path.append(str(pathlib.Path(__file__).resolve().parent.parent))
+import canonical
+
+STORE_DIR = "snapshots"
+ID_COLUMN = "id"
+UPSERT, DELETE, ORDER = "+", "-", "="
+
+
+def row_hash(row):
+    #64-bit hash of a row's values, which can't collide by shifting text between fields
+    digest = hashlib.blake2b("\x1f".join(row).encode("utf-8"), digest_size=8)
+    return int.from_bytes(digest.digest(), "little")
+
+
+def read_rows(path):
+    #header and rows of a CSV file, each row a list of strings. Airtable exports start with a BOM
+    with open(path, newline="", encoding="utf-8-sig") as in_file:
+        reader = csv.reader(in_file)
+        header = next(reader, [])
+        return header, [row for row in reader if row]
+
+
+def write_gzip_csv(path, rows):
+    #write rows to a gzip compressed CSV, through a temporary file so a crash leaves no half file
+    tmp_path = path.with_name(path.name + ".tmp")
+    with gzip.open(tmp_path, "wt", newline="") as out_file:
+        csv.writer(out_file, lineterminator="\n").writerows(rows)
+    os.replace(tmp_path, path)
+
+
+def read_gzip_csv(path):
+    with gzip.open(path, "rt", newline="") as in_file:
+        yield from csv.reader(in_file)
+
+
+def write_json(path, value):
+    tmp_path = path.with_name(path.name + ".tmp")
+    tmp_path.write_text(json.dumps(value))
+    os.replace(tmp_path, path)
+
+
+class SnapshotStore(object):
+    def __init__(self, directory=STORE_DIR, id_column=ID_COLUMN, url_column=None):
+        '''
+        Parameters
+        directory : directory of the store, created by the first `add`
+        id_column : column identifying a row, only used when the store is created
+        url_column : column of the urls identifying a row, for exports without
+            an id column, see `canonical.row_keys`. Only used when the store is created
+        '''
+        self.directory = pathlib.Path(directory)
+        self.manifest_path = self.directory / "manifest.json"
+        if self.manifest_path.exists():
+            self.manifest = json.loads(self.manifest_path.read_text())
+        else:
+            self.manifest = {"id_column": id_column, "url_column": url_column, "snapshots": []}
+
+    @property
+    def url_column(self):
+        #stores made before url columns existed have none
+        return self.manifest.get("url_column")
+
+    @property
+    def names(self):
+        return [snapshot["name"] for snapshot in self.manifest["snapshots"]]
+
+    def position(self, name):
+        #index of a snapshot in the store, by name or by index
+        if isinstance(name, int):
+            return range(len(self.names))[name]
+        try:
+            return self.names.index(name)
+        except ValueError:
+            raise KeyError("No snapshot called %s in %s" % (name, self.directory))
+
+    def id_index(self, header):
+        if self.manifest["id_column"] not in header:
+            raise ValueError("No %s column in %s, a store of an export without one needs its url column, "
+                             "e.g. --url-column \"Primary lit site\"" % (self.manifest["id_column"], header))
+        return header.index(self.manifest["id_column"])
+
+    def row_ids(self, header, rows):
+        #id of every row of a snapshot, from the id column or the url column
+        if not self.url_column:
+            id_index = self.id_index(header)
+            return [row[id_index] for row in rows]
+        if self.url_column not in header:
+            raise ValueError("No %s column in %s" % (self.url_column, header))
+        url_index = header.index(self.url_column)
+        return canonical.row_keys(row[url_index] for row in rows)
+
+    def upsert(self, header, line):
+        #(id, row) of a "+" line of a delta
+        if self.url_column:
+            return line[1], line[2:]
+        return line[1 + self.id_index(header)], line[1:]
+
+    def load_hashes(self):
+        return json.loads((self.directory / "hashes.json").read_text()) if self.manifest["snapshots"] else {}
+
+    def add(self, csv_path, name=None):
+        '''
+        Stores the CSV file as the newest snapshot and returns its manifest entry.
+        Only the rows that changed since the last snapshot are written, unless
+        it is the first snapshot or its header changed.
+
+        Parameters
+        csv_path : CSV file with a header and the id column or url column
+        name : name of the snapshot, defaults to the name of the file without its suffix
+        '''
+        name = name or pathlib.Path(csv_path).stem
+        if name in self.names:
+            raise ValueError("There already is a snapshot called %s" % name)
+        header, rows = read_rows(csv_path)
+        ids = self.row_ids(header, rows)
+        hashes = {id_: row_hash(row) for id_, row in zip(ids, rows)}
+        if len(hashes) != len(rows):
+            raise ValueError("%s has repeated ids in %s" % (csv_path, self.url_column or self.manifest["id_column"]))
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        snapshots = self.manifest["snapshots"]
+        number = len(snapshots)
+        entry = {"name": name, "header": header, "rows": len(rows)}
+        if not snapshots or snapshots[-1]["header"] != header:
+            entry["file"] = "base_%06d.csv.gz" % number
+            write_gzip_csv(self.directory / entry["file"], [header] + rows)
+        else:
+            old_hashes = self.load_hashes()
+            upserts = [(id_, row) for id_, row in zip(ids, rows) if old_hashes.get(id_) != hashes[id_]]
+            deletes = [id_ for id_ in old_hashes if id_ not in hashes]
+            #an id from the urls is worked out from the rows before it, so it is written with the row
+            lines = [[UPSERT] + ([id_] if self.url_column else []) + row for id_, row in upserts]
+            lines += [[DELETE, id_] for id_ in deletes]
+            #rows keep their order from one snapshot to the next, new ids at the end.
+            #Only when the file has them in another order is the order stored too
+            if ids != [id_ for id_ in old_hashes if id_ in hashes] + [id_ for id_ in hashes if id_ not in old_hashes]:
+                lines.append([ORDER] + ids)
+            entry.update(file="delta_%06d.csv.gz" % number, upserts=len(upserts), deletes=len(deletes))
+            write_gzip_csv(self.directory / entry["file"], lines)
+
+        #hashes in the order of the rows, which `add` relies on to spot reordering
+        write_json(self.directory / "hashes.json", hashes)
+        snapshots.append(entry)
+        write_json(self.manifest_path, self.manifest)
+        return entry
+
+    def replay(self, position, ids=None):
+        '''
+        Returns (header, {id: row}) of the snapshot at position, rows in the
+        order of the snapshot, by applying the deltas after its base.
+
+        Parameters
+        position : index of the snapshot
+        ids : only keep the rows of these ids, so the result stays small
+        '''
+        snapshots = self.manifest["snapshots"]
+        start = max(i for i in range(position + 1) if snapshots[i]["file"].startswith("base_"))
+        rows = {}
+        header = snapshots[start]["header"]
+        for i in range(start, position + 1):
+            lines = read_gzip_csv(self.directory / snapshots[i]["file"])
+            if i == start:
+                next(lines)
+                base = list(lines)
+                rows = {id_: row for id_, row in zip(self.row_ids(header, base), base) if ids is None or id_ in ids}
+                continue
+            for line in lines:
+                if line[0] == UPSERT:
+                    id_, row = self.upsert(header, line)
+                    if ids is None or id_ in ids:
+                        rows[id_] = row
+                elif line[0] == DELETE:
+                    rows.pop(line[1], None)
+                elif ids is None:
+                    rows = {id_: rows[id_] for id_ in line[1:]}
+        return header, rows
+
+    def rebuild(self, name, out_file=None):
+        '''
+        Rebuilds a snapshot. Returns its CSV text, or writes it to out_file, a
+        path or an open text file, and returns None.
+        '''
+        header, rows = self.replay(self.position(name))
+        if out_file is None:
+            buffer = io.StringIO()
+            self.write_csv(buffer, header, rows.values())
+            return buffer.getvalue()
+        if hasattr(out_file, "write"):
+            self.write_csv(out_file, header, rows.values())
+        else:
+            with open(out_file, "w", newline="") as text_file:
+                self.write_csv(text_file, header, rows.values())
+        return None
+
+    @staticmethod
+    def write_csv(text_file, header, rows):
+        writer = csv.writer(text_file, lineterminator="\n")
+        writer.writerow(header)
+        writer.writerows(rows)
+
+    def changed_ids(self, first, last):
+        #ids touched by any delta after snapshot `first` up to snapshot `last`, None if a base is among them
+        ids = {}
+        for snapshot in self.manifest["snapshots"][first + 1:last + 1]:
+            if snapshot["file"].startswith("base_"):
+                return None
+            header = snapshot["header"]
+            for line in read_gzip_csv(self.directory / snapshot["file"]):
+                if line[0] == UPSERT:
+                    ids[self.upsert(header, line)[0]] = None
+                elif line[0] == DELETE:
+                    ids[line[1]] = None
+        return ids
+
+    def iter_delta(self, old, new):
+        '''
+        Yields (id, operation, row) for every id that differs between two
+        snapshots: "created" and "updated" with the row in `new`, "deleted"
+        with the row in `old`. Either may be the later one. Only the rows of
+        the ids changed in between are held in memory.
+
+        Parameters
+        old, new : names or indexes of the snapshots
+        '''
+        old, new = self.position(old), self.position(new)
+        ids = self.changed_ids(min(old, new), max(old, new))
+        if ids is not None and not ids:
+            return
+        _, old_rows = self.replay(old, ids)
+        _, new_rows = self.replay(new, ids)
+        for id_ in (ids if ids is not None else dict.fromkeys(list(old_rows) + list(new_rows))):
+            old_row, new_row = old_rows.get(id_), new_rows.get(id_)
+            if old_row is None and new_row is not None:
+                yield id_, "created", new_row
+            elif new_row is None and old_row is not None:
+                yield id_, "deleted", old_row
+            elif old_row != new_row:
+                yield id_, "updated", new_row
+
+    def disk_usage(self):
+        #bytes taken by the store
+        return sum(path.stat().st_size for path in self.directory.iterdir())
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(description="Keep snapshots of a CSV file as a base plus compressed deltas")
+    parser.add_argument("--store", default=STORE_DIR, help="directory of the snapshot store")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    add_parser = subparsers.add_parser("add", help="store a CSV file as the newest snapshot")
+    add_parser.add_argument("csv")
+    add_parser.add_argument("--name", default=None, help="name of the snapshot, defaults to the file name")
+    add_parser.add_argument("--id-column", default=ID_COLUMN, help="column identifying a row")
+    add_parser.add_argument("--url-column", default=None,
+                            help="column of the urls identifying a row, for exports without an id column")
+    subparsers.add_parser("list", help="show the stored snapshots")
+    rebuild_parser = subparsers.add_parser("rebuild", help="write a stored snapshot to a CSV file")
+    rebuild_parser.add_argument("name")
+    rebuild_parser.add_argument("out", help="CSV file to write, - for standard output")
+    delta_parser = subparsers.add_parser("delta", help="print the rows that changed between two snapshots")
+    delta_parser.add_argument("old")
+    delta_parser.add_argument("new")
+    return parser.parse_args(args)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.command == "add":
+        entry = SnapshotStore(args.store, args.id_column, args.url_column).add(args.csv, args.name)
+        print("Stored %s as %s" % (entry["name"], entry["file"]))
+    elif args.command == "list":
+        for entry in SnapshotStore(args.store).manifest["snapshots"]:
+            print("%-40s %-22s %8d rows %8s upserts %8s deletes"
+                  % (entry["name"], entry["file"], entry["rows"], entry.get("upserts", "-"), entry.get("deletes", "-")))
+    elif args.command == "rebuild":
+        SnapshotStore(args.store).rebuild(args.name, sys.stdout if args.out == "-" else args.out)
+    else:
+        writer = csv.writer(sys.stdout, lineterminator="\n")
+        for id_, operation, row in SnapshotStore(args.store).iter_delta(args.old, args.new):
+            writer.writerow(row + [operation])
@@ -0,0 +1,78 @@
+import pathlib
+import tempfile
+import unittest
+
+import diff_engine
+
+SNAPSHOT = """id,journal_title,author,last_mod
+1,0.27502931836911926,0.025010755222666936,2020-06-05 00:28:59.994370
+2,0.5,0.25,2020-12-01 10:00:00
+4,0.75,0.125,2020-03-01 09:00:00
+5,0.1,0.2,2020-04-01 00:00:00
+"""
+
+OPS_LOG = """1,0.27502931836911926,0.025010755222666936,2020-06-05 00:28:59.994370,1,created
+2,0.5,0.5,2020-02-01 10:00:00,1,created
+3,0.3,0.3,2020-02-01 10:00:00,1,created
+6,0.6,0.6,2020-02-01 10:00:00,1,created
+6,0.6,0.6,2020-02-01 10:00:00,2,deleted
+"""
+
+
+class TestDiffEngine(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.dir = pathlib.Path(self.tmp_dir.name)
+        (self.dir / "snapshot.csv").write_text(SNAPSHOT)
+        (self.dir / "ops_log").write_text(OPS_LOG)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def changes(self):
+        snapshot = diff_engine.read_snapshot(self.dir / "snapshot.csv")
+        latest = diff_engine.latest_revisions(diff_engine.read_ops_log(self.dir / "ops_log"))
+        return diff_engine.diff(snapshot, latest)
+
+    def test_diff(self):
+        changes = self.changes()
+        self.assertEqual([(4, 1, "created"), (5, 1, "created"), (3, 2, "deleted"), (2, 2, "updated")],
+                         list(zip(changes["id"], changes["rev"], changes["operation"])))
+        #updated rows take their values from the snapshot
+        self.assertEqual(0.25, changes.loc[changes["id"] == 2, "author"].item())
+
+    def test_empty_log(self):
+        (self.dir / "ops_log").write_text("")
+        changes = self.changes()
+        self.assertEqual([1, 2, 4, 5], changes["id"].tolist())
+        self.assertTrue((changes["operation"] == "created").all())
+
+    def test_write_changes(self):
+        changes = self.changes()
+        diff_engine.write_changes(changes, self.dir / "changed_data.csv", self.dir / "ops_log")
+
+        self.assertEqual(
+            "id,journal_title,author,last_mod\n"
+            "4,0.75,0.125,2020-03-01 09:00:00,created\n"
+            "5,0.1,0.2,2020-04-01 00:00:00,created\n"
+            "3,0.3,0.3,2020-02-01 10:00:00,deleted\n"
+            "2,0.5,0.25,2020-12-01 10:00:00,updated\n",
+            (self.dir / "changed_data.csv").read_text())
+        self.assertTrue((self.dir / "ops_log").read_text().endswith(
+            "6,0.6,0.6,2020-02-01 10:00:00,2,deleted\n"
+            "4,0.75,0.125,2020-03-01 09:00:00,1,created\n"
+            "5,0.1,0.2,2020-04-01 00:00:00,1,created\n"
+            "3,0.3,0.3,2020-02-01 10:00:00,2,deleted\n"
+            "2,0.5,0.25,2020-12-01 10:00:00,2,updated\n"))
+
+        #running again finds nothing new
+        self.assertEqual(0, len(self.changes()))
+
+    def test_full_precision(self):
+        diff_engine.write_changes(self.changes(), self.dir / "changed_data.csv", self.dir / "ops_log")
+        latest = diff_engine.latest_revisions(diff_engine.read_ops_log(self.dir / "ops_log"))
+        self.assertEqual(0.27502931836911926, latest.loc[latest["id"] == 1, "journal_title"].item())
+
+
+if __name__ == "__main__":
+    unittest.main()
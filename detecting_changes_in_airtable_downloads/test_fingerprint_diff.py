@@ -0,0 +1,142 @@
+import csv
+import io
+import pathlib
+import tempfile
+import unittest
+import unittest.mock
+
+import fingerprint_diff
+import snapshot_store
+
+#exports from Airtable start with a BOM
+OLD = """\ufeffid,DOI,Paper title,Abstract
+rec1,10.1/a,Geckos,"Setae stick
+to walls."
+rec2,10.1/b,Lotus,Leaves stay clean.
+rec3,10.1/c,Shark skin,Denticles cut drag.
+"""
+#rec1 only changes whitespace, rec2 changes its abstract and title, rec3 is deleted and rec4 created
+NEW = """id,DOI,Paper title,Abstract
+rec4,10.1/d,Kingfisher,Beak shape.
+rec2,10.1/b,Lotus leaf,Leaves stay very clean.
+rec1,10.1/a,Geckos ,Setae  stick to walls.
+"""
+
+
+AIRTABLE = pathlib.Path(__file__).resolve().parent.parent / "airtable_papers.csv"
+AIRTABLE_URLS = "Primary lit site"
+
+
+def read(text, id_column="id"):
+    return fingerprint_diff.read_export(io.StringIO(text), id_column)
+
+
+def operations(changes):
+    return {id_: (operation, columns) for id_, columns, operation in changes.itertuples(index=False)}
+
+
+class TestFingerprintDiff(unittest.TestCase):
+    def test_diff(self):
+        changes = fingerprint_diff.diff(read(OLD), read(NEW))
+        self.assertEqual(["created", "deleted", "updated"], list(changes["operation"]))
+        self.assertEqual({"rec4": ("created", ""), "rec3": ("deleted", ""),
+                          "rec2": ("updated", "Abstract;Paper title")}, operations(changes))
+        self.assertTrue(fingerprint_diff.diff(read(NEW), read(NEW)).empty)
+
+    def test_fingerprint(self):
+        old, new = read(OLD), read(NEW)
+        self.assertEqual(fingerprint_diff.fingerprint(old.loc[["rec1"]]), fingerprint_diff.fingerprint(new.loc[["rec1"]]))
+        self.assertNotEqual(fingerprint_diff.fingerprint(old.loc[["rec2"]]), fingerprint_diff.fingerprint(new.loc[["rec2"]]))
+        #values moved between columns give another fingerprint
+        swapped = old.loc[["rec1"]].rename(columns={"DOI": "Paper title", "Paper title": "DOI"})[old.columns]
+        self.assertNotEqual(fingerprint_diff.fingerprint(old.loc[["rec1"]]), fingerprint_diff.fingerprint(swapped))
+
+    def test_batches(self):
+        rows = "".join("rec%d,10.1/%d,Title %d,Abstract %d\n" % (i, i, i % 7, i) for i in range(250))
+        old = read("id,DOI,Paper title,Abstract\n" + rows)
+        new = old.copy()
+        new.iloc[[3, 120, 249], 2] = "Changed"
+        with unittest.mock.patch.object(fingerprint_diff, "BATCH_ROWS", 100):
+            self.assertEqual(list(fingerprint_diff.fingerprint(old)[:100]), list(fingerprint_diff.fingerprint(old.iloc[:100])))
+            changes = fingerprint_diff.diff(old, new)
+        self.assertEqual({"rec3": ("updated", "Abstract"), "rec120": ("updated", "Abstract"),
+                          "rec249": ("updated", "Abstract")}, operations(changes))
+
+    def test_schema_change(self):
+        #a new empty column changes no row, a new column with values changes the rows that have them
+        new = NEW.replace("Abstract\n", "Abstract,Journal\n").replace("Beak shape.\n", "Beak shape.,\n") \
+            .replace("very clean.\n", "very clean.,\n").replace("to walls.\n", "to walls.,Nature\n")
+        changes = fingerprint_diff.diff(read(NEW), read(new))
+        self.assertEqual({"rec1": ("updated", "Journal")}, operations(changes))
+
+    def test_url_column(self):
+        #without an id column the rows are keyed on their canonical urls, never on the row number
+        old = ("Paper title,URL,Abstract\nGeckos,https://www.g.org/1,Setae.\n"
+               "Lotus,\"http://l.org/2.full\nhttps://l.org/3\",Leaves.\nLotus,https://l.org/2/,Leaves.\n")
+        with self.assertRaises(ValueError):
+            read(old)
+        self.assertEqual(["g.org/1", "l.org/2 l.org/3", "l.org/2"],
+                         list(fingerprint_diff.read_export(io.StringIO(old), url_column="URL").index))
+        #a row inserted at the top, a row removed and another edited
+        new = ("Paper title,URL,Abstract\nShark,https://s.org/4,Skin.\nGeckos,https://www.g.org/1,Setae.\n"
+               "Lotus,https://l.org/2,Clean leaves.\n")
+        changes = fingerprint_diff.diff(fingerprint_diff.read_export(io.StringIO(old), url_column="URL"),
+                                        fingerprint_diff.read_export(io.StringIO(new), url_column="URL"))
+        self.assertEqual({"s.org/4": ("created", ""), "l.org/2 l.org/3": ("deleted", ""),
+                          "l.org/2": ("updated", "Abstract;URL")}, operations(changes))
+        with self.assertRaises(ValueError):
+            fingerprint_diff.read_export(io.StringIO(old), url_column="DOI")
+        with self.assertRaises(ValueError):
+            read("id,Abstract\nrec1,a\nrec1,b\n")
+
+    def test_airtable_export(self):
+        #the real export has no id column, and one row inserted and one deleted change only those two
+        lines = AIRTABLE.read_text(encoding="utf-8-sig").splitlines(keepends=True)
+        rows = list(csv.reader(lines))
+        edited = rows[:50] + [["", "Inserted paper", "", "", "https://example.org/inserted"] + [""] * 5] \
+            + rows[50:100] + rows[101:]
+        buffer = io.StringIO()
+        csv.writer(buffer, lineterminator="\n").writerows(edited)
+        old = fingerprint_diff.read_export(AIRTABLE, url_column=AIRTABLE_URLS)
+        new = fingerprint_diff.read_export(io.StringIO(buffer.getvalue()), url_column=AIRTABLE_URLS)
+        self.assertEqual(len(rows) - 1, len(old))
+        changes = fingerprint_diff.diff(old, new)
+        self.assertEqual(["created", "deleted"], list(changes["operation"]))
+        self.assertEqual(old.index[99], changes["id"][1])
+        self.assertEqual("example.org/inserted", changes["id"][0])
+
+        #the same through a snapshot store, as detect_changes.py --fingerprint does
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            directory = pathlib.Path(tmp_dir)
+            store = snapshot_store.SnapshotStore(directory / "snapshots", url_column=AIRTABLE_URLS)
+            store.add(AIRTABLE, "old")
+            (directory / "export.csv").write_text(buffer.getvalue())
+            #a store opened again keeps its url column
+            store = snapshot_store.SnapshotStore(directory / "snapshots")
+            entry = store.add(directory / "export.csv", "new")
+            self.assertEqual((1, 1), (entry["upserts"], entry["deletes"]))
+            self.assertEqual(edited, list(csv.reader(io.StringIO(store.rebuild("new")))))
+            self.assertEqual(rows, list(csv.reader(io.StringIO(store.rebuild("old")))))
+            changes = fingerprint_diff.diff_store(store)
+            self.assertEqual(["created", "deleted"], list(changes["operation"]))
+            with self.assertRaises(ValueError):
+                snapshot_store.SnapshotStore(directory / "plain").add(AIRTABLE, "old")
+
+    def test_store_and_changed_data(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            directory = pathlib.Path(tmp_dir)
+            store = snapshot_store.SnapshotStore(directory / "snapshots")
+            for name, text in [("old", OLD), ("new", NEW)]:
+                (directory / "export.csv").write_text(text.lstrip("\ufeff"))
+                store.add(directory / "export.csv", name)
+            changes = fingerprint_diff.diff_store(store)
+            self.assertEqual({"rec4": "created", "rec3": "deleted", "rec2": "updated"},
+                             {id_: operation for id_, (operation, _) in operations(changes).items()})
+            #the header, then the id first and the operation last, as pipeline.py reads them
+            fingerprint_diff.write_changes(changes, directory / "changed_data.csv")
+            self.assertEqual(["id,changed_columns", "rec4,,created", "rec3,,deleted", "rec2,Abstract;Paper title,updated"],
+                             (directory / "changed_data.csv").read_text().splitlines())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,130 @@
+import pathlib
+import tempfile
+import unittest
+import unittest.mock
+
+import pandas as pd
+
+import diff_engine
+import ops_log_index
+
+OPS_LOG = """1,0.27502931836911926,0.025010755222666936,2020-06-05 00:28:59.994370,1,created
+2,0.5,0.5,2020-02-01 10:00:00,1,created
+3,0.3,0.3,2020-02-01 10:00:00,1,created
+6,0.6,0.6,2020-02-01 10:00:00,1,created
+6,0.6,0.6,2020-02-01 10:00:00,2,deleted
+"""
+
+TAIL = """2,0.5,0.25,2020-12-01 10:00:00,2,updated
+7,0.7,0.7,2020-12-02 10:00:00,1,created
+3,0.3,0.3,2020-02-01 10:00:00,2,deleted
+"""
+
+
+class TestOpsLogIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.log = pathlib.Path(self.tmp_dir.name) / "ops_log"
+        self.log.write_text(OPS_LOG)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def append(self, text):
+        with open(self.log, "a") as out_file:
+            out_file.write(text)
+
+    def replay(self):
+        return diff_engine.latest_revisions(diff_engine.read_ops_log(self.log))
+
+    def test_no_checkpoint(self):
+        latest, tail_lines = ops_log_index.load_latest(self.log)
+        pd.testing.assert_frame_equal(self.replay(), latest)
+        self.assertEqual(5, tail_lines)
+
+    def test_checkpoint_and_tail(self):
+        latest, _ = ops_log_index.load_latest(self.log)
+        ops_log_index.write_checkpoint(self.log, latest)
+        self.append(TAIL)
+
+        latest, tail_lines = ops_log_index.load_latest(self.log)
+        self.assertEqual(3, tail_lines)
+        pd.testing.assert_frame_equal(self.replay(), latest)
+        self.assertEqual(0.27502931836911926, latest.loc[latest["id"] == 1, "journal_title"].item())
+
+    def test_update_checkpoint(self):
+        latest, tail_lines = ops_log_index.load_latest(self.log)
+        self.append(TAIL)
+        changes = diff_engine.read_ops_log(self.log)[5:]
+        self.assertFalse(ops_log_index.update_checkpoint(self.log, latest, changes, tail_lines))
+
+        old_every = ops_log_index.CHECKPOINT_EVERY
+        ops_log_index.CHECKPOINT_EVERY = 8
+        try:
+            self.assertTrue(ops_log_index.update_checkpoint(self.log, latest, changes, tail_lines))
+        finally:
+            ops_log_index.CHECKPOINT_EVERY = old_every
+        latest, tail_lines = ops_log_index.load_latest(self.log)
+        self.assertEqual(0, tail_lines)
+        pd.testing.assert_frame_equal(self.replay(), latest)
+
+    def test_truncated_log_ignores_checkpoint(self):
+        self.append(TAIL)
+        ops_log_index.write_checkpoint(self.log, self.replay())
+        self.log.write_text(OPS_LOG)
+
+        latest, tail_lines = ops_log_index.load_latest(self.log)
+        self.assertEqual(5, tail_lines)
+        pd.testing.assert_frame_equal(self.replay(), latest)
+
+    def test_rotate_keeps_history(self):
+        expected = self.replay()
+        segment_path = ops_log_index.rotate(self.log)
+        self.assertEqual("ops_log.000001.gz", segment_path.name)
+        self.assertEqual("", self.log.read_text())
+
+        latest, tail_lines = ops_log_index.load_latest(self.log)
+        self.assertEqual(0, tail_lines)
+        pd.testing.assert_frame_equal(expected, latest)
+
+        self.append(TAIL)
+        ops_log_index.rotate(self.log)
+        history = ops_log_index.history(self.log)
+        self.log.write_text(OPS_LOG + TAIL)
+        pd.testing.assert_frame_equal(diff_engine.read_ops_log(self.log), history)
+
+    def test_lost_checkpoint_rebuilds_from_segments(self):
+        ops_log_index.rotate(self.log)
+        self.append(TAIL)
+        for path in ops_log_index.checkpoint_paths(self.log):
+            path.unlink()
+
+        latest, tail_lines = ops_log_index.load_latest(self.log)
+        self.assertEqual(8, tail_lines)
+        self.log.write_text(OPS_LOG + TAIL)
+        pd.testing.assert_frame_equal(self.replay(), latest)
+
+    def test_rotate_again_after_a_crash(self):
+        #stopped after writing the segment, before the checkpoint
+        with unittest.mock.patch.object(ops_log_index, "write_checkpoint", side_effect=KeyboardInterrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                ops_log_index.rotate(self.log)
+        self.assertEqual(OPS_LOG, self.log.read_text())
+        self.assertEqual("ops_log.000001.gz", ops_log_index.rotate(self.log).name)
+
+        #stopped after the checkpoint, before the log was emptied, and more lines were logged since
+        self.log.write_text(OPS_LOG + TAIL)
+        latest, _ = ops_log_index.load_latest(self.log)
+        self.assertEqual("ops_log.000002.gz", ops_log_index.rotate(self.log).name)
+        self.assertEqual(2, len(ops_log_index.segment_paths(self.log)))
+        self.assertEqual("", self.log.read_text())
+
+        history = ops_log_index.history(self.log)
+        self.log.write_text(OPS_LOG + TAIL)
+        pd.testing.assert_frame_equal(diff_engine.read_ops_log(self.log), history)
+        self.log.write_text("")
+        pd.testing.assert_frame_equal(latest, ops_log_index.load_latest(self.log)[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
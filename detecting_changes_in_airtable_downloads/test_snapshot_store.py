@@ -0,0 +1,113 @@
+import csv
+import io
+import pathlib
+import tempfile
+import unittest
+
+import diff_engine
+import snapshot_store
+
+HEADER = "id,journal_title,author,last_mod"
+FIRST = """1,0.1,0.1,2020-01-01 10:00:00
+2,0.2,0.2,2020-01-02 10:00:00
+3,0.3,0.3,2020-01-03 10:00:00
+4,"0.45",0.4,2020-01-04 10:00:00"""
+#2 updated, 3 deleted, 5 created
+SECOND = """1,0.1,0.1,2020-01-01 10:00:00
+2,0.25,0.2,2020-02-02 10:00:00
+4,"0.45",0.4,2020-01-04 10:00:00
+5,0.5,0.5,2020-02-05 10:00:00"""
+#the same rows in another order
+THIRD = """5,0.5,0.5,2020-02-05 10:00:00
+4,"0.45",0.4,2020-01-04 10:00:00
+2,0.25,0.2,2020-02-02 10:00:00
+1,0.1,0.1,2020-01-01 10:00:00"""
+
+
+def rows_of(text):
+    return list(csv.reader(io.StringIO(text)))
+
+
+class TestSnapshotStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.directory = pathlib.Path(self.tmp_dir.name)
+        self.store = snapshot_store.SnapshotStore(self.directory / "snapshots")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def add(self, name, rows, header=HEADER):
+        #written without a trailing newline, like gen_data.py
+        path = self.directory / "source-data.csv"
+        path.write_text(header + "\n" + rows)
+        return self.store.add(path, name)
+
+    def test_rebuild(self):
+        self.add("first", FIRST)
+        self.add("second", SECOND)
+        self.add("third", THIRD)
+        for name, rows in [("first", FIRST), ("second", SECOND), ("third", THIRD)]:
+            self.assertEqual(rows_of(HEADER + "\n" + rows), rows_of(self.store.rebuild(name)))
+        #a fresh store reads the same snapshots back from disk
+        store = snapshot_store.SnapshotStore(self.directory / "snapshots")
+        self.assertEqual(["first", "second", "third"], store.names)
+        self.assertEqual(rows_of(THIRD), rows_of(store.rebuild(-1))[1:])
+        #the latest snapshot reads into the same typed columns as a copied file
+        self.assertEqual(4, len(diff_engine.read_snapshot(io.StringIO(store.rebuild(-1)))))
+        with self.assertRaises(KeyError):
+            store.rebuild("fourth")
+
+    def test_deltas_hold_only_changes(self):
+        self.assertTrue(self.add("first", FIRST)["file"].startswith("base_"))
+        entry = self.add("second", SECOND)
+        self.assertEqual(("delta_000001.csv.gz", 2, 1), (entry["file"], entry["upserts"], entry["deletes"]))
+        lines = list(snapshot_store.read_gzip_csv(self.store.directory / entry["file"]))
+        self.assertEqual([["+", "2", "0.25", "0.2", "2020-02-02 10:00:00"],
+                          ["+", "5", "0.5", "0.5", "2020-02-05 10:00:00"],
+                          ["-", "3"]], lines)
+        #reordered rows only store the order
+        entry = self.add("third", THIRD)
+        self.assertEqual((0, 0), (entry["upserts"], entry["deletes"]))
+        self.assertEqual([["=", "5", "4", "2", "1"]],
+                         list(snapshot_store.read_gzip_csv(self.store.directory / entry["file"])))
+
+    def test_unchanged_store_grows_little(self):
+        rows = "\n".join("%d,0.%d,0.5,2020-01-01 10:00:00" % (i, i) for i in range(1, 5001))
+        self.add("first", rows)
+        size = self.store.disk_usage()
+        for i in range(5):
+            self.add("again_%d" % i, rows)
+        self.assertLess(self.store.disk_usage() - size, size // 20)
+
+    def test_header_change_starts_a_new_base(self):
+        self.add("first", FIRST)
+        entry = self.add("second", "1,0.1,0.1,2020-01-01 10:00:00,\"x, y\"", HEADER + ",extra")
+        self.assertEqual("base_000001.csv.gz", entry["file"])
+        self.add("third", "1,0.1,0.1,2020-01-01 10:00:00,y", HEADER + ",extra")
+        self.assertEqual(["id", "journal_title", "author", "last_mod", "extra"], rows_of(self.store.rebuild("third"))[0])
+        self.assertEqual(rows_of(HEADER + "\n" + FIRST), rows_of(self.store.rebuild("first")))
+        self.assertEqual([("1", "updated", ["1", "0.1", "0.1", "2020-01-01 10:00:00", "y"])],
+                         list(self.store.iter_delta("second", "third")))
+
+    def test_iter_delta(self):
+        self.add("first", FIRST)
+        self.add("second", SECOND)
+        self.add("third", THIRD)
+        delta = {id_: (operation, row[1]) for id_, operation, row in self.store.iter_delta("first", "third")}
+        self.assertEqual({"2": ("updated", "0.25"), "3": ("deleted", "0.3"), "5": ("created", "0.5")}, delta)
+        #backwards in time the operations are reversed
+        delta = {id_: operation for id_, operation, _ in self.store.iter_delta("third", "first")}
+        self.assertEqual({"2": "updated", "3": "created", "5": "deleted"}, delta)
+        self.assertEqual([], list(self.store.iter_delta("second", "third")))
+
+    def test_repeated_ids(self):
+        with self.assertRaises(ValueError):
+            self.add("first", FIRST + "\n" + FIRST)
+        self.add("first", FIRST)
+        with self.assertRaises(ValueError):
+            self.add("first", SECOND)
+
+
+if __name__ == "__main__":
+    unittest.main()
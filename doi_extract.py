@@ -0,0 +1,119 @@
+#Finds the DOI of a paper by scanning the raw bytes of its page with regular
+#expressions, without building a DOM.
+#Places on the page are checked from most to least trustworthy:
+#   1. <meta name="citation_doi">, <meta name="dc.identifier"> and similar tags
+#   2. doi.org urls
+#   3. anything in the text that looks like a DOI
+#The DOI pattern follows Crossref's advice:
+#   https://www.crossref.org/blog/dois-and-matching-regular-expressions/
+import collections
+import re
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import unquote
+
+DOI_PATTERN = rb'10\.\d{4,9}/[-._;()/:a-zA-Z0-9]+'
+
+META_TAG = re.compile(
+    rb'<meta\b[^>]*?\b(?:name|property)\s*=\s*["\']?'
+    rb'(?:citation_doi|dc\.identifier|prism\.doi|bepress_citation_doi)["\'\s>][^>]*>', re.IGNORECASE)
+META_CONTENT = re.compile(rb'\bcontent\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s>]+))', re.IGNORECASE)
+#doi.org and dx.doi.org urls, in links or in the text
+DOI_LINK = re.compile(rb'doi\.org/([^"\'\s<>]+)')
+#patterns are kept case sensitive and without lookbehinds, which lets the re
+#module jump straight to the next '10.' or 'doi.org' instead of trying every byte
+DOI_TEXT = re.compile(DOI_PATTERN)
+#a DOI in the text can't follow a letter, digit or '.', e.g. '110.1000/x' or 'v10.1000/x'
+NOT_BEFORE_DOI = frozenset(b'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_.')
+
+#lower numbers are ranked first
+SOURCES = {'meta': 0, 'link': 1, 'text': 2}
+
+DoiCandidate = collections.namedtuple('DoiCandidate', ['doi', 'source', 'count'])
+
+
+def clean_doi(doi):
+    # normalize a DOI found on a page, returning None if it isn't one
+    # the case is kept as on the page, see doi_key to compare DOIs
+    match = DOI_TEXT.search(doi)
+    if match is None:
+        return None
+    doi = match.group().decode('ascii')
+    #punctuation at the end usually belongs to the sentence, not the DOI
+    doi = doi.rstrip('.,;:')
+    while doi.endswith(')') and doi.count(')') > doi.count('('):
+        doi = doi[:-1].rstrip('.,;:')
+    return doi
+
+
+def doi_key(doi):
+    # DOIs are case insensitive, so they are compared in lowercase
+    return doi.lower()
+
+
+def find_candidates(html):
+    '''
+    Returns every DOI on the page as a list of DoiCandidate, best first.
+
+    Candidates are ranked by where they were found (meta tags, then doi.org
+    urls, then text), then by how often they appear, then by which came first.
+    Spellings differing only in case are one candidate, written as in the best
+    place it was found. html may be str or bytes.
+    '''
+    if isinstance(html, str):
+        html = html.encode('utf-8')
+
+    #doi_key -> [rank, count, first position, source, doi]
+    found = {}
+
+    def add(raw, source, position):
+        doi = clean_doi(raw)
+        if doi is None:
+            return
+        rank = SOURCES[source]
+        key = doi_key(doi)
+        if key not in found:
+            found[key] = [rank, 0, position, source, doi]
+        entry = found[key]
+        #the text scan sees every copy of a DOI, including those in meta tags and links,
+        #so only it counts them
+        if source == 'text':
+            entry[1] += 1
+        if rank < entry[0]:
+            entry[0] = rank
+            entry[3] = source
+            entry[4] = doi
+
+    for match in META_TAG.finditer(html):
+        content = META_CONTENT.search(match.group())
+        if content:
+            add(next(group for group in content.groups() if group is not None), 'meta', match.start())
+
+    for match in DOI_LINK.finditer(html):
+        add(unquote(match.group(1).decode('ascii', 'replace')).encode('utf-8'), 'link', match.start())
+
+    for match in DOI_TEXT.finditer(html):
+        start = match.start()
+        if start == 0 or html[start - 1] not in NOT_BEFORE_DOI:
+            add(match.group(), 'text', start)
+
+    ranked = sorted(found.items(), key=lambda item: (item[1][0], -item[1][1], item[1][2]))
+    return [DoiCandidate(entry[4], entry[3], max(entry[1], 1)) for _, entry in ranked]
+
+
+def best_doi(html):
+    # the most likely DOI of the page, or '' if there is none
+    candidates = find_candidates(html)
+    return candidates[0].doi if candidates else ''
+
+
+def find_candidates_many(pages, workers=None, chunksize=16):
+    '''
+    Runs find_candidates on a batch of pages, returning the results in the same order.
+
+    The pages are split between worker processes, since regular expressions
+    hold the GIL. workers=1 runs everything in this process.
+    '''
+    if workers == 1:
+        return [find_candidates(html) for html in pages]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(find_candidates, pages, chunksize=chunksize))
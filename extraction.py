@@ -0,0 +1,231 @@
+#Extracts paper fields from publisher pages using declarative specs.
+#Each publisher has a JSON spec in extraction_specs/<publisher>.json that maps
+#every field to where it is found:
+#   "select" - list of steps, each with any of "tag", "class", "id" and "has"
+#              ({"href": "pdf"} keeps elements whose href contains "pdf"). Every
+#              step searches inside the first match of the step before it
+#   "meta"   - name of the <meta> tag whose content is the value, e.g. "citation_doi"
+#   "url"    - operations that turn the page's url into the value, e.g. [["append", ".pdf"]]
+#and optionally
+#   "attr"     - read this attribute of the element instead of its text
+#   "contains" - only use values containing this string
+#   "pick"     - use the "first" (default) or "last" value
+#   "post"     - operations applied to the value, which is then always stripped
+#A spec is read and compiled into an ExtractionPlan the first time its publisher
+#is seen. The first steps of every "select" field are found together, in one
+#walk over the page with a single XPath matching any of them, and every later
+#step only searches inside the element its field's first step found. All the
+#<meta> fields are read in one pass over the <meta> tags as well
+import collections
+import functools
+import json
+import pathlib
+import time
+
+from lxml import etree
+
+import parsing
+
+SPECS_DIR = pathlib.Path(__file__).parent / 'extraction_specs'
+
+#operations for "url" and "post", called as operation(value, *arguments)
+OPERATIONS = {
+    'append': lambda value, suffix: value + suffix,
+    'append_unless_endswith': lambda value, end, suffix: value if value.endswith(end) else value + suffix,
+    'replace': lambda value, old, new: value.replace(old, new),
+    'slice': lambda value, start, stop=None: value[start:stop],
+    'split_after': lambda value, separator: value.split(separator, 1)[-1],
+}
+
+META_QUERY = etree.XPath('//meta[@name]')
+
+
+def apply_operations(operations, value):
+    for name, *arguments in operations:
+        value = OPERATIONS[name](value, *arguments)
+    return value
+
+
+class Field(collections.namedtuple('Field', ['name', 'rest', 'attr', 'contains', 'pick', 'post'])):
+    '''
+    A compiled field of a spec.
+
+    Parameters
+    name : name of the field, e.g. 'title'
+    rest : compiled XPaths of the steps after the first one
+    attr : attribute to read instead of the text, or None
+    contains : string the value must contain, or None
+    pick : 'first' or 'last'
+    post : operations applied to the value
+    '''
+
+    def value(self, matches):
+        # given every match of the first step, return the value of the field
+        for xpath in self.rest:
+            if not matches:
+                return ''
+            matches = xpath(matches[0])
+        if self.attr is None:
+            return self.choose(parsing.text(element) for element in matches)
+        return self.choose(element.get(self.attr, '') for element in matches)
+
+    def choose(self, candidates):
+        # candidates come in document order and are only turned into text until one is picked
+        value = None
+        for candidate in candidates:
+            if self.contains is None or self.contains in candidate:
+                value = candidate
+                if self.pick == 'first':
+                    break
+        if value is None:
+            return ''
+        return apply_operations(self.post, value).strip()
+
+
+def compile_step(step):
+    return etree.XPath(parsing.query_path(step.get('tag', '*'), step.get('class'), step.get('id'),
+                                          tuple(step.get('has', {}).items())))
+
+
+def self_test(step):
+    # XPath test of whether an element itself matches a step, e.g. "self::h1[@id='x']"
+    return 'self::' + parsing.query_path(step.get('tag', '*'), step.get('class'), step.get('id'),
+                                         tuple(step.get('has', {}).items()))[len('.//'):]
+
+
+def step_key(step):
+    return json.dumps(step, sort_keys=True)
+
+
+class ExtractionPlan(object):
+    def __init__(self, spec):
+        '''
+        Compiles a spec, see the top of this file.
+
+        Parameters
+        spec : dict with 'publisher' and 'fields' as read from extraction_specs/
+        '''
+        self.publisher = spec['publisher']
+        self.fields = tuple(spec['fields'])
+        #first step -> (its XPath, fields starting with it)
+        self.groups = {}
+        #first step -> XPath telling whether an element matches it
+        self.tests = {}
+        #meta name -> fields read from it
+        self.meta_fields = {}
+        self.url_fields = {}
+
+        for name, field_spec in spec['fields'].items():
+            if 'url' in field_spec:
+                self.url_fields[name] = [tuple(operation) for operation in field_spec['url']]
+                continue
+
+            field = Field(name, (), field_spec.get('attr'), field_spec.get('contains'),
+                          field_spec.get('pick', 'first'), [tuple(op) for op in field_spec.get('post', [])])
+            if 'meta' in field_spec:
+                self.meta_fields.setdefault(field_spec['meta'].lower(), []).append(field)
+                continue
+
+            first, *rest = field_spec['select']
+            field = field._replace(rest=tuple(compile_step(step) for step in rest))
+            group = self.groups.setdefault(step_key(first), (compile_step(first), []))
+            group[1].append(field)
+            self.tests[step_key(first)] = etree.XPath('boolean(%s)' % self_test(first))
+
+        #one walk over the page finds the elements matching any first step, in document order
+        self.traversal = etree.XPath('.//*[%s]' % ' or '.join(
+            '(%s)' % self_test(json.loads(key)) for key in self.groups)) if self.groups else None
+
+    def first_matches(self, tree):
+        # {first step: the elements matching it, in document order} from one walk over the page
+        matches = {key: [] for key in self.groups}
+        if self.traversal is None:
+            return matches
+        tests = list(self.tests.items())
+        for element in self.traversal(tree):
+            for key, test in tests:
+                if test(element):
+                    matches[key].append(element)
+        return matches
+
+    def extract(self, tree, url, observe=None):
+        '''
+        Returns every field of the spec from a parsed page, e.g. {'title': ..., 'doi': ...}
+
+        Parameters
+        tree : page parsed by parsing.parse_html
+        url : url of the page
+        observe : if given, called as observe(field, seconds) with the time spent
+                  finding each field. The walk shared by the "select" fields, and
+                  the pass shared by the meta fields, is split evenly between them
+        '''
+        #timing is a few perf_counter calls per page, so it is done whether or not it is wanted
+        clock = time.perf_counter
+        info = {}
+        seconds = {}
+        if self.groups:
+            start = clock()
+            matches = self.first_matches(tree)
+            shared = (clock() - start) / sum(len(fields) for _, fields in self.groups.values())
+            for key, (_, fields) in self.groups.items():
+                for field in fields:
+                    start = clock()
+                    info[field.name] = field.value(matches[key])
+                    seconds[field.name] = shared + clock() - start
+
+        if self.meta_fields:
+            start = clock()
+            contents = collections.defaultdict(list)
+            for meta in META_QUERY(tree):
+                contents[meta.get('name').lower()].append(meta.get('content', ''))
+            shared = (clock() - start) / sum(len(fields) for fields in self.meta_fields.values())
+            for meta_name, fields in self.meta_fields.items():
+                for field in fields:
+                    start = clock()
+                    info[field.name] = field.choose(contents[meta_name])
+                    seconds[field.name] = shared + clock() - start
+
+        for name, operations in self.url_fields.items():
+            start = clock()
+            info[name] = apply_operations(operations, url)
+            seconds[name] = clock() - start
+
+        if observe is not None:
+            for name in self.fields:
+                observe(name, seconds[name])
+        return {field: info[field] for field in self.fields}
+
+    def extract_field(self, tree, url, name):
+        # a single field of the spec, only searching for what it needs
+        if name in self.url_fields:
+            return apply_operations(self.url_fields[name], url)
+        for meta_name, fields in self.meta_fields.items():
+            for field in fields:
+                if field.name == name:
+                    return field.choose(meta.get('content', '') for meta in META_QUERY(tree)
+                                        if meta.get('name').lower() == meta_name)
+        for xpath, fields in self.groups.values():
+            for field in fields:
+                if field.name == name:
+                    return field.value(xpath(tree))
+        raise KeyError(name)
+
+
+def available():
+    # publishers that have a spec
+    return sorted(path.stem for path in SPECS_DIR.glob('*.json'))
+
+
+@functools.lru_cache(maxsize=None)
+def load_plan(publisher):
+    '''
+    Returns the compiled ExtractionPlan of a publisher, reading its spec the
+    first time it is asked for. Raises KeyError if there is no spec.
+
+    Parameters
+    publisher : name of the publisher, e.g. 'pnas'
+    '''
+    path = SPECS_DIR / ('%s.json' % publisher)
+    if publisher is None or not path.exists():
+        raise KeyError('No extraction spec for publisher %r' % publisher)
+    return ExtractionPlan(json.loads(path.read_text(encoding='utf-8')))
@@ -0,0 +1,153 @@
+#Shared HTTP fetching for the scrapers.
+#A Fetcher keeps one pooled keep-alive session, sends requests to each host
+#through a scheduler.Scheduler that limits their rate and number in flight and
+#retries throttled or failed requests, and runs batches on a thread pool
+#while keeping results in the same order as the input.
+#Responses can be kept in an http_cache.HTTPCache so reruns read from disk
+import collections
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+import http_cache
+import scheduler as scheduling
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_4) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/83.0.4103.97 Safari/537.36"}
+
+
+def host_of(url):
+    # given a url, return the host it will be fetched from, e.g. 'www.pnas.org'
+    return urlsplit(url).netloc.lower()
+
+
+class Fetcher(object):
+    def __init__(self, concurrency=8, per_host=2, timeout=30, headers=None, cache=None, scheduler=None):
+        '''
+        Parameters
+        concurrency : maximum number of urls fetched at the same time
+        per_host : maximum number of requests in flight to any one host
+        timeout : seconds to wait for a server before giving up
+        headers : headers sent with every request, defaults to HEADERS
+        cache : http_cache.HTTPCache to read and store pages in, None to always download
+        scheduler : scheduler.Scheduler pacing the requests to each host,
+                    defaults to one allowing per_host requests in flight
+        '''
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.timeout = timeout
+        self.cache = cache
+        self.scheduler = scheduler or scheduling.Scheduler(max_concurrency=per_host)
+
+        self.session = requests.Session()
+        self.session.headers.update(HEADERS if headers is None else headers)
+        #one connection pool per host, each big enough for every worker thread
+        adapter = HTTPAdapter(pool_connections=32, pool_maxsize=concurrency)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def get(self, url, **kwargs):
+        # GET url over the pooled session, when its host's scheduler allows it
+        #the headers the request will be sent with, which decide its cache entry
+        request_headers = CaseInsensitiveDict(self.session.headers)
+        request_headers.update(kwargs.get('headers') or {})
+        if self.cache is None or not http_cache.cacheable(request_headers):
+            return self.download(url, **kwargs)
+
+        entry = self.cache.lookup(url, request_headers)
+        if entry is None:
+            r = self.download(url, **kwargs)
+            if r.status_code == 200:
+                self.cache.store(url, r, request_headers)
+            return r
+
+        meta, body = entry
+        if self.cache.is_fresh(meta):
+            return http_cache.cached_response(url, meta, body)
+
+        #stale entry, ask the server whether the page changed since we stored it
+        headers = dict(kwargs.pop('headers', None) or {})
+        headers.update(self.cache.conditional_headers(meta))
+        r = self.download(url, headers=headers, **kwargs)
+        if r.status_code == 304:
+            self.cache.refresh(url, meta, r, request_headers)
+            return http_cache.cached_response(url, meta, body)
+        if r.status_code == 200:
+            self.cache.store(url, r, request_headers)
+        return r
+
+    def download(self, url, method='GET', **kwargs):
+        # send a request straight to the server, skipping the cache.
+        # 429s, 5xx and connection errors are retried by the scheduler
+        kwargs.setdefault('timeout', self.timeout)
+
+        def send():
+            start = time.perf_counter()
+            r = self.session.request(method, url, **kwargs)
+            #time of this attempt alone, instrumentation.py splits it into waiting and downloading
+            r.request_seconds = time.perf_counter() - start
+            return r
+        return self.scheduler.send(host_of(url), send)
+
+    def head(self, url, **kwargs):
+        kwargs.setdefault('allow_redirects', True)
+        return self.download(url, method='HEAD', **kwargs)
+
+    def get_html(self, url):
+        r = self.get(url)
+        return r.text
+
+    def map(self, func, items, return_exceptions=False):
+        '''
+        Calls func on every item using a pool of worker threads.
+
+        Results come back in the same order as items. If return_exceptions is
+        True, an exception raised for an item is put in its place in the results
+        instead of being raised.
+        '''
+        return list(self.imap(func, items, return_exceptions=return_exceptions))
+
+    def imap(self, func, items, return_exceptions=False, window=None):
+        '''
+        Like map, but yields each result as soon as it and every result before it
+        are ready. At most window items (default twice concurrency) are being
+        worked on or waiting to be consumed, so memory doesn't grow with items.
+        '''
+        def call(item):
+            try:
+                return func(item)
+            except Exception as e:
+                if return_exceptions:
+                    return e
+                raise
+
+        window = window or 2 * self.concurrency
+        executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        pending = collections.deque()
+        try:
+            for item in items:
+                pending.append(executor.submit(call, item))
+                if len(pending) >= window:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            #on an error or Ctrl-C, drop the items that haven't started yet
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+#used by PaperInfo.get_html and pull_doi when no fetcher is passed in
+default_fetcher = Fetcher(cache=http_cache.default_cache)
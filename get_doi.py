@@ -1,43 +1,28 @@
 #A script that pulls DOI from any journal publication website
-import requests
-from bs4 import BeautifulSoup
-import re
 import argparse
 import sys
-
-def pull_doi(url):
-    # r = requests.get(url)
-
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_4) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/83.0.4103.97 Safari/537.36"}
-
-    r = requests.get(url,headers=headers)
-    html = r.text
-    soup = BeautifulSoup(html, 'html.parser')
-    doi = ''
-
-    # qqq = soup.find_all('a')
-    # zzz = len(qqq)
-    #Pulling first DOI from href
-    for a in soup.find_all('a', href=True):
-        link = a['href']
-        if 'doi.org' in link:
-            doi = link.split('doi.org/')[1]
-            break
-
-    #Pulling first DOI from text
-    #Example: https://jeb.biologists.org/content/223/20/jeb226654
-    #DOI not embedded in a href, but can only be pulled by searching the text
-    if len(doi) == 0:
-        print('pulling from text')
-        # need to use a more sophisticated doi regex
-        #   https://www.crossref.org/blog/dois-and-matching-regular-expressions/
-        #   https://www.regextester.com/93795
-        doi = soup(text=re.compile(r'/^10.\d{4,9}/[-._;()/:A-Z0-9]+$/i'))[0].strip()
-        #removing all characters before first number in DOI
-        doi = re.search('[0-9].*', doi)[0]
-
-    return doi
+import time
+
+import doi_extract
+import fetcher as fetching
+import instrumentation
+import publisher_resolver
+
+def pull_doi(url, fetcher=None, html=None):
+    #the fetcher sends a browser User-Agent and reads pages from the on-disk cache
+    #html can be passed in when the page was already downloaded
+    publisher = publisher_resolver.resolve(url)
+    with instrumentation.metrics.timer('pull_doi', publisher):
+        if html is None:
+            start = time.perf_counter()
+            r = (fetcher or fetching.default_fetcher).get(url)
+            instrumentation.observe_response(publisher, r, time.perf_counter() - start)
+            html = r.text
+
+        #Checks citation_doi/dc.identifier meta tags first, then doi.org links,
+        #then DOIs in the text, e.g. https://jeb.biologists.org/content/223/20/jeb226654
+        #where the DOI isn't in a link. See doi_extract.py
+        return doi_extract.best_doi(html)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Pull DOI from Any Journal Website')
@@ -47,4 +32,4 @@ if __name__ == "__main__":
     args = parser.parse_args()
     url = args.url
 
-    print(pull_doi(url))
\ No newline at end of file
+    print(pull_doi(url))
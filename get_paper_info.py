@@ -1,202 +1,186 @@
+import collections
+import itertools
+import sys
+import time
+
 import requests
-from bs4 import BeautifulSoup
 
+import doi_extract
+import extraction
+import fetcher as fetching
+import http_cache
+import instrumentation
+import open_access
+import parsing
+import publisher_resolver
+import pubmed
+from parsing import find, text
 
-def which_journal(url):
-    # given the url, what is the journal that it is from, e.g. 'pnas'
-    if 'www' in url:
-        publisher = url.split('.')[1]
-    else:
-        publisher = url.split('.')[0].split('//')[1]
 
-    return publisher
+#what get_paper_info returns for a paper. Being a tuple, it holds only its five
+#values, and none of the page or tree it was extracted from
+PaperRecord = collections.namedtuple('PaperRecord', ['title', 'doi', 'abstract', 'full_doc_link', 'is_open_access'])
+
+
+class NoPaperFound(ValueError):
+    # the page has neither a title nor an abstract, e.g. a captcha or an error page
+    # served with a 200, so it isn't a paper and must not become a row of empty fields
+    pass
+
+
+def which_journal(url):
+    # given the url, what is the journal that it is from, e.g. 'pnas', see publisher_resolver.py
+    return publisher_resolver.resolve(url)
 
 class PaperInfo(object):
     # Abstract class for all of the
-    def __init__(self, url):
+    #fields collected by extract(), each one has a get_<field> method
+    fields = ('title', 'doi', 'abstract', 'full_doc_link')
+    #name of the spec in extraction_specs/ that says where each field is on the page
+    publisher = None
+
+    def __init__(self, url, html=None, fetcher=None, publisher=None):
         self.url = url
-        self.html = self.get_html()
-        self.soup = BeautifulSoup(self.html, 'html.parser')
+        #url the page came from after redirects, e.g. the article a doi.org link points to.
+        #Fields worked out from the url, like a full_doc_link, are built from it
+        self.final_url = url
+        self.fetcher = fetcher
+        if publisher is not None:
+            self.publisher = publisher
+        #html can be passed in when it was already downloaded
+        self.html = self.get_html() if html is None else html
+        #the page is parsed once, with lxml, and every get_* method searches this tree
+        with instrumentation.metrics.timer('parse', self.publisher):
+            self.tree = parsing.parse_html(self.html)
         self.pdf_link = None
 
+    @property
+    def plan(self):
+        # the compiled extraction spec of the publisher, None if there isn't one
+        return extraction.load_plan(self.publisher) if self.publisher is not None else None
+
     def get_html(self):
-        # use request module to get HTML from the Webpage at self.url
-        r = requests.get(self.url)
-        html = r.text
-        return html
+        # use the fetcher's pooled session to get HTML from the Webpage at self.url
+        start = time.perf_counter()
+        r = (self.fetcher or fetching.default_fetcher).get(self.url)
+        instrumentation.observe_response(self.publisher, r, time.perf_counter() - start)
+        #an error page has none of the paper's fields, so it fails instead of giving empty ones
+        if not 200 <= r.status_code < 300:
+            raise requests.HTTPError('%d %s for url: %s' % (r.status_code, r.reason, self.url), response=r)
+        self.final_url = r.url or self.url
+        return r.text
+
+    def get_field(self, field):
+        # given self.html, get one field from the publisher's spec, None if it isn't in the spec
+        plan = self.plan
+        if plan is None or field not in plan.fields:
+            return None
+        with instrumentation.metrics.timer('get_' + field, self.publisher):
+            return plan.extract_field(self.tree, self.final_url, field)
+
+    def observe_field(self, field, seconds):
+        # called by the plan with the time it took to find each field
+        instrumentation.metrics.observe('get_' + field, self.publisher, seconds)
 
     def get_title(self):
         # given self.html, get the title
-        pass
+        return self.get_field('title')
 
     def get_doi(self):
         # given self.html, get the doi
-        pass
+        # without a spec for it, same search as get_doi.pull_doi on the html we already have
+        doi = self.get_field('doi')
+        return doi_extract.best_doi(self.html) if doi is None else doi
 
     def get_abstract(self):
         # given self.html, get the abstract
-        pass
+        return self.get_field('abstract')
 
     def get_full_doc_link(self):
         # given self.html, get the full_doc_link
-        pass
-
-    def is_open_access(self):
+        return self.get_field('full_doc_link')
+
+    def release(self):
+        # drop the page and its parsed tree, which are nearly all the memory a PaperInfo holds,
+        # once every field has been extracted
+        self.html = None
+        self.tree = None
+
+    def find(self, tag='*', class_=None, id=None):
+        # first element on the page matching tag, class_ and id, like BeautifulSoup's find
+        return find(self.tree, tag, class_=class_, id=id)
+
+    def find_all(self, tag='*', class_=None, id=None):
+        return parsing.find_all(self.tree, tag, class_=class_, id=id)
+
+    def extract(self):
+        # collect every field from the one parsed tree, e.g. {'title': ..., 'doi': ...}
+        # fields in the spec are found together by its compiled plan
+        plan = self.plan
+        info = plan.extract(self.tree, self.final_url, self.observe_field) if plan is not None else {}
+        return {field: info[field] if field in info else getattr(self, 'get_' + field)()
+                for field in self.fields}
+
+    def is_open_access(self, pdf_link=None):
         # given full_doc_link, can you get the full PDF from it?
+        # only the headers or first bytes of the PDF are downloaded, see open_access.probe
+        # None when the page has no link, e.g. a PubMed article without a free copy in PubMed
+        # Central, since the paper may still be free on the publisher's site
+        if pdf_link is not None:
+            self.pdf_link = pdf_link
         if self.pdf_link is None:
             self.pdf_link = self.get_full_doc_link()
-        r = requests.get(self.pdf_link)
-        return r.ok
+        if not self.pdf_link:
+            return None
+        with instrumentation.metrics.timer('open_access', self.publisher):
+            return open_access.probe(self.pdf_link, fetcher=self.fetcher)
 
 
+#where each field is found on these publishers' pages is in extraction_specs/<publisher>.json
 class PaperInfoNature(PaperInfo):
-    def get_title(self):
-        # given self.html, get the title
-        title = self.soup.find('h1', class_='c-article-title').text.strip()
-        return title
-
-    def get_doi(self):
-        # given self.html, get the doi
-        spans = self.soup.find_all('span', class_='c-bibliographic-information__value')
-        for span in spans:
-            if 'doi' in span.text:
-                doi = span.text.strip()
-        return doi
-
-    def get_abstract(self):
-        # given self.html, get the abstract
-        abstract = self.soup.find(id='Abs1-content', class_='c-article-section__content').text.strip()
-        return abstract
-
-    def get_full_doc_link(self):
-        # given self.html, get the full_doc_link
-        pdf_link = self.url + '.pdf'
-        return pdf_link
+    publisher = 'nature'
 
 
 class PaperInfoJEB(PaperInfo):
-    def get_title(self):
-        # given self.html, get the title
-        title = self.soup.find('div', class_='highwire-cite-title', id='page-title').text.strip()
-        return title
+    publisher = 'jeb'
 
-    def get_doi(self):
-        # given self.html, get the doi
-        doi = self.soup.find('span', class_='highwire-cite-metadata-doi highwire-cite-metadata').text
-        doi = doi[5:].strip()
-        return doi
-
-    def get_abstract(self):
-        # given self.html, get the abstract
-        abstract = self.soup.find('p', id='p-1').text.strip()
-        return abstract
-
-    def get_full_doc_link(self):
-        # given self.html, get the full_doc_link
-        for a in self.soup.find_all('a', href=True):
-            link = a['href']
-            if 'pdf' in link:
-                if 'jeb.biologists.org' in link:
-                    pdf_link = link
-
-        return pdf_link
 
 class PaperInfoSpringer(PaperInfo):
-    def get_title(self):
-        # given self.html, get the title
-        title = self.soup.find('h1', class_='c-article-title').text.strip()
-        return title
-
-    def get_doi(self):
-        # given self.html, get the doi
-        doi = self.soup.find('span', class_='bibliographic-information__value u-overflow-wrap').text.strip()
-        return doi
-
-    def get_abstract(self):
-        # given self.html, get the abstract
-        abstract = self.soup.find('p', class_='Para').text.strip()
-        return abstract
-
-    def get_full_doc_link(self):
-        # given self.html, get the full_doc_link
-        pdf_link = self.url.replace('chapter','content/pdf')+'.pdf'
-        return pdf_link
+    publisher = 'springer'
 
 
 class PaperInfoRSP(PaperInfo):
-    def get_title(self):
-        # given self.html, get the title
-        title = self.soup.find('h1', class_='citation__title').text.strip()
-        return title
-
-    def get_doi(self):
-        # given self.html, get the doi
-        doi = self.soup.find('a', class_='epub-section__doi__text').text.strip()
-        return doi
-
-    def get_abstract(self):
-        # given self.html, get the abstract
-        abstract = self.soup.find('div', class_='abstractSection abstractInFull').text.strip()
-        return abstract
-
-    def get_full_doc_link(self):
-        # given self.html, get the full_doc_link
-        pdf_link = self.url.replace('full', 'pdf')
-        return pdf_link
+    publisher = 'rsp'
 
 
 class PaperInfoPNAS(PaperInfo):
-    def get_title(self):
-        # given self.html, get the title
-        title = self.soup.find('h1', class_='highwire-cite-title').text.strip()
-        return title
-
-    def get_doi(self):
-        # given self.html, get the doi
-        doi = self.soup.find('span', class_='highwire-cite-metadata-doi highwire-cite-metadata').text.strip()
-        return doi
-
-    def get_abstract(self):
-        # given self.html, get the abstract
-        abstract = self.soup.find('div', class_='section abstract').find('p').text.strip()
-        return abstract
-
-    def get_full_doc_link(self):
-        # given self.html, get the full_doc_link
-        if self.url[-4:] == 'full':
-            pdf_link = self.url + '.pdf'
-        else:
-            pdf_link = self.url + '.full.pdf'
-        return pdf_link
+    publisher = 'pnas'
 
 
 class PaperInfoPubMed(PaperInfo):
-    def get_title(self):
-        title = self.soup.find(id="full-view-heading").find("h1").text.strip()
-        return title
+    publisher = 'pubmed'
 
-    def get_doi(self):
-        # given self.html, get the doi
-        doi = self.soup.find('span', class_='identifier doi').find('a').text.strip()
-        return doi
+    def similar_articles_list(self):
+        return self.find('ul', class_='articles-list', id="similar-articles-list")
 
-    def get_abstract(self):
-        # given self.html, get the abstract
-        abstract = self.soup.find('div', class_='abstract-content selected').find('p').text.strip()
-        return abstract
+    def get_similar_pmids(self):
+        # PMIDs of the similar articles listed on the page, see pubmed.py to fetch them in bulk
+        links = parsing.find_all(self.similar_articles_list(), 'a', class_='docsum-title')
+        return [pmid for pmid in (pubmed.pmid_from_url(link.get('href', '')) for link in links) if pmid]
 
     def get_similar_articles(self):
-        articles = self.soup.find('ul', class_='articles-list', id="similar-articles-list").findAll('span', class_="docsum-journal-citation full-journal-citation")
+        # DOIs in the citations of the similar articles listed on the page, skipping citations without one
+        articles = parsing.find_all(self.similar_articles_list(),
+                                    'span', class_="docsum-journal-citation full-journal-citation")
 
         dois = []
         for article in articles:
-            doi = article.text
-            doi = doi.split('doi: ')[1].split(' Epub')[0]
-            dois.append(doi)
+            citation = text(article)
+            if 'doi:' in citation:
+                doi = doi_extract.clean_doi(citation.split('doi:', 1)[1].encode('utf-8'))
+                if doi is not None:
+                    dois.append(doi)
         return dois
-    # def get_full_doc_link(self):
-    #     # given self.html, get the full_doc_link
-    #     pass
 
 
 
@@ -210,18 +194,125 @@ paper_info_classes = {
 }
 
 
-def get_paper_info(url):
+def get_paper_info(url, fetcher=None):
     #Determine the journal site name, and create corresponding object name
     journal = which_journal(url)
-    paper_info_class = paper_info_classes[journal]
-    paper_info_instance = paper_info_class(url)
-
-    #Retrieiving journal properties
-    title = paper_info_instance.get_title()
-    doi = paper_info_instance.get_doi()
-    abstract = paper_info_instance.get_abstract()
-    full_doc_link = paper_info_instance.get_full_doc_link()
-    # is_open_access = paper_info_instance.is_open_access()
-    is_open_access = True
-
-    return title, doi, abstract, full_doc_link, is_open_access
+    #timed as a whole, and profiled when instrumentation.metrics.profile_slowest is set
+    return instrumentation.metrics.profile(url, journal, paper_info_of, url, journal, fetcher)
+
+
+def paper_info_of(url, journal, fetcher=None):
+    #publishers without their own class only need a spec in extraction_specs/,
+    #this raises KeyError before downloading anything if there isn't one
+    extraction.load_plan(journal)
+    paper_info_class = paper_info_classes.get(journal, PaperInfo)
+    paper_info_instance = paper_info_class(url, fetcher=fetcher, publisher=journal)
+
+    #Retrieiving journal properties, all from a single parse of the page
+    info = paper_info_instance.extract()
+    paper_info_instance.release()
+    if not info['title'] and not info['abstract']:
+        raise NoPaperFound('Neither a title nor an abstract on %s' % url)
+    title = info['title']
+    doi = info['doi']
+    abstract = info['abstract']
+    full_doc_link = info['full_doc_link']
+    is_open_access = paper_info_instance.is_open_access(full_doc_link)
+
+    return PaperRecord(title, doi, abstract, full_doc_link, is_open_access)
+
+
+def paper_record_from_article(article, fetcher=None):
+    # PaperRecord of an article from pubmed.EUtils.fetch_articles, without downloading its page.
+    # Like the page, it links to the PDF in PubMed Central if there is one, see PaperInfo.is_open_access
+    full_doc_link = pubmed.PMC_PDF_URL % article['pmc'] if article['pmc'] else ''
+    is_open_access = open_access.probe(full_doc_link, fetcher=fetcher) if full_doc_link else None
+    return PaperRecord(article['title'], article['doi'], article['abstract'], full_doc_link, is_open_access)
+
+
+def pubmed_articles(urls, eutils):
+    # {url: article} of the PubMed urls among urls, from the E-utilities with one request for them all.
+    # Urls PubMed doesn't return, or every url if the E-utilities fail, are left out and their
+    # pages are fetched instead
+    urls = [url for url in urls if which_journal(url) == 'pubmed' and pubmed.pmid_from_url(url)]
+    if not urls:
+        return {}
+    try:
+        articles = pubmed.paper_info_many(urls, eutils)
+    #a response cut short fails to parse with an XMLSyntaxError, which is a SyntaxError
+    except (requests.RequestException, SyntaxError) as e:
+        print('PubMed E-utilities failed, fetching the pages instead: %r' % e, file=sys.stderr)
+        return {}
+    return {url: article for url, article in articles.items() if article['title'] or article['abstract']}
+
+
+def iter_paper_info(urls, concurrency=8, per_host=2, window=None, fetcher=None, eutils=None):
+    '''
+    Yields (url, PaperRecord) for every url, in the same order as urls, or
+    (url, exception) for a url that failed.
+
+    Only window urls (default twice concurrency) are downloaded or waiting to
+    be consumed at any time, and urls is read no faster than the results are
+    consumed, so it can be a generator over a file of any size. Each page and
+    its tree are dropped as soon as its fields are extracted.
+
+    urls are read window at a time, and the PubMed urls among them are looked
+    up together with the E-utilities (see pubmed.paper_info_many) instead of
+    downloading a page for each.
+
+    Parameters
+    urls : iterable of paper urls
+    concurrency : pages downloaded at the same time
+    per_host : requests in flight to any one site
+    window : most urls in flight or waiting to be consumed
+    fetcher : Fetcher to use, e.g. a replay.replay_fetcher(), instead of a new one
+        with the on-disk cache. Its concurrency is used instead of concurrency
+    eutils : pubmed.EUtils to look up PubMed urls with. Defaults to one sending its
+        requests through fetcher if one is given, so they are answered offline as well,
+        or to a new one keeping to NCBI's rate limit
+    '''
+    batch_fetcher = fetcher or fetching.Fetcher(concurrency=concurrency, per_host=per_host,
+                                                cache=http_cache.default_cache)
+    window = window or 2 * batch_fetcher.concurrency
+    own_eutils = eutils is None and fetcher is None
+    if eutils is None:
+        #EUtils closes its fetcher, so one sharing the caller's fetcher isn't closed here
+        eutils = pubmed.EUtils(fetcher) if fetcher is not None else pubmed.EUtils()
+
+    def with_articles():
+        # (url, its PubMed article or None) for every url, looking up window urls at a time
+        url_iter = iter(urls)
+        for chunk in iter(lambda: list(itertools.islice(url_iter, window)), []):
+            articles = pubmed_articles(chunk, eutils)
+            for url in chunk:
+                yield url, articles.get(url)
+
+    def fetch(item):
+        url, article = item
+        try:
+            if article is not None:
+                return url, paper_record_from_article(article, batch_fetcher)
+            return url, get_paper_info(url, fetcher=batch_fetcher)
+        except Exception as e:
+            return url, e
+
+    try:
+        yield from batch_fetcher.imap(fetch, with_articles(), window=window)
+    finally:
+        if own_eutils:
+            eutils.close()
+        if fetcher is None:
+            batch_fetcher.close()
+
+
+def get_paper_info_many(urls, concurrency=8, per_host=2):
+    '''
+    Runs get_paper_info on many urls at once.
+
+    Pages are downloaded on a pool of concurrency threads sharing keep-alive
+    connections, with at most per_host requests to any one site at a time.
+    Results are returned in the same order as urls. A url that fails has the
+    exception it raised in its place instead of a PaperRecord. For long lists
+    use iter_paper_info, which doesn't keep every result in memory.
+    '''
+    return [result for _, result in iter_paper_info(urls, concurrency, per_host)]
@@ -1,7 +1,8 @@
-import pandas as pd
+import columnar
 
 
 def get_urls(input_csv_filename):
-    df = pd.read_csv(input_csv_filename)
+    # only the URL column is read, from a CSV, Parquet or Arrow file
+    df = columnar.read_columns(input_csv_filename, ['URL'])
     urls = df['URL'].tolist()
     return urls
\ No newline at end of file
@@ -0,0 +1,189 @@
+#On-disk cache of HTTP responses used by fetcher.Fetcher.
+#Entries are keyed by a hash of the normalized url and of the request headers
+#that change what the server sends back (VARY_HEADERS), so the same url asked
+#for with another Accept or Cookie gets an entry of its own. Requests for part
+#of a page or with their own conditions (BYPASS_HEADERS, e.g. Range) are never
+#answered from or stored in the cache. Each entry is a body file
+#plus a small JSON file holding the ETag, Last-Modified and headers so stale
+#entries can be revalidated with a conditional request instead of downloaded again
+import hashlib
+import json
+import os
+import pathlib
+import threading
+import time
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+#request headers that change the response. Values requests sends by default
+#are left out of the key, so a plain GET keeps the key of its url alone
+VARY_HEADERS = ('Accept', 'Accept-Encoding', 'Accept-Language', 'Authorization', 'Cookie')
+DEFAULT_HEADERS = requests.utils.default_headers()
+#request headers asking for part of a page or a conditional answer, which the cache can't give
+BYPASS_HEADERS = ('Range', 'If-Range', 'If-None-Match', 'If-Modified-Since', 'If-Match', 'If-Unmodified-Since')
+#next to this file, so every script shares one cache whatever directory it runs in
+CACHE_DIR = pathlib.Path(__file__).resolve().parent / '.http_cache'
+
+
+def normalize_url(url):
+    # lowercase scheme and host, drop default ports and fragments, sort the query
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    if parts.port is not None and parts.port != DEFAULT_PORTS.get(scheme):
+        host = '%s:%d' % (host, parts.port)
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, host, parts.path or '/', query, ''))
+
+
+def varying_headers(headers):
+    # 'Name: value' lines of the VARY_HEADERS of a request that aren't requests' defaults
+    headers = CaseInsensitiveDict(headers or {})
+    return ['%s: %s' % (name, headers[name]) for name in VARY_HEADERS
+            if headers.get(name) and headers[name] != DEFAULT_HEADERS.get(name)]
+
+
+def cacheable(headers):
+    # False for a request the cache must not answer, e.g. one for a byte range
+    headers = CaseInsensitiveDict(headers or {})
+    return not any(name in headers for name in BYPASS_HEADERS)
+
+
+def cache_key(url, headers=None):
+    key = '\n'.join([normalize_url(url)] + varying_headers(headers))
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+class HTTPCache(object):
+    def __init__(self, directory=CACHE_DIR, ttl=7 * 24 * 3600, max_bytes=1024 ** 3):
+        '''
+        Parameters
+        directory : folder the cache entries are written to
+        ttl : seconds an entry is used without asking the server if it changed
+        max_bytes : once the bodies take more space than this, the least recently
+            used entries are removed
+        '''
+        self.directory = pathlib.Path(directory)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._size = None
+
+    def paths(self, url, headers=None):
+        key = cache_key(url, headers)
+        folder = self.directory / key[:2]
+        return folder / (key + '.body'), folder / (key + '.json')
+
+    def lookup(self, url, headers=None):
+        # returns (meta, body) for url asked for with headers, or None if it isn't cached
+        body_path, meta_path = self.paths(url, headers)
+        try:
+            meta = json.loads(meta_path.read_text())
+            body = body_path.read_bytes()
+        except (OSError, ValueError):
+            return None
+        #the body's modification time records when it was last used, for LRU eviction
+        os.utime(body_path)
+        return meta, body
+
+    def is_fresh(self, meta):
+        return time.time() - meta['fetched_at'] < self.ttl
+
+    def conditional_headers(self, meta):
+        # headers asking the server to answer 304 if the cached copy is still good
+        headers = {}
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+        return headers
+
+    def store(self, url, response, headers=None):
+        body_path, meta_path = self.paths(url, headers)
+        body_path.parent.mkdir(parents=True, exist_ok=True)
+        meta = {
+            'url': url,
+            #where redirects led, e.g. the article a doi.org link points to
+            'final_url': response.url or url,
+            'status_code': response.status_code,
+            'encoding': response.encoding,
+            'headers': dict(response.headers),
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'fetched_at': time.time(),
+        }
+        old_size = body_path.stat().st_size if body_path.exists() else 0
+        write_atomic(body_path, response.content)
+        write_atomic(meta_path, json.dumps(meta).encode('utf-8'))
+
+        with self._lock:
+            if self._size is not None:
+                self._size += len(response.content) - old_size
+        if self.size() > self.max_bytes:
+            self.evict()
+
+    def refresh(self, url, meta, response, headers=None):
+        # the server answered 304, so the cached body is good for another ttl
+        meta['fetched_at'] = time.time()
+        for header, field in (('ETag', 'etag'), ('Last-Modified', 'last_modified')):
+            if response.headers.get(header):
+                meta[field] = response.headers[header]
+        write_atomic(self.paths(url, headers)[1], json.dumps(meta).encode('utf-8'))
+
+    def size(self):
+        # total size of the cached bodies in bytes
+        with self._lock:
+            if self._size is None:
+                self._size = sum(path.stat().st_size for path in self.directory.glob('*/*.body'))
+            return self._size
+
+    def evict(self):
+        # remove least recently used entries until the cache is under 90% of max_bytes
+        with self._lock:
+            bodies = []
+            for path in self.directory.glob('*/*.body'):
+                stat = path.stat()
+                bodies.append((stat.st_mtime, stat.st_size, path))
+            bodies.sort()
+
+            size = sum(body[1] for body in bodies)
+            target = self.max_bytes * 0.9
+            for _, body_size, path in bodies:
+                if size <= target:
+                    break
+                path.unlink()
+                path.with_suffix('.json').unlink(missing_ok=True)
+                size -= body_size
+            self._size = size
+
+    def clear(self):
+        with self._lock:
+            for path in self.directory.glob('*/*'):
+                path.unlink()
+            self._size = 0
+
+
+def write_atomic(path, data):
+    # write to a temporary file first so readers never see a half written entry
+    tmp_path = path.with_name('%s.%d.%d.tmp' % (path.name, os.getpid(), threading.get_ident()))
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, path)
+
+
+def cached_response(url, meta, body):
+    # rebuild a requests.Response from a cache entry
+    response = requests.Response()
+    response.url = meta.get('final_url', url)
+    response.status_code = meta['status_code']
+    response.headers = CaseInsensitiveDict(meta['headers'])
+    response.encoding = meta['encoding']
+    response._content = body
+    response.from_cache = True
+    return response
+
+
+#shared by the default fetcher and batch runs, set HTTP_CACHE_DIR to move it
+default_cache = HTTPCache(os.environ.get('HTTP_CACHE_DIR', CACHE_DIR))
@@ -0,0 +1,256 @@
+#Timing instrumentation for the scraping pipeline.
+#Every stage of getting a paper records how long it took, and for downloads how
+#many bytes, in a histogram per (stage, publisher). The stages are
+#   fetch      - the whole of PaperInfo.get_html / pull_doi's download, cache hits
+#                included, with the size of the page in bytes
+#and for pages that came from the network, the fetch split into
+#   queue      - waiting for the host's scheduler, and earlier attempts that were retried
+#   wait       - from sending the request until the response headers arrived, which
+#                covers DNS, connecting, TLS and the server's think time (requests
+#                doesn't time those apart)
+#   download   - reading the body after the headers, with its size in bytes
+#   parse      - lxml parsing of the page
+#   get_<field> - finding one field on the parsed page, from get_title() etc. or
+#                PaperInfo.extract(), where a search shared by several fields is
+#                split evenly between them
+#   pull_doi   - get_doi.pull_doi, including its download
+#   paper      - the whole of get_paper_info for one url
+#Recording is a couple of perf_counter calls and a bisect under a lock, cheap
+#enough to leave on. metrics.export() writes a JSON summary and a Prometheus
+#text file. With metrics.profile_slowest = N every url is run under cProfile
+#and the profiles of the N slowest are kept and written out by export()
+import bisect
+import cProfile
+import heapq
+import io
+import itertools
+import json
+import pathlib
+import pstats
+import threading
+import time
+
+#upper bounds of the histogram buckets in seconds, the last bucket takes everything slower
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+UNKNOWN = 'other'
+PROMETHEUS_PREFIX = 'scraper'
+
+
+class Histogram(object):
+    __slots__ = ('counts', 'count', 'sum', 'max', 'bytes')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.bytes = 0
+
+    def observe(self, seconds, nbytes=None):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds > self.max:
+            self.max = seconds
+        if nbytes:
+            self.bytes += nbytes
+
+    def quantile(self, q):
+        # upper bound of the bucket holding the q-th quantile, the largest time seen for the last bucket
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        for bound, seen in zip(BUCKETS, itertools.accumulate(self.counts)):
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def summary(self):
+        return {'count': self.count, 'seconds': self.sum, 'mean': self.sum / self.count if self.count else 0.0,
+                'p50': self.quantile(0.5), 'p90': self.quantile(0.9), 'p99': self.quantile(0.99),
+                'max': self.max, 'bytes': self.bytes}
+
+
+class Timer(object):
+    # context manager timing a block into a Metrics, set .nbytes inside the block to count bytes
+    __slots__ = ('metrics', 'stage', 'publisher', 'nbytes', 'start')
+
+    def __init__(self, metrics, stage, publisher):
+        self.metrics = metrics
+        self.stage = stage
+        self.publisher = publisher
+        self.nbytes = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.observe(self.stage, self.publisher, time.perf_counter() - self.start, self.nbytes)
+        return False
+
+
+class Metrics(object):
+    def __init__(self, profile_slowest=0):
+        '''
+        Histograms of the time spent in each stage, per publisher.
+
+        Parameters
+        profile_slowest : keep cProfile profiles of this many of the slowest urls,
+                          0 to not profile. Profiling makes every url about twice as slow
+        '''
+        self.enabled = True
+        self.profile_slowest = profile_slowest
+        self.histograms = {}
+        #heap of (seconds, order, url, publisher, profile text) of the slowest urls
+        self.slowest = []
+        self._order = itertools.count()
+        self._lock = threading.Lock()
+
+    def reset(self):
+        with self._lock:
+            self.histograms = {}
+            self.slowest = []
+
+    def observe(self, stage, publisher, seconds, nbytes=None):
+        '''
+        Records one timing.
+
+        Parameters
+        stage : name of the stage, e.g. 'parse'
+        publisher : publisher the page is from, e.g. 'pnas', None if unknown
+        seconds : time the stage took
+        nbytes : bytes downloaded in the stage, if any
+        '''
+        if not self.enabled:
+            return
+        key = (stage, publisher or UNKNOWN)
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(seconds, nbytes)
+
+    def timer(self, stage, publisher):
+        # with metrics.timer('parse', 'pnas'): ...
+        return Timer(self, stage, publisher)
+
+    def profile(self, url, publisher, func, *args, **kwargs):
+        '''
+        Calls func(*args, **kwargs) for url, timing it as the 'paper' stage, under
+        cProfile when profile_slowest is set. Returns what func returns.
+        '''
+        if not self.enabled or not self.profile_slowest:
+            with self.timer('paper', publisher):
+                return func(*args, **kwargs)
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            #from Python 3.12 only one profiler can run at a time, this url is only timed
+            profiler = None
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            seconds = time.perf_counter() - start
+            self.observe('paper', publisher, seconds)
+            if profiler is not None:
+                profiler.disable()
+                self.keep_profile(url, publisher, seconds, profiler)
+
+    def keep_profile(self, url, publisher, seconds, profiler):
+        with self._lock:
+            if len(self.slowest) >= self.profile_slowest and seconds <= self.slowest[0][0]:
+                return
+        #the report is only made for urls that make it into the slowest ones
+        report = io.StringIO()
+        pstats.Stats(profiler, stream=report).sort_stats('cumulative').print_stats(40)
+        entry = (seconds, next(self._order), url, publisher or UNKNOWN, report.getvalue())
+        with self._lock:
+            if len(self.slowest) < self.profile_slowest:
+                heapq.heappush(self.slowest, entry)
+            else:
+                heapq.heappushpop(self.slowest, entry)
+
+    def summary(self):
+        # {'stages': {stage: {publisher: {'count': ..., 'p50': ..., ...}}}, 'slowest': [...]}
+        with self._lock:
+            histograms = sorted(self.histograms.items())
+            slowest = sorted(self.slowest, reverse=True)
+        stages = {}
+        for (stage, publisher), histogram in histograms:
+            stages.setdefault(stage, {})[publisher] = histogram.summary()
+        return {'stages': stages,
+                'slowest': [{'url': url, 'publisher': publisher, 'seconds': seconds}
+                            for seconds, _, url, publisher, _ in slowest]}
+
+    def prometheus(self):
+        # the histograms in the Prometheus text exposition format
+        name = PROMETHEUS_PREFIX + '_stage_seconds'
+        lines = ['# HELP %s Time spent in each stage of getting a paper.' % name,
+                 '# TYPE %s histogram' % name]
+        with self._lock:
+            histograms = sorted(self.histograms.items())
+        for (stage, publisher), histogram in histograms:
+            labels = 'stage="%s",publisher="%s"' % (stage, publisher)
+            for bound, seen in zip(BUCKETS + ('+Inf',), itertools.accumulate(histogram.counts)):
+                lines.append('%s_bucket{%s,le="%s"} %d' % (name, labels, bound, seen))
+            lines.append('%s_sum{%s} %r' % (name, labels, histogram.sum))
+            lines.append('%s_count{%s} %d' % (name, labels, histogram.count))
+
+        name = PROMETHEUS_PREFIX + '_stage_bytes_total'
+        lines += ['# HELP %s Bytes downloaded in each stage.' % name, '# TYPE %s counter' % name]
+        for (stage, publisher), histogram in histograms:
+            if histogram.bytes:
+                lines.append('%s{stage="%s",publisher="%s"} %d' % (name, stage, publisher, histogram.bytes))
+        return '\n'.join(lines) + '\n'
+
+    def export(self, prefix):
+        '''
+        Writes <prefix>.metrics.json and <prefix>.prom, and the profiles of the
+        slowest urls to <prefix>.profiles/, and returns the summary.
+
+        Parameters
+        prefix : path the files are named after, e.g. 'output.csv'
+        '''
+        prefix = pathlib.Path(prefix)
+        summary = self.summary()
+        if self.slowest:
+            profile_dir = prefix.with_name(prefix.name + '.profiles')
+            profile_dir.mkdir(exist_ok=True)
+            for rank, (seconds, _, url, publisher, report) in enumerate(sorted(self.slowest, reverse=True)):
+                path = profile_dir / ('%02d_%s.txt' % (rank, publisher))
+                path.write_text('%s\n%.3f seconds\n\n%s' % (url, seconds, report), encoding='utf-8')
+                summary['slowest'][rank]['profile'] = str(path)
+        with prefix.with_name(prefix.name + '.metrics.json').open('w') as out_file:
+            json.dump(summary, out_file, indent=2, sort_keys=True)
+            out_file.write('\n')
+        prefix.with_name(prefix.name + '.prom').write_text(self.prometheus())
+        return summary
+
+
+#shared by PaperInfo, get_doi and batch_runner
+metrics = Metrics()
+
+
+def observe_response(publisher, response, seconds):
+    '''
+    Records a fetch that took seconds and returned response, split into its
+    stages when it went to the network.
+
+    Parameters
+    publisher : publisher the page is from, e.g. 'pnas'
+    response : requests.Response, Fetcher.download sets its request_seconds
+    seconds : time of the whole fetch
+    '''
+    size = len(response.content)
+    metrics.observe('fetch', publisher, seconds, size)
+    request_seconds = getattr(response, 'request_seconds', None)
+    if getattr(response, 'from_cache', False) or request_seconds is None:
+        return
+    wait = response.elapsed.total_seconds()
+    metrics.observe('queue', publisher, max(0.0, seconds - request_seconds))
+    metrics.observe('wait', publisher, wait)
+    metrics.observe('download', publisher, max(0.0, request_seconds - wait), size)
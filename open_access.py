@@ -0,0 +1,113 @@
+#Checks whether the full document of a paper can be downloaded without a subscription.
+#Instead of downloading the whole PDF, each link is probed with a HEAD request,
+#falling back to a GET of only its first kilobyte when HEAD isn't enough.
+#Results are kept in a small cache file so a link is only ever probed once
+#
+#Usage: python open_access.py output.csv
+#   fills in the is_open_access column of output.csv from its full_doc_link column
+import argparse
+import json
+import os
+import pathlib
+import threading
+
+import requests
+
+import fetcher as fetching
+
+#number of bytes requested when HEAD doesn't tell us what the link points to
+PROBE_BYTES = 1024
+
+
+class ProbeCache(object):
+    # results of earlier probes, stored one JSON object per line in path
+    def __init__(self, path):
+        self.path = pathlib.Path(path)
+        self._results = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        results = {}
+        if self.path.exists():
+            with self.path.open('r') as in_file:
+                for line in in_file:
+                    entry = json.loads(line)
+                    results[entry['url']] = entry['is_open_access']
+        return results
+
+    def get(self, url):
+        with self._lock:
+            if self._results is None:
+                self._results = self.load()
+            return self._results.get(url)
+
+    def set(self, url, is_open_access):
+        with self._lock:
+            if self._results is None:
+                self._results = self.load()
+            self._results[url] = is_open_access
+            with self.path.open('a') as out_file:
+                out_file.write(json.dumps({'url': url, 'is_open_access': is_open_access}) + '\n')
+
+
+def is_pdf(response, first_bytes=b''):
+    content_type = response.headers.get('Content-Type', '').lower()
+    return 'pdf' in content_type or first_bytes.startswith(b'%PDF')
+
+
+def probe(pdf_link, fetcher=None, cache=None):
+    '''
+    Returns True if pdf_link can be downloaded as a PDF.
+
+    A HEAD request is tried first, following redirects. If the server doesn't
+    allow HEAD, or doesn't say what the link is, only the first PROBE_BYTES of
+    the document are requested and checked for the PDF signature.
+    '''
+    if not pdf_link:
+        return False
+    cache = default_cache if cache is None else cache
+    is_open_access = cache.get(pdf_link)
+    if is_open_access is not None:
+        return is_open_access
+
+    fetcher = fetcher or fetching.default_fetcher
+    try:
+        r = fetcher.head(pdf_link)
+        if r.ok and r.headers.get('Content-Type'):
+            is_open_access = is_pdf(r)
+        else:
+            r = fetcher.download(pdf_link, headers={'Range': 'bytes=0-%d' % (PROBE_BYTES - 1)}, stream=True)
+            try:
+                first_bytes = next(r.iter_content(PROBE_BYTES), b'') if r.ok else b''
+            finally:
+                r.close()
+            is_open_access = r.ok and is_pdf(r, first_bytes)
+    except requests.RequestException:
+        #network errors aren't cached, the link is probed again next time
+        return False
+
+    cache.set(pdf_link, is_open_access)
+    return is_open_access
+
+
+def probe_many(pdf_links, concurrency=8, per_host=2, cache=None):
+    # probe every link in parallel, returning the results in the same order
+    with fetching.Fetcher(concurrency=concurrency, per_host=per_host) as batch_fetcher:
+        return batch_fetcher.map(lambda link: probe(link, fetcher=batch_fetcher, cache=cache), pdf_links)
+
+
+#set OPEN_ACCESS_CACHE to move it
+default_cache = ProbeCache(os.environ.get('OPEN_ACCESS_CACHE', '.open_access.jsonl'))
+
+if __name__ == "__main__":
+    import pandas as pd
+
+    parser = argparse.ArgumentParser(description='Fill in the is_open_access column of a CSV of papers')
+    parser.add_argument('csv', type=str, help='CSV file with a full_doc_link column, e.g. output.csv')
+    parser.add_argument('--concurrency', type=int, default=8, help='number of links to probe at the same time')
+    args = parser.parse_args()
+
+    df = pd.read_csv(args.csv, index_col=0)
+    links = [link if isinstance(link, str) else None for link in df['full_doc_link']]
+    df['is_open_access'] = probe_many(links, concurrency=args.concurrency)
+    df.to_csv(args.csv)
@@ -0,0 +1,65 @@
+#Helpers for parsing pages with lxml and searching them the way BeautifulSoup does.
+#lxml builds its tree in C, which is many times faster than BeautifulSoup,
+#and the searches are compiled to XPath once and reused for every page
+import functools
+
+import lxml.html
+from lxml import etree
+
+#pages are decoded to str by requests, so they are always fed to lxml as utf-8
+HTML_PARSER = lxml.html.HTMLParser(encoding='utf-8')
+
+
+def parse_html(html):
+    # given the html of a page as str or bytes, return the root element of its tree
+    if isinstance(html, str):
+        html = html.encode('utf-8')
+    return lxml.html.document_fromstring(html, parser=HTML_PARSER)
+
+
+def xpath_literal(value):
+    # quote value for use inside an xpath expression
+    if "'" not in value:
+        return "'%s'" % value
+    if '"' not in value:
+        return '"%s"' % value
+    return "concat('%s')" % "', \"'\", '".join(value.split("'"))
+
+
+def query_path(tag='*', class_=None, id=None, has=()):
+    '''
+    Returns the XPath expression for BeautifulSoup's find_all(tag, class_=..., id=...).
+    class_ may hold several space separated classes, and an element matches
+    when it has all of them. has is a list of (attribute, string) pairs, and
+    an element matches when each attribute contains its string.
+    '''
+    tests = []
+    if id is not None:
+        tests.append('@id=%s' % xpath_literal(id))
+    if class_ is not None:
+        for name in class_.split():
+            tests.append("contains(concat(' ', normalize-space(@class), ' '), %s)" % xpath_literal(' %s ' % name))
+    for attribute, value in has:
+        tests.append('contains(@%s, %s)' % (attribute, xpath_literal(value)))
+    return './/%s%s' % (tag, ''.join('[%s]' % test for test in tests))
+
+
+@functools.lru_cache(maxsize=None)
+def compile_query(tag='*', class_=None, id=None):
+    # query_path compiled once and reused for every page
+    return etree.XPath(query_path(tag, class_, id))
+
+
+def find_all(element, tag='*', class_=None, id=None):
+    return compile_query(tag, class_, id)(element)
+
+
+def find(element, tag='*', class_=None, id=None):
+    # first matching element below element, or None like BeautifulSoup's find
+    found = find_all(element, tag, class_, id)
+    return found[0] if found else None
+
+
+def text(element):
+    # all the text inside element, like BeautifulSoup's .text
+    return element.text_content()
@@ -0,0 +1,322 @@
+#Runs the whole pipeline incrementally:
+#   retrieve (optional) - sync the Airtable table and write it as the export CSV, see retrieve_airtable.py
+#   clean               - one row per URL, see clean_airtable.py
+#   scrape              - get_paper_info for the rows that changed, merged into the output table
+#   mturk               - the HIT input CSV of the output table, see write_mturk_csv.py
+#Which rows changed is read from the changed_data.csv written by
+#detecting_changes_in_airtable_downloads/detect_changes.py: rows created or
+#updated are scraped again, and rows deleted are kept in the output table as
+#tombstones (deleted is True and every field empty), so later stages know they
+#are gone. Without a changed_data.csv, or on the first run, only ids that aren't
+#in the output table yet are scraped, and ids no longer in the export become tombstones.
+#Rows are keyed on the export's id column. An export without one is keyed on the
+#canonical urls of each row (see canonical.row_keys, which detect_changes.py
+#--fingerprint keys it with too), never on its row number, which would give the
+#rows after a removed or moved one the records of other papers.
+#Each stage's output is cached in .pipeline_cache/<stage>/ under a hash of its
+#input files and configuration. A stage whose inputs haven't changed is copied
+#from the cache instead of being run, so a rerun on the same data does nothing.
+#
+#Usage:
+#   python pipeline.py airtable_papers.csv --changes detecting_changes_in_airtable_downloads/changed_data.csv
+#   python pipeline.py airtable_papers.csv --table 'Colleen and Alex'    (sync from Airtable first)
+import argparse
+import hashlib
+import json
+import pathlib
+import shutil
+
+import pandas as pd
+
+import canonical
+import clean_airtable
+import columnar
+import get_paper_info
+import publisher_resolver
+import retrieve_airtable
+import write_mturk_csv
+
+CACHE_DIR = '.pipeline_cache'
+#bump to make every cached stage output stale, e.g. after changing what a stage writes
+VERSION = 3
+#cached outputs kept for each stage, the least recently used are removed
+KEEP = 4
+CHUNK_SIZE = 1024 * 1024
+
+ID_COLUMN = 'id'
+#columns of the output table, one row per (id, url), or one tombstone row per deleted id
+COLUMNS = ['id', 'url', 'title', 'doi', 'abstract', 'full_doc_link', 'is_open_access', 'error', 'deleted']
+SCRAPED_OPERATIONS = {'created', 'updated'}
+DELETED = 'deleted'
+
+
+def file_hash(path):
+    # hash of a file's bytes, or of its absence
+    path = pathlib.Path(path)
+    if not path.exists():
+        return 'missing'
+    digest = hashlib.blake2b(digest_size=16)
+    with path.open('rb') as in_file:
+        for chunk in iter(lambda: in_file.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class StageCache(object):
+    def __init__(self, directory=CACHE_DIR, keep=KEEP):
+        '''
+        Output files of pipeline stages keyed by a hash of their inputs.
+
+        Parameters
+        directory : where the outputs are kept, <directory>/<stage>/<key>/
+        keep : outputs kept for each stage
+        '''
+        self.directory = pathlib.Path(directory)
+        self.keep = keep
+
+    def key(self, stage, inputs, config):
+        # hash of the stage, the contents of every input file and the configuration
+        description = {'stage': stage, 'version': VERSION, 'config': config,
+                       'inputs': [file_hash(path) for path in inputs]}
+        return hashlib.blake2b(json.dumps(description, sort_keys=True, default=str).encode('utf-8'),
+                               digest_size=16).hexdigest()
+
+    def restore(self, stage, key):
+        # copy a cached output back to where the stage wrote it, returns its paths, None if it isn't cached
+        entry = self.directory / stage / key
+        manifest_path = entry / 'outputs.json'
+        if not manifest_path.exists():
+            return None
+        outputs = json.loads(manifest_path.read_text())
+        for i, path in enumerate(outputs):
+            pathlib.Path(path).parent.mkdir(parents=True, exist_ok=True)
+            copy(entry / str(i), path)
+        #restoring an entry counts as using it
+        manifest_path.touch()
+        return outputs
+
+    def store(self, stage, key, outputs):
+        entry = self.directory / stage / key
+        tmp_entry = entry.with_name(key + '.tmp')
+        shutil.rmtree(tmp_entry, ignore_errors=True)
+        tmp_entry.mkdir(parents=True)
+        for i, path in enumerate(outputs):
+            copy(path, tmp_entry / str(i))
+        (tmp_entry / 'outputs.json').write_text(json.dumps([str(path) for path in outputs]))
+        shutil.rmtree(entry, ignore_errors=True)
+        tmp_entry.rename(entry)
+        self.evict(stage)
+
+    def evict(self, stage):
+        entries = [entry for entry in (self.directory / stage).iterdir() if (entry / 'outputs.json').exists()]
+        entries.sort(key=lambda entry: (entry / 'outputs.json').stat().st_mtime, reverse=True)
+        for entry in entries[self.keep:]:
+            shutil.rmtree(entry, ignore_errors=True)
+
+    def run(self, stage, inputs, config, func):
+        '''
+        Runs func(), which returns the paths of the files it wrote, unless the
+        stage already ran on the same inputs and config. Returns (paths of the
+        outputs, True if they came from the cache).
+        A stage may write one of its own inputs, like the scraping stage merging
+        into the output table. Its outputs are then stored under the key of the
+        inputs it leaves behind as well, so running it again changes nothing.
+        '''
+        key = self.key(stage, inputs, config)
+        outputs = self.restore(stage, key)
+        if outputs is not None:
+            return outputs, True
+        outputs = [str(path) for path in func()]
+        self.store(stage, key, outputs)
+        after = self.key(stage, inputs, config)
+        if after != key:
+            self.store(stage, after, outputs)
+        return outputs, False
+
+
+def copy(source, destination):
+    # a directory, e.g. a Parquet dataset, or a file
+    if pathlib.Path(source).is_dir():
+        shutil.rmtree(destination, ignore_errors=True)
+        shutil.copytree(source, destination)
+    else:
+        shutil.copyfile(source, destination)
+
+
+def read_table(path):
+    # an output table from CSV or Parquet, with the ids as strings
+    return columnar.read_columns(path).astype({ID_COLUMN: str})
+
+
+def write_table(df, path):
+    if pathlib.Path(path).suffix.lower() == '.csv':
+        df.to_csv(path, index=False)
+    else:
+        columnar.write_frame(df, path)
+
+
+def read_changes(path):
+    '''
+    Returns {id: last operation} from a changed_data.csv written by
+    detect_changes.py. Its header names the snapshot columns, and each row has
+    the operation after them, so only the first and last value of a row are used.
+    '''
+    try:
+        df = pd.read_csv(path, header=None, skiprows=1, dtype=str)
+    except (FileNotFoundError, pd.errors.EmptyDataError):
+        return {}
+    return dict(zip(df[0], df[df.columns[-1]]))
+
+
+def clean(export_csv, cleaned_path, url_column=clean_airtable.URL_COLUMN, id_column=ID_COLUMN):
+    '''
+    Writes the export with one row per URL to cleaned_path. Exports without an
+    id column are keyed on the canonical urls of each row, see
+    canonical.row_keys, so a row keeps its id when other rows are removed or
+    reordered, and every URL of a row has the row's id.
+    '''
+    df = pd.read_csv(export_csv, dtype={id_column: str}, encoding='utf-8-sig')
+    if id_column not in df.columns:
+        #keyed before rows without a URL are dropped, like the change detection does
+        df[id_column] = canonical.row_keys(df[url_column])
+    df = df[df[url_column].notna()]
+    df = clean_airtable.clean_multiple_urls(df, url_column)
+    urls = df[url_column].str.strip()
+    ids = df[id_column].astype(str)
+    df = pd.DataFrame({ID_COLUMN: ids, 'url': urls}).drop_duplicates()
+    write_table(df.reset_index(drop=True), cleaned_path)
+    return [cleaned_path]
+
+
+def scrape(cleaned_path, output_path, changes, publishers=None, concurrency=8, fetcher=None):
+    '''
+    Scrapes the rows of the cleaned table that are new or changed and merges
+    them into the output table, replacing the rows those ids had. Ids deleted
+    in changes, and ids of the output table that are no longer in the cleaned
+    table, become tombstones. Returns the number of urls scraped.
+
+    Parameters
+    cleaned_path : table from clean
+    output_path : output table, read if it exists and written again
+    changes : {id: operation} from read_changes
+    publishers : publishers to scrape, the others are skipped, defaults to
+        every publisher get_paper_info has a class for
+    concurrency : pages downloaded at the same time
+    fetcher : Fetcher to download with instead of one using the on-disk cache
+    '''
+    cleaned = read_table(cleaned_path)
+    exported = set(cleaned[ID_COLUMN])
+    publishers = set(publishers or get_paper_info.paper_info_classes)
+    cleaned = cleaned[publisher_resolver.classify(cleaned['url']).isin(publishers).to_numpy()]
+
+    if pathlib.Path(output_path).exists():
+        previous = read_table(output_path)
+    else:
+        previous = pd.DataFrame({column: pd.Series(dtype=object) for column in COLUMNS})
+    #tombstoned ids count as unknown, so an id that comes back is scraped again
+    known = set(previous.loc[~previous['deleted'].astype(bool), ID_COLUMN])
+    rescrape = {id_ for id_, operation in changes.items() if operation in SCRAPED_OPERATIONS}
+    #ids gone from the export are deleted whether or not changes says so
+    deleted = {id_ for id_, operation in changes.items() if operation == DELETED} | (known - exported)
+    #ids without a row yet are scraped too, which is every id on the first run
+    to_scrape = cleaned[cleaned[ID_COLUMN].isin(rescrape | (set(cleaned[ID_COLUMN]) - known))
+                        & ~cleaned[ID_COLUMN].isin(deleted)]
+
+    urls = list(dict.fromkeys(to_scrape['url']))
+    results = {}
+    for url, result in get_paper_info.iter_paper_info(urls, concurrency=concurrency, fetcher=fetcher):
+        if isinstance(result, Exception):
+            results[url] = dict(dict.fromkeys(get_paper_info.PaperRecord._fields), error=repr(result))
+        else:
+            results[url] = dict(result._asdict(), error=None)
+    scraped = pd.DataFrame([dict(results[url], id=id_, url=url, deleted=False)
+                            for id_, url in zip(to_scrape[ID_COLUMN], to_scrape['url'])], columns=COLUMNS)
+    tombstones = pd.DataFrame({ID_COLUMN: sorted(deleted), 'deleted': True}, columns=COLUMNS)
+
+    replaced = set(to_scrape[ID_COLUMN]) | deleted
+    kept = previous[~previous[ID_COLUMN].isin(replaced)]
+    merged = pd.concat([frame for frame in [kept, scraped, tombstones] if len(frame)], ignore_index=True)
+    merged = merged.reindex(columns=COLUMNS).astype({'deleted': bool, 'is_open_access': object})
+    write_table(merged, output_path)
+    return len(urls)
+
+
+def records_of(output_path):
+    # (url, PaperRecord) of every row of the output table that was scraped and isn't deleted
+    df = read_table(output_path)
+    df = df[~df['deleted'].astype(bool) & df['error'].isna()]
+    for row in df.itertuples(index=False):
+        yield row.url, get_paper_info.PaperRecord(row.title, row.doi, row.abstract, row.full_doc_link,
+                                                  row.is_open_access)
+
+
+def run(export_csv, output_path='papers.parquet', mturk_csv='mturk.csv', changes_path=None, table=None,
+        store_dir='airtable_store', url_column=clean_airtable.URL_COLUMN, id_column=ID_COLUMN, publishers=None,
+        concurrency=8, max_rows=None, cache_dir=CACHE_DIR, fetcher=None):
+    '''
+    Runs every stage, see the top of this file. Returns {stage: 'ran' or 'cached'}.
+
+    Parameters
+    export_csv : CSV export of the Airtable table, written first when table is given
+    output_path : output table, .parquet or .csv, merged with every run
+    mturk_csv : HIT input CSV written from the output table
+    changes_path : changed_data.csv from detect_changes.py, None to only scrape new ids
+    table : Airtable table to sync into store_dir and write to export_csv first
+    url_column, id_column : columns of the export holding the URLs and the record ids,
+        rows are keyed on their canonical url when the export has no id_column
+    publishers : publishers to scrape, see scrape
+    max_rows : most rows in each MTurk CSV file, see write_mturk_csv
+    cache_dir : directory of the stage cache
+    fetcher : Fetcher to download the pages with, e.g. a replay.replay_fetcher()
+    '''
+    cache = StageCache(cache_dir)
+    status = {}
+
+    if table:
+        retrieve_airtable.sync(table, store_dir)
+        retrieve_airtable.read_store(store_dir, table).to_csv(export_csv, index=False)
+        status['retrieve'] = 'ran'
+
+    cleaned_path = pathlib.Path(cache_dir) / 'cleaned.parquet'
+    cleaned_path.parent.mkdir(parents=True, exist_ok=True)
+    _, cached = cache.run('clean', [export_csv], {'url_column': url_column, 'id_column': id_column},
+                          lambda: clean(export_csv, cleaned_path, url_column, id_column))
+    status['clean'] = 'cached' if cached else 'ran'
+
+    def scrape_stage():
+        changes = read_changes(changes_path) if changes_path else {}
+        scrape(cleaned_path, output_path, changes, publishers, concurrency, fetcher)
+        return [output_path]
+
+    #the output table is an input of the scraping stage as well as its output
+    inputs = [cleaned_path, output_path] + ([changes_path] if changes_path else [])
+    _, cached = cache.run('scrape', inputs,
+                          {'publishers': sorted(publishers or get_paper_info.paper_info_classes)}, scrape_stage)
+    status['scrape'] = 'cached' if cached else 'ran'
+
+    _, cached = cache.run('mturk', [output_path], {'max_rows': max_rows},
+                          lambda: write_mturk_csv.write_mturk_csv(records_of(output_path), mturk_csv,
+                                                                  max_rows=max_rows)['files'])
+    status['mturk'] = 'cached' if cached else 'ran'
+    return status
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the pipeline on the rows that changed since the last run')
+    parser.add_argument('export_csv', help='CSV export of the Airtable table, e.g. airtable_papers.csv')
+    parser.add_argument('--changes', default=None, help='changed_data.csv from detect_changes.py')
+    parser.add_argument('--table', default=None, help='sync this Airtable table into the export first')
+    parser.add_argument('--output', default='papers.parquet', help='output table, .parquet or .csv')
+    parser.add_argument('--mturk', default='mturk.csv', help='HIT input CSV for MTurk')
+    parser.add_argument('--url-column', default=clean_airtable.URL_COLUMN, help='column of the export holding the URLs')
+    parser.add_argument('--id-column', default=ID_COLUMN, help='column of the export holding the record ids')
+    parser.add_argument('--concurrency', type=int, default=8, help='number of pages to download at the same time')
+    parser.add_argument('--max-rows', type=int, default=None, help='split the MTurk CSV into files of this many rows')
+    parser.add_argument('--cache-dir', default=CACHE_DIR, help='directory of the stage cache')
+    args = parser.parse_args()
+
+    status = run(args.export_csv, args.output, args.mturk, args.changes, args.table, url_column=args.url_column,
+                 id_column=args.id_column, concurrency=args.concurrency, max_rows=args.max_rows,
+                 cache_dir=args.cache_dir)
+    for stage, how in status.items():
+        print('%-8s %s' % (stage, how))
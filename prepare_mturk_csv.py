@@ -13,17 +13,37 @@ parser.add_argument('input_csv', type=str, help='CSV file from Airtable')
 
 parser.add_argument('output_csv', type=str, help='CSV file for ML')
 
-args = parser.parse_args(sys.argv)  # sys.argv is used if argv parameter is None
+parser.add_argument('--concurrency', type=int, default=8, help='number of pages to download at the same time')
+
+parser.add_argument('--max-rows', type=int, default=None, help='split the output into CSV files of at most this many rows')
+
+parser.add_argument('--max-bytes', type=int, default=None, help='split the output into CSV files of at most this many bytes')
+
+parser.add_argument('--preview', type=int, default=0, help='number of HITs to render with mturk_template.html')
+
+args = parser.parse_args(sys.argv[1:])
 input_csv_filename = args.input_csv
 output_csv_filename = args.output_csv
 
 urls = get_urls.get_urls(input_csv_filename)
 
-info_on_papers = []
-for url in urls:
-    
-    title, doi, abstract, full_doc_link, is_open_access = get_paper_info.get_paper_info(url)
-    info_on_papers.append((title, doi, abstract, full_doc_link, is_open_access))
 
-write_mturk_csv.write_mturk_csv(info_on_papers, output_csv_filename)
+failed = []
+
+
+def info_on_papers():
+    # (url, PaperRecord) of each paper as it is scraped, each page is dropped once its fields are extracted
+    # a paper that fails is reported and left out, like batch_runner does, instead of stopping the batch
+    for url, result in get_paper_info.iter_paper_info(urls, concurrency=args.concurrency):
+        if isinstance(result, Exception):
+            print('failed %s: %r' % (url, result), file=sys.stderr)
+            failed.append(url)
+            continue
+        yield url, result
+
+
+summary = write_mturk_csv.write_mturk_csv(info_on_papers(), output_csv_filename, max_rows=args.max_rows,
+                                          max_bytes=args.max_bytes, preview=args.preview)
+print('%d HITs in %s, %d papers skipped without a title, abstract or link, %d failed'
+      % (summary['rows'], ', '.join(summary['files']), summary['skipped'], len(failed)))
 
@@ -0,0 +1,131 @@
+#Works out which publisher a paper's URL is from, as the key used in
+#extraction_specs/ and get_paper_info.paper_info_classes, e.g. 'pnas'.
+#Hosts are matched on their domain suffixes against DOMAINS, so
+#'www.pnas.org', 'pnas.org' and 'm.pnas.org' all find 'pnas.org'. Links to
+#doi.org are resolved from the publisher's DOI prefix, without a request.
+#Hosts serving several sites, like www.ncbi.nlm.nih.gov, are matched on the
+#start of the path as well, against PATH_PREFIXES.
+#URLs from other publishers resolve to None
+import functools
+import re
+from urllib.parse import unquote, urlsplit
+
+import pandas as pd
+
+#registered domain (or a more specific host under it) -> publisher
+DOMAINS = {
+    'pnas.org': 'pnas',
+    'pubmed.ncbi.nlm.nih.gov': 'pubmed',
+    'nature.com': 'nature',
+    'jeb.biologists.org': 'jeb',
+    'springer.com': 'springer',
+    'royalsocietypublishing.org': 'rsp',
+    'sciencedirect.com': 'sciencedirect',
+    'wiley.com': 'wiley',
+}
+
+#domain shared by several sites -> [(path prefix, publisher)], used for hosts DOMAINS doesn't know,
+#e.g. the legacy PubMed links https://www.ncbi.nlm.nih.gov/pubmed/19113150
+PATH_PREFIXES = {
+    'ncbi.nlm.nih.gov': [('/pubmed/', 'pubmed')],
+}
+
+#DOI registrant prefix -> publisher
+DOI_PREFIXES = {
+    '10.1073': 'pnas',
+    '10.1038': 'nature',
+    '10.1242': 'jeb',
+    '10.1007': 'springer',
+    '10.1098': 'rsp',
+    '10.1016': 'sciencedirect',
+    '10.1002': 'wiley',
+    '10.1111': 'wiley',
+}
+
+DOI_HOSTS = {'doi.org', 'dx.doi.org', 'www.doi.org'}
+
+HOST_PATTERN = r'^\s*(?:[A-Za-z][A-Za-z0-9+.-]*:)?//(?:[^@/?#\s]*@)?([^/?#:\s]+)'
+DOI_PREFIX_PATTERN = r'(10\.\d{4,9})(?:/|%2[Ff])'
+DOI_PREFIX = re.compile(DOI_PREFIX_PATTERN)
+
+
+@functools.lru_cache(maxsize=4096)
+def from_host(host):
+    # given a host, e.g. 'www.pnas.org', return its publisher, e.g. 'pnas'
+    labels = host.lower().rstrip('.').split('.')
+    #most specific suffix first: 'www.pnas.org', then 'pnas.org', then 'org'
+    for i in range(len(labels)):
+        publisher = DOMAINS.get('.'.join(labels[i:]))
+        if publisher is not None:
+            return publisher
+    return None
+
+
+@functools.lru_cache(maxsize=4096)
+def shared_domain(host):
+    # the domain of PATH_PREFIXES a host is under, e.g. 'ncbi.nlm.nih.gov' for 'www.ncbi.nlm.nih.gov'
+    labels = host.lower().rstrip('.').split('.')
+    for i in range(len(labels)):
+        if '.'.join(labels[i:]) in PATH_PREFIXES:
+            return '.'.join(labels[i:])
+    return None
+
+
+def from_path(domain, path):
+    # given a domain of PATH_PREFIXES and the path of a url on it, return the publisher
+    for prefix, publisher in PATH_PREFIXES[domain]:
+        if path.startswith(prefix):
+            return publisher
+    return None
+
+
+def from_doi(doi_or_link):
+    # given a DOI, or a link with one in it, return the publisher that registered it
+    match = DOI_PREFIX.search(doi_or_link)
+    return DOI_PREFIXES.get(match.group(1)) if match else None
+
+
+def resolve(url):
+    '''
+    Returns the publisher of a single url, e.g. 'pnas', or None if it is
+    not from one of the publishers in DOMAINS.
+
+    Parameters
+    url : string url of the paper, or a doi.org link to it
+    '''
+    parts = urlsplit(url.strip())
+    host = (parts.hostname or '').lower()
+    if host in DOI_HOSTS:
+        return from_doi(unquote(parts.path))
+    publisher = from_host(host)
+    if publisher is None and shared_domain(host) is not None:
+        return from_path(shared_domain(host), parts.path)
+    return publisher
+
+
+def classify(urls):
+    '''
+    Returns the publisher of every url in a column as a Series with the same
+    index, None where the publisher isn't known.
+
+    Hosts are pulled out of the whole column with one regular expression and
+    each distinct host is only looked up once.
+
+    Parameters
+    urls : pandas Series (or list) of urls
+    '''
+    urls = pd.Series(urls, dtype=object)
+    hosts = urls.str.extract(HOST_PATTERN, expand=False).str.lower()
+    publishers = hosts.map({host: from_host(host) for host in hosts.dropna().unique()})
+
+    is_doi = hosts.isin(DOI_HOSTS)
+    if is_doi.any():
+        prefixes = urls[is_doi].str.extract(DOI_PREFIX_PATTERN, expand=False)
+        publishers[is_doi] = prefixes.map(DOI_PREFIXES)
+
+    #the few urls on a shared host are resolved one at a time, by their path
+    is_shared = hosts.map({host: shared_domain(host) is not None for host in hosts.dropna().unique()})
+    is_shared = is_shared.fillna(False).astype(bool) & publishers.isna()
+    if is_shared.any():
+        publishers[is_shared] = urls[is_shared].map(resolve)
+    return publishers.astype(object).where(publishers.notna(), None)
@@ -1,21 +1,13 @@
 #Run script but after filtering by publishers first
 import pandas as pd
-import get_paper_info
+import batch_runner
+import publisher_resolver
 
 df = pd.read_csv('airtable_papers.csv')
 df = df[df.URL.notnull()]
 
-def which_journal(row):
-    # given the url, what is the journal that it is from, e.g. 'pnas'
-    url = row['URL']
-    if 'www' in url:
-        publisher = url.split('.')[1]
-    else:
-        publisher = url.split('.')[0].split('//')[1]
-
-    return publisher
-
-df['publisher'] = df.apply(which_journal, axis=1)
+#publisher of every url in one pass, e.g. 'pnas', None for publishers we can't scrape
+df['publisher'] = publisher_resolver.classify(df['URL'])
 
 publishers = [
     'pnas',
@@ -32,14 +24,9 @@ df['URL'] = df.apply(lambda x: x['URL'].split()[0].strip(), axis=1)
 #need to clean urls for all papers, only take first one, and remove all text after last /, only numbers at end of url
 df.to_csv('filtered_papers.csv')
 filtered = pd.read_csv('filtered_papers.csv')
-urls = filtered['URL'].values
-info_on_papers = []
-for url in urls:
-    print(url)
-    try:
-        title, doi, abstract, full_doc_link, is_open_access = get_paper_info.get_paper_info(url)
-        info_on_papers.append((url, title, doi, abstract, full_doc_link, is_open_access))
-    except:
-        continue
-
-output = pd.DataFrame(info_on_papers, columns=['url', 'title', 'doi', 'abstract', 'full_doc_link', 'is_open_access']).to_csv('output.csv')
+urls = filtered['URL'].tolist()
+#each row is appended to output.csv as soon as it is ready, and finished or failed
+#urls are recorded in output.csv.checkpoint.jsonl, so rerunning picks up where it stopped.
+#Delete the checkpoint to start over. The time spent in each stage, per publisher,
+#is written to output.csv.metrics.json and output.csv.prom
+batch_runner.run(urls, 'output.csv', 'output.csv.checkpoint.jsonl', concurrency=8)
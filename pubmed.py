@@ -0,0 +1,233 @@
+#Bulk PubMed access through the NCBI E-utilities, instead of scraping one page per article.
+#PMIDs are sent in batches of BATCH_SIZE to
+#   efetch - the PubMed XML of each article, read with a streaming parser as it
+#            downloads, giving the title, DOI and abstract
+#   elink  - the "similar articles" (pubmed_pubmed neighbors) of each article
+#crawl_similar follows similar articles breadth first from some seed articles,
+#visiting each article once, up to a depth and a number of articles.
+#Requests go through a Fetcher whose scheduler keeps to NCBI's limit of 3
+#requests per second, or 10 with an API key in $NCBI_API_KEY
+#
+#Usage: python pubmed.py https://pubmed.ncbi.nlm.nih.gov/19113150/ --depth 1 --max-articles 50
+import argparse
+import os
+import re
+
+from lxml import etree
+
+import fetcher as fetching
+import scheduler as scheduling
+
+EUTILS_URL = 'https://eutils.ncbi.nlm.nih.gov/entrez/eutils/'
+#NCBI asks for POST and at most a few hundred ids per request
+BATCH_SIZE = 200
+REQUESTS_PER_SECOND = 3
+REQUESTS_PER_SECOND_WITH_KEY = 10
+TOOL = 'crowdsourcing_papers'
+
+#PDF of the free copy of an article in PubMed Central, by its PMCID, e.g. PMC2780017
+PMC_PDF_URL = 'https://www.ncbi.nlm.nih.gov/pmc/articles/%s/pdf/'
+
+#a PubMed article url, e.g. https://pubmed.ncbi.nlm.nih.gov/19113150/ or the legacy
+#https://www.ncbi.nlm.nih.gov/pubmed/19113150, or a link on a PubMed page, e.g. /19113150/
+PMID_PATTERN = re.compile(r'(?:pubmed\.ncbi\.nlm\.nih\.gov/|ncbi\.nlm\.nih\.gov/pubmed/|^/?(?:pubmed/)?)(\d+)/?(?:[?#]|$)')
+CHUNK_SIZE = 64 * 1024
+
+
+def pmid_from_url(url):
+    # given a PubMed url or a plain PMID, return the PMID as a string, None if there isn't one
+    match = PMID_PATTERN.search(url.strip())
+    return match.group(1) if match else None
+
+
+def eutils_fetcher(api_key=None):
+    # Fetcher sending one request at a time, at the rate NCBI allows
+    rate = REQUESTS_PER_SECOND_WITH_KEY if api_key else REQUESTS_PER_SECOND
+    return fetching.Fetcher(concurrency=1, per_host=1, cache=None,
+                            scheduler=scheduling.Scheduler(max_concurrency=1, rate=rate, burst=1))
+
+
+def batches(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def unique(ids):
+    # ids as strings without repeats, in order
+    return list(dict.fromkeys(str(pmid) for pmid in ids))
+
+
+class EUtils(object):
+    def __init__(self, fetcher=None, eutils_url=EUTILS_URL, api_key=None, batch_size=BATCH_SIZE):
+        '''
+        Parameters
+        fetcher : Fetcher the requests are sent with, defaults to one keeping to NCBI's rate limit
+        eutils_url : base url of the E-utilities, changed in the tests
+        api_key : NCBI API key, defaults to $NCBI_API_KEY
+        batch_size : PMIDs per request
+        '''
+        self.api_key = api_key if api_key is not None else os.environ.get('NCBI_API_KEY')
+        self.fetcher = fetcher or eutils_fetcher(self.api_key)
+        self.eutils_url = eutils_url
+        self.batch_size = batch_size
+
+    def close(self):
+        self.fetcher.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def post(self, utility, params, tag):
+        '''
+        POSTs params to an E-utility, e.g. 'efetch.fcgi', and yields every
+        element called tag in the XML response as soon as it has been read.
+        Each element is cleared once the caller moves on, so memory stays flat.
+        '''
+        params = dict(params, tool=TOOL)
+        if self.api_key:
+            params['api_key'] = self.api_key
+        r = self.fetcher.download(self.eutils_url + utility, method='POST', data=params, stream=True)
+        r.raise_for_status()
+
+        parser = etree.XMLPullParser(events=('end',), tag=tag, resolve_entities=False, no_network=True)
+        try:
+            for chunk in r.iter_content(CHUNK_SIZE):
+                parser.feed(chunk)
+                for _, element in parser.read_events():
+                    yield element
+                    element.clear()
+                    #drop the elements already handled, which clear() leaves behind empty
+                    while element.getprevious() is not None:
+                        del element.getparent()[0]
+            parser.close()
+            for _, element in parser.read_events():
+                yield element
+        finally:
+            r.close()
+
+    def fetch_articles(self, pmids):
+        '''
+        Returns {pmid: {'pmid', 'title', 'doi', 'abstract', 'pmc'}} for every PMID
+        that PubMed knows, with batch_size PMIDs per efetch request. 'pmc' is the
+        PMCID of the article's free copy in PubMed Central, '' if it has none.
+
+        Parameters
+        pmids : PMIDs as strings or ints, repeats are only fetched once
+        '''
+        articles = {}
+        for batch in batches(unique(pmids), self.batch_size):
+            params = {'db': 'pubmed', 'retmode': 'xml', 'id': ','.join(batch)}
+            for element in self.post('efetch.fcgi', params, 'PubmedArticle'):
+                article = parse_article(element)
+                articles[article['pmid']] = article
+        return articles
+
+    def similar(self, pmids):
+        '''
+        Returns {pmid: [similar PMIDs, most similar first]}, with batch_size
+        PMIDs per elink request.
+        '''
+        links = {}
+        for batch in batches(unique(pmids), self.batch_size):
+            #one id parameter per PMID, so that elink answers with a LinkSet for each of them
+            params = {'dbfrom': 'pubmed', 'db': 'pubmed', 'linkname': 'pubmed_pubmed',
+                      'cmd': 'neighbor', 'id': batch}
+            for element in self.post('elink.fcgi', params, 'LinkSet'):
+                pmid = element.findtext('IdList/Id')
+                similar = element.xpath('LinkSetDb[LinkName="pubmed_pubmed"]/Link/Id/text()')
+                #PubMed lists every article as the most similar to itself
+                links[pmid] = [str(other) for other in similar if other != pmid]
+        return links
+
+    def crawl_similar(self, seeds, max_depth=1, max_articles=100, per_article=None):
+        '''
+        Follows similar articles breadth first from seeds, asking for the
+        similar articles of a whole level of the crawl at once. Returns
+        {pmid: depth} of every article reached, seeds at depth 0, in the order
+        they were reached.
+
+        Parameters
+        seeds : PMIDs to start from
+        max_depth : levels of similar articles to follow
+        max_articles : stop once this many articles (seeds included) were reached
+        per_article : follow only this many of the most similar articles of each one, None for all
+        '''
+        depths = {}
+        for pmid in unique(seeds)[:max_articles]:
+            depths[pmid] = 0
+        level = list(depths)
+        for depth in range(1, max_depth + 1):
+            if not level or len(depths) >= max_articles:
+                break
+            links = self.similar(level)
+            next_level = []
+            for pmid in level:
+                for other in links.get(pmid, [])[:per_article]:
+                    if other in depths:
+                        continue
+                    if len(depths) >= max_articles:
+                        return depths
+                    depths[other] = depth
+                    next_level.append(other)
+            level = next_level
+        return depths
+
+
+def parse_article(element):
+    # title, DOI, abstract and PMCID of a <PubmedArticle> element
+    citation = element.find('MedlineCitation')
+    article = citation.find('Article')
+    title = article.find('ArticleTitle')
+    title = ''.join(title.itertext()).strip() if title is not None else ''
+
+    doi = element.xpath('string(PubmedData/ArticleIdList/ArticleId[@IdType="doi"])').strip()
+    if not doi:
+        doi = article.xpath('string(ELocationID[@EIdType="doi"])').strip()
+    pmc = element.xpath('string(PubmedData/ArticleIdList/ArticleId[@IdType="pmc"])').strip()
+
+    #structured abstracts have several parts, each with a label such as "METHODS"
+    parts = []
+    for abstract_text in article.findall('Abstract/AbstractText'):
+        part = ''.join(abstract_text.itertext()).strip()
+        label = abstract_text.get('Label')
+        parts.append('%s: %s' % (label, part) if label else part)
+
+    return {'pmid': citation.findtext('PMID'), 'title': title, 'doi': doi, 'abstract': ' '.join(parts), 'pmc': pmc}
+
+
+def paper_info_many(urls, eutils=None):
+    '''
+    Title, DOI and abstract of many PubMed urls, with a request for every
+    BATCH_SIZE articles instead of one for each page. Returns {url: article}
+    for the urls PubMed knows, see EUtils.fetch_articles.
+    get_paper_info.iter_paper_info looks up the PubMed urls it is given this way.
+    '''
+    pmids = {url: pmid_from_url(url) for url in urls}
+    own_eutils = eutils is None
+    eutils = eutils or EUtils()
+    try:
+        articles = eutils.fetch_articles(pmid for pmid in pmids.values() if pmid)
+    finally:
+        if own_eutils:
+            eutils.close()
+    return {url: articles[pmid] for url, pmid in pmids.items() if pmid in articles}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Crawl PubMed similar articles breadth first')
+    parser.add_argument('seeds', nargs='+', help='PubMed urls or PMIDs to start from')
+    parser.add_argument('--depth', type=int, default=1, help='levels of similar articles to follow')
+    parser.add_argument('--max-articles', type=int, default=100, help='stop after this many articles')
+    parser.add_argument('--per-article', type=int, default=None, help='most similar articles followed from each one')
+    args = parser.parse_args()
+
+    with EUtils() as eutils:
+        depths = eutils.crawl_similar([pmid_from_url(seed) for seed in args.seeds], args.depth,
+                                      args.max_articles, args.per_article)
+        articles = eutils.fetch_articles(depths)
+    for pmid, depth in depths.items():
+        article = articles.get(pmid, {})
+        print('%d\t%s\t%s\t%s' % (depth, pmid, article.get('doi', ''), article.get('title', '')))
@@ -0,0 +1,156 @@
+#Replays recorded responses from fixtures/ instead of going to the network.
+#fixtures/manifest.json maps each recorded url to the file holding its body, e.g.
+#   "https://www.nature.com/articles/s42004-019-0202-8": {"file": "pages/nature.html",
+#                                                         "content_type": "text/html; charset=utf-8"}
+#with an optional "status" and extra "headers". A ReplayAdapter mounted on a
+#requests session answers from the manifest and raises NotRecorded for any
+#url that wasn't recorded, so tests can never reach a real server.
+#
+#Usage:
+#   python replay.py record <url> <file>   download url into fixtures/<file> and add it to the manifest
+#   python replay.py list                  show the recorded urls
+import argparse
+import contextlib
+import io
+import json
+import pathlib
+import tempfile
+
+import requests
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+import fetcher as fetching
+import http_cache
+import open_access
+
+FIXTURES_DIR = pathlib.Path(__file__).parent / 'fixtures'
+MANIFEST = FIXTURES_DIR / 'manifest.json'
+
+
+class NotRecorded(requests.RequestException):
+    # a request for a url that isn't in the manifest. Unlike a ConnectionError
+    # the scheduler doesn't retry it
+    pass
+
+
+def load_manifest(path=MANIFEST):
+    # recorded url, normalized with http_cache.normalize_url -> its manifest entry
+    path = pathlib.Path(path)
+    if not path.exists():
+        return {}
+    manifest = json.loads(path.read_text(encoding='utf-8'))
+    return {http_cache.normalize_url(url): entry for url, entry in manifest.items()}
+
+
+class ReplayAdapter(BaseAdapter):
+    def __init__(self, manifest_path=MANIFEST):
+        '''
+        Transport adapter answering requests from recorded fixtures.
+
+        Parameters
+        manifest_path : manifest listing the recorded urls, bodies are read
+                        relative to its directory
+        '''
+        super(ReplayAdapter, self).__init__()
+        self.directory = pathlib.Path(manifest_path).parent
+        self.manifest = load_manifest(manifest_path)
+        self.requests_seen = []
+
+    def entry(self, url):
+        # manifest entry answering a request for url, None if it wasn't recorded
+        return self.manifest.get(http_cache.normalize_url(url))
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        self.requests_seen.append((request.method, request.url))
+        entry = self.entry(request.url)
+        if entry is None:
+            raise NotRecorded('No recorded response for %s' % request.url, request=request)
+
+        body = (self.directory / entry['file']).read_bytes() if 'file' in entry else b''
+        status = entry.get('status', 200)
+        headers = CaseInsensitiveDict(entry.get('headers', {}))
+        if 'content_type' in entry:
+            headers['Content-Type'] = entry['content_type']
+
+        #answer ranged GETs the way a server supporting them would
+        range_header = request.headers.get('Range', '')
+        if status == 200 and range_header.startswith('bytes='):
+            start, _, end = range_header[len('bytes='):].partition('-')
+            start, end = int(start or 0), min(int(end or len(body) - 1), len(body) - 1)
+            headers['Content-Range'] = 'bytes %d-%d/%d' % (start, end, len(body))
+            body, status = body[start:end + 1], 206
+        headers['Content-Length'] = str(len(body))
+
+        response = requests.Response()
+        response.status_code = status
+        response.reason = 'Partial Content' if status == 206 else 'Recorded'
+        response.headers = headers
+        response.encoding = get_encoding_from_headers(headers)
+        response.raw = io.BytesIO(b'' if request.method == 'HEAD' else body)
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        return response
+
+    def close(self):
+        pass
+
+
+def replay_fetcher(adapter=None):
+    # Fetcher without a cache whose session only talks to a ReplayAdapter
+    offline_fetcher = fetching.Fetcher(cache=None)
+    adapter = adapter or ReplayAdapter()
+    offline_fetcher.session.mount('http://', adapter)
+    offline_fetcher.session.mount('https://', adapter)
+    return offline_fetcher
+
+
+@contextlib.contextmanager
+def replaying(manifest_path=MANIFEST):
+    '''
+    Within the block, the default fetcher answers from the recorded fixtures,
+    and open access probes use an empty cache in a temporary directory, so
+    nothing is read from or written to the real caches. Yields the ReplayAdapter.
+    '''
+    adapter = ReplayAdapter(manifest_path)
+    old_fetcher, old_cache = fetching.default_fetcher, open_access.default_cache
+    with tempfile.TemporaryDirectory() as tmp_dir, replay_fetcher(adapter) as offline_fetcher:
+        fetching.default_fetcher = offline_fetcher
+        open_access.default_cache = open_access.ProbeCache(pathlib.Path(tmp_dir) / 'open_access.jsonl')
+        try:
+            yield adapter
+        finally:
+            fetching.default_fetcher, open_access.default_cache = old_fetcher, old_cache
+
+
+def record(url, file, manifest_path=MANIFEST):
+    # download url from the live site into file, relative to the manifest, and add it to the manifest
+    with fetching.Fetcher(cache=None) as live_fetcher:
+        r = live_fetcher.get(url)
+    r.raise_for_status()
+    directory = pathlib.Path(manifest_path).parent
+    (directory / file).parent.mkdir(parents=True, exist_ok=True)
+    (directory / file).write_bytes(r.content)
+
+    manifest_path = pathlib.Path(manifest_path)
+    manifest = json.loads(manifest_path.read_text(encoding='utf-8')) if manifest_path.exists() else {}
+    manifest[url] = {'file': file, 'content_type': r.headers.get('Content-Type', 'text/html; charset=utf-8')}
+    manifest_path.write_text(json.dumps(manifest, indent=2, ensure_ascii=False) + '\n', encoding='utf-8')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Record or list the fixtures used by the offline tests')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    record_parser = subparsers.add_parser('record', help='download a url into the fixtures')
+    record_parser.add_argument('url')
+    record_parser.add_argument('file', help='path under fixtures/, e.g. pages/nature.html')
+    subparsers.add_parser('list', help='show the recorded urls')
+    args = parser.parse_args()
+
+    if args.command == 'record':
+        record(args.url, args.file)
+    else:
+        for url, entry in json.loads(MANIFEST.read_text(encoding='utf-8')).items():
+            print('%-70s %s' % (url, entry.get('file', entry.get('status'))))
@@ -1,42 +1,269 @@
-import requests
+#Downloads tables from Airtable.
+#`retrieve_airtable_data` downloads a whole table into a DataFrame.
+#`sync` keeps a local copy of a table in `<store_dir>/<table>.jsonl` up to date:
+#after the first full download it only asks Airtable for records modified since
+#the last sync and merges them into the local copy. Pages are written to disk as
+#they arrive, and every request goes through a shared RateLimiter that stays
+#under Airtable's limit of 5 requests per second and slows down on 429s.
+#The API key is read from the AIRTABLE_API_KEY environment variable
+#
+#Usage:
+#   python retrieve_airtable.py ['Colleen and Alex' ...] [--full] [--store airtable_store]
+import argparse
+import datetime
+import json
+import os
+import pathlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote, unquote
+
 import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
 
 # table = 'Papers%20for%20Labelling%20v3'
 table = 'Colleen%20and%20Alex'
 
-def retrieve_airtable_data(table):
+BASE_ID = 'appmifYhoEdnfPIbU'
+API_URL = 'https://api.airtable.com/v0'
+PAGE_SIZE = 100
+
+#Airtable allows 5 requests per second per base, and asks clients that go over
+#it to wait 30 seconds
+REQUESTS_PER_SECOND = 5
+RATE_LIMIT_WAIT = 30
+MAX_RETRIES = 5
+
+#records modified while a sync is running may be missed by its filter, so the
+#next sync asks for everything modified from a little before this one started
+OVERLAP = datetime.timedelta(minutes=5)
+
+
+class RateLimiter(object):
+    def __init__(self, rate=REQUESTS_PER_SECOND):
+        '''
+        Spaces out requests shared by any number of threads.
+
+        Parameters
+        rate : requests per second allowed while the server isn't complaining
+        '''
+        self.min_interval = 1.0 / rate
+        self.interval = self.min_interval
+        self.next_time = 0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        # block until the next request may be sent
+        with self._lock:
+            now = time.monotonic()
+            send_at = max(now, self.next_time)
+            self.next_time = send_at + self.interval
+        time.sleep(send_at - now)
+
+    def backoff(self, seconds):
+        # after a 429 or server error: pause every thread and halve the rate
+        with self._lock:
+            self.interval = min(self.interval * 2, 1.0)
+            self.next_time = max(self.next_time, time.monotonic() + seconds)
+
+    def success(self):
+        # speed back up towards the allowed rate after a successful request
+        with self._lock:
+            self.interval = max(self.min_interval, self.interval * 0.9)
+
+
+def airtable_session(api_key=None):
+    # pooled keep-alive session that sends the API key with every request
+    api_key = api_key or os.environ.get('AIRTABLE_API_KEY')
+    if not api_key:
+        raise RuntimeError('Set AIRTABLE_API_KEY to your Airtable API key')
+    session = requests.Session()
+    session.headers['Authorization'] = 'Bearer %s' % api_key
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def table_url(table, api_url=API_URL, base_id=BASE_ID):
+    # table names may be given plain or already escaped, e.g. 'Colleen%20and%20Alex'
+    return '%s/%s/%s' % (api_url, base_id, quote(unquote(table)))
+
+
+def table_filename(table):
+    # 'Colleen%20and%20Alex' -> 'Colleen_and_Alex'
+    return unquote(table).replace(' ', '_')
+
+
+def retry_after(response):
+    try:
+        return float(response.headers['Retry-After'])
+    except (KeyError, ValueError):
+        return RATE_LIMIT_WAIT
+
+
+def iter_pages(session, url, params=None, limiter=None, timeout=30):
+    '''
+    Yields the list of records on each page of a table, following `offset`
+    until the last page.
+
+    Parameters
+    session : session from airtable_session
+    url : table url from table_url
+    params : extra query parameters, e.g. filterByFormula
+    limiter : RateLimiter shared by every request to the base
+    timeout : seconds to wait for Airtable before giving up
+    '''
+    limiter = limiter or RateLimiter()
+    params = dict(params or {}, pageSize=PAGE_SIZE)
+    retries = 0
+    while True:
+        limiter.wait()
+        r = session.get(url, params=params, timeout=timeout)
+        if r.status_code == 429 or r.status_code >= 500:
+            retries += 1
+            if retries > MAX_RETRIES:
+                r.raise_for_status()
+            limiter.backoff(retry_after(r) if r.status_code == 429 else 2 ** retries)
+            continue
+        r.raise_for_status()
+        limiter.success()
+        retries = 0
+
+        airtable_response = r.json()
+        yield airtable_response['records']
+        if 'offset' not in airtable_response:
+            return
+        params['offset'] = airtable_response['offset']
+
+
+def retrieve_airtable_data(table, api_key=None, api_url=API_URL, limiter=None):
     '''
     Uses airtable API key to request table data from airtable.
-    
+
     Parameters
     table : string name of the table
+    api_key : Airtable API key, defaults to $AIRTABLE_API_KEY
+    api_url : base of the Airtable API
+    limiter : RateLimiter to share with other downloads from the same base
     '''
-    api_key = 'XXXXX'
-    headers = {
-        "Authorization": "Bearer %s" % api_key,
-    }
-    
-    url = 'https://api.airtable.com/v0/appmifYhoEdnfPIbU/%s' % table
-    params = ()
-    airtable_records = []
-    run = True
-    while run:
-        response = requests.get(url, params=params, headers=headers)
-        airtable_response = response.json()
-        airtable_records += (airtable_response['records'])
-        if 'offset' in airtable_response:
-            run = True
-            params = (('offset', airtable_response['offset']),)
-        else:
-            run = False
-
-    airtable_rows = []
-    for record in airtable_records:
-        airtable_rows.append(record['fields'])
-    df = pd.DataFrame(airtable_rows)
-
-    return df
-#
-df = retrieve_airtable_data(table)
-table = table.replace('%20', '_')
-df.to_csv('%s.csv' % table)
\ No newline at end of file
+    with airtable_session(api_key) as session:
+        airtable_rows = []
+        for records in iter_pages(session, table_url(table, api_url), limiter=limiter):
+            airtable_rows += [record['fields'] for record in records]
+    return pd.DataFrame(airtable_rows)
+
+
+def modified_since_formula(timestamp):
+    # Airtable formula matching records modified after an ISO-8601 UTC timestamp
+    return "IS_AFTER(LAST_MODIFIED_TIME(), DATETIME_PARSE('%s'))" % timestamp
+
+
+def store_paths(store_dir, table):
+    # local copy of the table, its sync state, and the pages of the sync in progress
+    store_dir = pathlib.Path(store_dir)
+    name = table_filename(table)
+    return store_dir / (name + '.jsonl'), store_dir / (name + '.sync.json'), store_dir / (name + '.pages.jsonl')
+
+
+def merge_records(store_path, pages_path):
+    # replace records in the store with their new versions from pages_path and append
+    # new records. Only the downloaded records are held in memory
+    updates = {}
+    with open(pages_path) as in_file:
+        for line in in_file:
+            updates[json.loads(line)['id']] = line
+
+    tmp_path = store_path.with_name(store_path.name + '.tmp')
+    with open(store_path) as in_file, open(tmp_path, 'w') as out_file:
+        for line in in_file:
+            out_file.write(updates.pop(json.loads(line)['id'], line))
+        out_file.writelines(updates.values())
+    os.replace(tmp_path, store_path)
+    os.remove(pages_path)
+
+
+def sync(table, store_dir='airtable_store', full=False, session=None, limiter=None, api_url=API_URL):
+    '''
+    Brings the local copy of a table up to date and returns the number of
+    records downloaded.
+
+    Only records modified since the last sync are downloaded, unless there
+    is no local copy yet or `full` is True. Records deleted in Airtable are
+    only removed from the local copy by a full sync.
+
+    Parameters
+    table : string name of the table
+    store_dir : directory holding the local copies
+    full : download the whole table and replace the local copy
+    session : session from airtable_session, one is made if None
+    limiter : RateLimiter shared by every request to the base
+    api_url : base of the Airtable API
+    '''
+    pathlib.Path(store_dir).mkdir(parents=True, exist_ok=True)
+    store_path, state_path, pages_path = store_paths(store_dir, table)
+    incremental = not full and store_path.exists() and state_path.exists()
+
+    params = {}
+    if incremental:
+        state = json.loads(state_path.read_text())
+        params['filterByFormula'] = modified_since_formula(state['high_water_mark'])
+    started = datetime.datetime.now(datetime.timezone.utc)
+
+    own_session = session is None
+    session = session or airtable_session()
+    count = 0
+    try:
+        with open(pages_path, 'w') as out_file:
+            for records in iter_pages(session, table_url(table, api_url), params, limiter):
+                out_file.writelines(json.dumps(record) + '\n' for record in records)
+                count += len(records)
+    finally:
+        if own_session:
+            session.close()
+
+    if incremental:
+        merge_records(store_path, pages_path)
+    else:
+        os.replace(pages_path, store_path)
+
+    #only move the high-water mark once the records are safely in the store
+    high_water_mark = (started - OVERLAP).strftime('%Y-%m-%dT%H:%M:%S.000Z')
+    tmp_path = state_path.with_name(state_path.name + '.tmp')
+    tmp_path.write_text(json.dumps({'high_water_mark': high_water_mark}))
+    os.replace(tmp_path, state_path)
+    return count
+
+
+def sync_tables(tables, store_dir='airtable_store', full=False, api_key=None, api_url=API_URL):
+    # sync several tables of the base at once, sharing one session and rate limit
+    limiter = RateLimiter()
+    with airtable_session(api_key) as session, ThreadPoolExecutor(max_workers=len(tables) or 1) as executor:
+        futures = [executor.submit(sync, t, store_dir, full, session, limiter, api_url) for t in tables]
+        return [future.result() for future in futures]
+
+
+def read_store(store_dir, table):
+    # DataFrame of the fields of every record in the local copy of a table
+    store_path = store_paths(store_dir, table)[0]
+    with open(store_path) as in_file:
+        return pd.DataFrame([json.loads(line)['fields'] for line in in_file])
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(description='Sync Airtable tables and write each one to <table>.csv')
+    parser.add_argument('tables', nargs='*', default=[table], help='names of the tables to sync')
+    parser.add_argument('--full', action='store_true', help='download the whole tables again')
+    parser.add_argument('--store', default='airtable_store', help='directory for the local copies')
+    return parser.parse_args(args)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    counts = sync_tables(args.tables, args.store, full=args.full)
+    for name, count in zip(args.tables, counts):
+        print('%s: %d records downloaded' % (unquote(name), count))
+        df = read_store(args.store, name)
+        df.to_csv('%s.csv' % table_filename(name))
@@ -0,0 +1,243 @@
+#Per-host politeness for the Fetcher.
+#Every host gets its own HostState with
+#   - a token bucket, so requests to the host are spread out at `rate` per second
+#   - an adaptive limit on the number of requests in flight to the host
+#Both are adjusted AIMD style: after a run of good responses the limit grows by
+#one and the rate by RATE_STEP, and on a 429 or 503, or when responses become much
+#slower than usual, they are cut by a factor. A Retry-After header pauses the host,
+#for at most MAX_PAUSE seconds. A request asked to wait longer than that is given up.
+#Scheduler.send runs one request under these rules and retries 429s, 5xx and
+#connection errors a bounded number of times, waiting a random (jittered) time
+#that grows with every attempt
+import email.utils
+import random
+import threading
+import time
+
+import requests
+
+#requests per second to a host when a run starts, and the range it may move in
+DEFAULT_RATE = 10.0
+MIN_RATE = 0.2
+MAX_RATE = 50.0
+RATE_STEP = 1.0
+
+#statuses meaning the server wants us to slow down
+THROTTLE_STATUSES = {429, 503}
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+#responses slower than this many times the host's usual time count as a warning
+LATENCY_FACTOR = 3.0
+#and are ignored when they are still faster than this many seconds
+MIN_SLOW_LATENCY = 1.0
+
+MAX_RETRIES = 4
+BACKOFF_BASE = 1.0
+BACKOFF_CAP = 60.0
+#longest Retry-After that is waited for, a broken or hostile server could ask for a day
+MAX_PAUSE = BACKOFF_CAP
+
+
+def retry_after(response):
+    # seconds the server asked us to wait in Retry-After, or None
+    value = response.headers.get('Retry-After') if response is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff(attempt):
+    # "full jitter": a random wait between 0 and BACKOFF_BASE * 2**attempt, at most BACKOFF_CAP
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+
+class TokenBucket(object):
+    def __init__(self, rate, burst):
+        '''
+        Parameters
+        rate : tokens added per second
+        burst : most tokens the bucket holds, i.e. requests that may be sent at once
+        '''
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def reserve(self):
+        # take a token and return how many seconds to wait before using it.
+        # Not thread safe on its own, HostState calls it under its lock
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class HostState(object):
+    def __init__(self, max_concurrency, rate=DEFAULT_RATE, burst=None):
+        '''
+        Rate and concurrency control for one host.
+
+        Parameters
+        max_concurrency : most requests in flight to the host, the limit starts here
+        rate : requests per second allowed at the start
+        burst : requests that may be sent at once, defaults to rate
+        '''
+        self.max_concurrency = max_concurrency
+        self.limit = float(max_concurrency)
+        self.in_flight = 0
+        self.bucket = TokenBucket(rate, burst or max(1, rate))
+        self.paused_until = 0.0
+        self.latency = None
+        self.usual_latency = None
+        self.good = 0
+        #responses still to come from requests sent before the last decrease
+        self.cooldown = 0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        # wait for a free slot, the end of any pause and a token
+        with self._condition:
+            while True:
+                wait = self.paused_until - time.monotonic()
+                if wait <= 0 and self.in_flight < int(self.limit):
+                    break
+                self._condition.wait(wait if wait > 0 else None)
+            self.in_flight += 1
+            delay = self.bucket.reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+    def release(self, status=None, latency=None, pause=None):
+        '''
+        Frees the slot taken by acquire and adjusts the rate and limit.
+
+        Parameters
+        status : HTTP status of the response, None if the request failed
+        latency : seconds the response took
+        pause : seconds the server asked us to wait before the next request
+        '''
+        with self._condition:
+            self.in_flight -= 1
+            if pause:
+                self.paused_until = max(self.paused_until, time.monotonic() + pause)
+
+            if self.cooldown:
+                #this request was sent before the last decrease, so it says nothing new
+                self.cooldown -= 1
+            elif status in THROTTLE_STATUSES:
+                self.decrease(0.5)
+            elif status is not None and status < 500 and latency is not None:
+                if self.is_slow(latency):
+                    self.decrease(0.75, rate=False)
+                else:
+                    self.increase()
+            self._condition.notify_all()
+
+    def is_slow(self, latency):
+        # keep a moving average of the latency, and the lowest average seen as the usual one
+        self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+        self.usual_latency = self.latency if self.usual_latency is None else min(self.usual_latency, self.latency)
+        return self.latency > max(MIN_SLOW_LATENCY, LATENCY_FACTOR * self.usual_latency)
+
+    def increase(self):
+        # additive increase, once per `limit` good responses in a row
+        self.good += 1
+        if self.good >= self.limit:
+            self.good = 0
+            self.limit = min(self.max_concurrency, self.limit + 1)
+            self.bucket.rate = min(MAX_RATE, self.bucket.rate + RATE_STEP)
+
+    def decrease(self, factor, rate=True):
+        # multiplicative decrease of the limit, and of the rate unless only latency rose
+        self.good = 0
+        self.cooldown = self.in_flight
+        self.limit = max(1.0, self.limit * factor)
+        if rate:
+            self.bucket.rate = max(MIN_RATE, self.bucket.rate * factor)
+        self.latency = None
+
+
+class Scheduler(object):
+    def __init__(self, max_concurrency=2, rate=DEFAULT_RATE, burst=None, max_retries=MAX_RETRIES,
+                 retry_statuses=RETRY_STATUSES, max_pause=MAX_PAUSE):
+        '''
+        Parameters
+        max_concurrency : most requests in flight to any one host
+        rate : requests per second to each host at the start
+        burst : requests that may be sent to a host at once, defaults to rate
+        max_retries : retries of a request after a 429, 5xx or connection error
+        retry_statuses : statuses that are retried
+        max_pause : longest Retry-After waited for. A longer one pauses the host
+            for max_pause and the response is returned without a retry
+        '''
+        self.max_concurrency = max_concurrency
+        self.rate = rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self.retry_statuses = retry_statuses
+        self.max_pause = max_pause
+        self.hosts = {}
+        self._lock = threading.Lock()
+
+    def host(self, host):
+        # HostState of a host, e.g. 'www.pnas.org'
+        with self._lock:
+            if host not in self.hosts:
+                self.hosts[host] = HostState(self.max_concurrency, self.rate, self.burst)
+            return self.hosts[host]
+
+    def send(self, host, request):
+        '''
+        Calls request() when the host is ready for it, retrying when the
+        server is throttling us or fails. Returns the last response; raises the
+        last exception if every attempt failed with a connection error or timeout.
+        A response asking to wait longer than max_pause is returned at once.
+
+        Parameters
+        host : host the request goes to
+        request : function sending the request and returning a requests.Response
+        '''
+        state = self.host(host)
+        for attempt in range(self.max_retries + 1):
+            state.acquire()
+            start = time.monotonic()
+            try:
+                r = request()
+            except (requests.ConnectionError, requests.Timeout):
+                state.release()
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(backoff(attempt))
+                continue
+            except BaseException:
+                #any other error isn't retried, but its slot must still be freed
+                state.release()
+                raise
+
+            if r.status_code not in self.retry_statuses:
+                state.release(r.status_code, time.monotonic() - start)
+                return r
+
+            #a throttling server pauses every request to the host, other errors only delay this one
+            wait = retry_after(r)
+            give_up = wait is not None and wait > self.max_pause
+            if give_up:
+                wait = self.max_pause
+            if r.status_code in THROTTLE_STATUSES and wait is None:
+                wait = backoff(attempt)
+            state.release(r.status_code, time.monotonic() - start,
+                          pause=wait if r.status_code in THROTTLE_STATUSES else None)
+            if attempt == self.max_retries or give_up:
+                return r
+            r.close()
+            if r.status_code not in THROTTLE_STATUSES:
+                time.sleep(wait if wait is not None else backoff(attempt))
+        return r
@@ -1,20 +1,66 @@
-from selenium import webdriver
-from bs4 import BeautifulSoup
+#Fills in the Journal URL of papers from their ScienceDaily press releases.
+#ScienceDaily pages are rendered on the server, so the link in
+#<div id="journal_references"> is first read from a plain HTTP download of each
+#press release with a regular expression (or an lxml parse if the markup differs),
+#many at a time through a Fetcher. Only press releases where that finds nothing
+#are loaded in headless Chrome, on a browser_pool.BrowserPool. The column
+#"Resolved by" says how each row's Journal URL was found:
+#   table      - the row already had one, or has no ScienceDaily press release
+#   http       - read from the downloaded page
+#   browser    - read from the page loaded in Chrome
+#   unresolved - neither found a journal reference
+import argparse
+import html
+import re
+
 import pandas as pd
+from bs4 import BeautifulSoup
+
+import browser_pool
+import fetcher as fetching
+import http_cache
+import parsing
+
+#the first link inside the journal references div, without leaving the div
+JOURNAL_REFERENCE = re.compile(
+    r'''<div[^>]*\bid\s*=\s*["']journal_references["'][^>]*>(?:(?!</div>).)*?<a\s[^>]*?\bhref\s*=\s*["']([^"']+)["']''',
+    re.IGNORECASE | re.DOTALL)
+RESOLVED_BY = 'Resolved by'
+#press releases downloaded at the same time, and at most PER_HOST of them from sciencedaily.com
+CONCURRENCY = 16
+PER_HOST = 4
+
+
+def needs_journal_url(row):
+    # True for a row without a Journal URL whose press release is on ScienceDaily
+    press_release = row['Press release']
+    return pd.isnull(row['Journal URL']) and not pd.isnull(press_release) and 'sciencedaily' in press_release
+
 
-options = webdriver.ChromeOptions()
-options.add_argument('--ignore-certificate-errors')
-options.add_argument('--incognito')
-options.add_argument('--headless')
-driver = webdriver.Chrome('/Users/jerryqian/Downloads/chromedriver', options=options)
+def find_journal_reference(page):
+    # href of the link in <div id="journal_references"> of a press release page, None if it has none
+    match = JOURNAL_REFERENCE.search(page)
+    if match:
+        return html.unescape(match.group(1)).strip()
+    if 'journal_references' not in page:
+        return None
+    #the div is there but not as the pattern expects, so parse the page to be sure
+    journal_div = parsing.find(parsing.parse_html(page), 'div', id='journal_references')
+    links = journal_div.xpath('.//a/@href') if journal_div is not None else []
+    return links[0].strip() if links else None
 
 
-df = pd.read_csv('cleaned_papers_for_labeling.csv')
+def journal_url_over_http(press_release, fetcher=None):
+    # Journal URL read from a plain download of the press release, None if the page has no journal reference
+    r = (fetcher or fetching.default_fetcher).get(press_release)
+    r.raise_for_status()
+    return find_journal_reference(r.text)
 
-def science_daily_scraper(row):
+
+def science_daily_scraper(driver, row):
     url = row['Journal URL']
     press_release = row['Press release']
-    if pd.isnull(url) and not pd.isnull(press_release) and 'sciencedaily' in press_release:
+    if needs_journal_url(row):
         driver.get(press_release)
 
         page_source = driver.page_source
@@ -30,6 +76,74 @@ def science_daily_scraper(row):
             pass
     return url
 
-df['Journal URL'] = df.apply(science_daily_scraper, axis = 1)
 
-df.to_csv('scraped_papers_for_labeling.csv')
\ No newline at end of file
+def resolve_journal_urls(rows, fetcher=None, pool=None):
+    '''
+    Returns a list of (Journal URL, how it was found) for every row, in the
+    same order as rows, see the top of this file. A row that is unresolved
+    keeps the Journal URL it had.
+
+    Parameters
+    rows : dicts with 'Journal URL' and 'Press release' keys
+    fetcher : Fetcher the press releases are downloaded with, defaults to one
+        downloading CONCURRENCY at a time through the on-disk cache
+    pool : browser_pool.BrowserPool for the press releases the download didn't
+        resolve, defaults to one headless Chrome per core. It is only started
+        if some press release needs it
+    '''
+    rows = list(rows)
+    results = [(row['Journal URL'], 'table') for row in rows]
+    to_resolve = [i for i, row in enumerate(rows) if needs_journal_url(row)]
+
+    own_fetcher = fetcher is None
+    fetcher = fetcher or fetching.Fetcher(concurrency=CONCURRENCY, per_host=PER_HOST,
+                                          cache=http_cache.default_cache)
+    try:
+        found = fetcher.map(lambda i: journal_url_over_http(rows[i]['Press release'], fetcher), to_resolve,
+                            return_exceptions=True)
+    finally:
+        if own_fetcher:
+            fetcher.close()
+
+    #pages that failed to download or had no link are tried again in a browser,
+    #which runs any scripts the page needs
+    in_browser = []
+    for i, url in zip(to_resolve, found):
+        if isinstance(url, Exception) or not url:
+            in_browser.append(i)
+        else:
+            results[i] = (url, 'http')
+    if in_browser:
+        pool = pool or browser_pool.BrowserPool()
+        urls = pool.map(science_daily_scraper, [rows[i] for i in in_browser], return_exceptions=True)
+        for i, url in zip(in_browser, urls):
+            if isinstance(url, Exception) or pd.isnull(url):
+                results[i] = (rows[i]['Journal URL'], 'unresolved')
+            else:
+                results[i] = (url, 'browser')
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Find journal URLs from ScienceDaily press releases, '
+                                                 'with headless Chrome only for the pages a plain download cannot resolve')
+    parser.add_argument('--input', type=str, default='cleaned_papers_for_labeling.csv', help='CSV file with Journal URL and Press release columns')
+    parser.add_argument('--output', type=str, default='scraped_papers_for_labeling.csv', help='CSV file with the Journal URL column filled in')
+    parser.add_argument('--concurrency', type=int, default=CONCURRENCY, help='press releases downloaded at the same time')
+    parser.add_argument('--per-host', type=int, default=PER_HOST, help='most downloads in flight to sciencedaily.com')
+    parser.add_argument('--browsers', type=int, default=None, help='number of browsers, defaults to the number of cores')
+    parser.add_argument('--chromedriver', type=str, default=None, help='path to chromedriver, defaults to $CHROMEDRIVER_PATH')
+    args = parser.parse_args()
+
+    df = pd.read_csv(args.input)
+    rows = df.to_dict('records')
+
+    pool = browser_pool.BrowserPool(args.browsers, driver_factory=lambda: browser_pool.chrome_driver(args.chromedriver))
+    with fetching.Fetcher(concurrency=args.concurrency, per_host=args.per_host,
+                          cache=http_cache.default_cache) as press_fetcher:
+        results = resolve_journal_urls(rows, press_fetcher, pool)
+
+    df['Journal URL'] = [url for url, _ in results]
+    df[RESOLVED_BY] = [resolved_by for _, resolved_by in results]
+    df.to_csv(args.output)
+    print(df[RESOLVED_BY].value_counts().to_string())
@@ -1,19 +1,12 @@
-from selenium import webdriver
-from bs4 import BeautifulSoup
 import pandas as pd
-import re
+import argparse
 
-options = webdriver.ChromeOptions()
-options.add_argument('--ignore-certificate-errors')
-options.add_argument('--incognito')
-options.add_argument('--headless')
-path_to_driver = '/Users/jerryqian/Downloads/chromedriver'
-driver = webdriver.Chrome(path_to_driver, options=options)
+import browser_pool
+import columnar
+import doi_extract
 
-filename = 'Colleen and Alex-Grid view.csv'
-df = pd.read_csv(filename)
 
-def doi_scraper(row):
+def doi_scraper(driver, row):
     url = row['Primary lit site']
     doi = row['DOI']
     print('url: ', url)
@@ -22,32 +15,30 @@ def doi_scraper(row):
 
         page_source = driver.page_source
 
-        soup = BeautifulSoup(page_source, 'lxml')
-
-        doi = ''
-
-        #Pulling first DOI from href
-        try:
-            for a in soup.find_all('a', href=True):
-                link = a['href']
-                if 'doi.org' in link:
-                    doi = link.split('doi.org/')[1]
-                    break
-
-            #Pulling first DOI from text
-            #Example: https://jeb.biologists.org/content/223/20/jeb226654
-            #DOI not embedded in a href, but can only be pulled by searching the text
-            if len(doi) == 0:
-                doi = soup(text=re.compile(r'doi'))[0].strip()
-                #removing all characters before first number in DOI
-                doi = re.search('[0-9].*', doi)[0]
-
-            print('doi: ', doi)
-            print('----------------------------------')
-        except:
-            return doi
+        #meta tags first, then doi.org links, then DOIs in the text, see doi_extract.py
+        doi = doi_extract.best_doi(page_source)
+
+        print('doi: ', doi)
+        print('----------------------------------')
     
     return doi
 
-df['DOI'] = df.apply(doi_scraper, axis = 1)
-df.to_csv('colleen_alex_scraped.csv')
\ No newline at end of file
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Scrape DOIs with headless Chrome')
+    parser.add_argument('--input', type=str, default='Colleen and Alex-Grid view.csv', help='CSV file from Airtable')
+    parser.add_argument('--output', type=str, default='colleen_alex_scraped.csv', help='CSV file with the DOI column filled in')
+    parser.add_argument('--browsers', type=int, default=None, help='number of browsers, defaults to the number of cores')
+    parser.add_argument('--chromedriver', type=str, default=None, help='path to chromedriver, defaults to $CHROMEDRIVER_PATH')
+    args = parser.parse_args()
+
+    df = pd.read_csv(args.input)
+    rows = df.to_dict('records')
+
+    pool = browser_pool.BrowserPool(args.browsers, driver_factory=lambda: browser_pool.chrome_driver(args.chromedriver))
+    dois = pool.map(doi_scraper, rows, return_exceptions=True)
+
+    #keep the DOI already in the table for pages that failed to load
+    df['DOI'] = [row['DOI'] if isinstance(doi, Exception) else doi for row, doi in zip(rows, dois)]
+    df.to_csv(args.output)
+    columnar.write_frame(df, columnar.alongside(args.output))
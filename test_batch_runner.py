@@ -0,0 +1,174 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import pandas as pd
+
+import batch_runner
+import columnar
+import get_paper_info
+
+
+def fake_get_paper_info(url, fetcher=None):
+    # stands in for get_paper_info.get_paper_info, failing for urls ending in 'bad'
+    if url.endswith('bad'):
+        raise ValueError('no title on page')
+    return 'Title of %s' % url, '10.1000/%s' % url[-1], 'Abstract', url + '.pdf', True
+
+
+class TestBatchRunner(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.output_csv = os.path.join(self.tmp_dir.name, 'output.csv')
+        self.urls = ['https://www.pnas.org/content/%d' % i for i in range(10)] + ['https://www.pnas.org/bad']
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def run_batch(self, urls, side_effect=fake_get_paper_info, **kwargs):
+        with mock.patch('get_paper_info.get_paper_info', side_effect=side_effect) as patched:
+            checkpoint = batch_runner.run(urls, self.output_csv, concurrency=2, **kwargs)
+        return checkpoint, patched
+
+    def test_writes_rows_and_records_failures(self):
+        checkpoint, _ = self.run_batch(self.urls)
+
+        df = pd.read_csv(self.output_csv, index_col=0)
+        self.assertEqual(batch_runner.COLUMNS, list(df.columns))
+        self.assertEqual(self.urls[:10], df['url'].tolist())
+        self.assertEqual(list(range(10)), df.index.tolist())
+        self.assertIn('no title on page', checkpoint.failed['https://www.pnas.org/bad'])
+
+    def test_resume_after_interrupt(self):
+        def interrupt_at_five(url, fetcher=None):
+            if url.endswith('/5'):
+                raise KeyboardInterrupt
+            return fake_get_paper_info(url)
+
+        with self.assertRaises(KeyboardInterrupt):
+            self.run_batch(self.urls, side_effect=interrupt_at_five)
+        self.assertEqual(self.urls[:5], pd.read_csv(self.output_csv)['url'].tolist())
+
+        checkpoint, patched = self.run_batch(self.urls)
+        fetched = [call.args[0] for call in patched.call_args_list]
+        self.assertNotIn(self.urls[0], fetched)
+
+        df = pd.read_csv(self.output_csv, index_col=0)
+        self.assertEqual(self.urls[:10], df['url'].tolist())
+        self.assertEqual(list(range(10)), df.index.tolist())
+        self.assertEqual(set(self.urls[:10]), checkpoint.done)
+
+    def test_failed_urls_are_skipped_unless_retried(self):
+        self.run_batch(self.urls)
+
+        _, patched = self.run_batch(self.urls)
+        self.assertEqual(0, patched.call_count)
+
+        _, patched = self.run_batch(self.urls, retry_failed=True)
+        self.assertEqual(['https://www.pnas.org/bad'], [call.args[0] for call in patched.call_args_list])
+
+    def test_parquet_copy_survives_resume(self):
+        def interrupt_at_five(url, fetcher=None):
+            if url.endswith('/5'):
+                raise KeyboardInterrupt
+            return fake_get_paper_info(url)
+
+        with self.assertRaises(KeyboardInterrupt):
+            self.run_batch(self.urls, side_effect=interrupt_at_five)
+        self.run_batch(self.urls)
+
+        parquet_dir = os.path.join(self.tmp_dir.name, 'output.parquet')
+        df = columnar.read_columns(parquet_dir, ['row', 'url', 'is_open_access', 'publisher'])
+        self.assertEqual(list(range(10)), df['row'].tolist())
+        self.assertEqual(self.urls[:10], df['url'].tolist())
+        self.assertEqual({'pnas'}, set(df['publisher']))
+        self.assertTrue(df['is_open_access'].all())
+
+    def test_url_variants_are_fetched_once(self):
+        urls = ['https://www.pnas.org/content/1', 'http://pnas.org/content/1.full?rss=1',
+                'https://www.pnas.org/content/2', 'https://www.pnas.org/content/1.full.pdf',
+                'https://www.pnas.org/bad', 'http://www.pnas.org/bad/']
+        checkpoint, patched = self.run_batch(urls)
+        self.assertEqual(['https://www.pnas.org/content/1', 'https://www.pnas.org/content/2', 'https://www.pnas.org/bad'],
+                         [call.args[0] for call in patched.call_args_list])
+
+        df = pd.read_csv(self.output_csv, index_col=0)
+        self.assertEqual(urls[:4], df['url'].tolist())
+        self.assertEqual(['Title of https://www.pnas.org/content/1'] * 2, df['title'].tolist()[:2])
+        self.assertEqual({'https://www.pnas.org/bad', 'http://www.pnas.org/bad/'}, set(checkpoint.failed))
+
+    def test_page_is_fetched_before_pdf(self):
+        #the PDF of a paper is listed first, but it is the page its fields are read from
+        def pdf_fails(url, fetcher=None):
+            if url.endswith('.pdf'):
+                raise get_paper_info.NoPaperFound('Neither a title nor an abstract on %s' % url)
+            return fake_get_paper_info(url)
+
+        urls = ['https://www.pnas.org/content/1.full.pdf', 'https://www.pnas.org/content/2',
+                'http://pnas.org/content/1.full', 'https://www.pnas.org/content/3.full.pdf']
+        checkpoint, patched = self.run_batch(urls, side_effect=pdf_fails)
+        self.assertEqual(['http://pnas.org/content/1.full', 'https://www.pnas.org/content/2',
+                          'https://www.pnas.org/content/3.full.pdf'], sorted(call.args[0] for call in patched.call_args_list))
+        self.assertEqual(set(urls[:3]), checkpoint.done)
+        #a paper only listed by its PDF is still tried
+        self.assertEqual({urls[3]}, set(checkpoint.failed))
+        df = pd.read_csv(self.output_csv, index_col=0)
+        self.assertEqual(['Title of http://pnas.org/content/1.full'] * 2, df['title'].tolist()[::2])
+
+    def test_index_is_shared_between_runs(self):
+        index_path = os.path.join(self.tmp_dir.name, 'papers.index.jsonl')
+        self.run_batch(self.urls[:5], index_path=index_path)
+        self.output_csv = os.path.join(self.tmp_dir.name, 'other.csv')
+        _, patched = self.run_batch(self.urls[3:8], index_path=index_path)
+        self.assertEqual(self.urls[5:8], [call.args[0] for call in patched.call_args_list])
+        self.assertEqual(self.urls[3:8], pd.read_csv(self.output_csv)['url'].tolist())
+
+    def test_incomplete_records_are_not_indexed(self):
+        def no_abstract(url, fetcher=None):
+            return 'Title of %s' % url, '', '', url + '.pdf', False
+
+        index_path = os.path.join(self.tmp_dir.name, 'papers.index.jsonl')
+        urls = ['https://www.pnas.org/content/1', 'https://www.pnas.org/content/1.full']
+        checkpoint, patched = self.run_batch(urls, side_effect=no_abstract, index_path=index_path)
+        #written for both variants from one fetch, but not kept
+        self.assertEqual(1, patched.call_count)
+        self.assertEqual(set(urls), set(checkpoint.done))
+        self.assertEqual(0, len(batch_runner.canonical.PaperIndex(index_path)))
+
+        #a later run fetches the paper again, and keeps it once it is complete
+        self.output_csv = os.path.join(self.tmp_dir.name, 'other.csv')
+        _, patched = self.run_batch(urls, index_path=index_path)
+        self.assertEqual(urls[:1], [call.args[0] for call in patched.call_args_list])
+        self.assertEqual(1, len(batch_runner.canonical.PaperIndex(index_path)))
+
+    def test_pubmed_articles_are_looked_up_together(self):
+        urls = ['https://pubmed.ncbi.nlm.nih.gov/19113150/', 'https://www.pnas.org/content/1',
+                'https://www.ncbi.nlm.nih.gov/pubmed/20000000', 'https://pubmed.ncbi.nlm.nih.gov/99999999/']
+        articles = {urls[0]: {'pmid': '19113150', 'title': 'Mechanics of the Venus flytrap closure',
+                              'doi': '10.1103/PhysRevE.78.051902', 'abstract': 'Abstract', 'pmc': ''},
+                    urls[2]: {'pmid': '20000000', 'title': 'Similar article 0', 'doi': '',
+                              'abstract': 'Abstract', 'pmc': ''}}
+        with mock.patch('pubmed.paper_info_many', return_value=articles) as paper_info_many:
+            checkpoint, patched = self.run_batch(urls)
+        self.assertEqual(1, paper_info_many.call_count)
+        self.assertEqual([urls[0], urls[2], urls[3]], paper_info_many.call_args.args[0])
+        #only the pages of the other publishers, and of articles PubMed didn't return, are downloaded
+        self.assertEqual([urls[1], urls[3]], [call.args[0] for call in patched.call_args_list])
+
+        df = pd.read_csv(self.output_csv, index_col=0)
+        self.assertEqual(urls, df['url'].tolist())
+        self.assertEqual(['Mechanics of the Venus flytrap closure', 'Similar article 0'],
+                         df['title'].tolist()[::2])
+        #without a copy in PubMed Central, whether the article is open access isn't known
+        self.assertTrue(df['is_open_access'].iloc[[0, 2]].isna().all())
+        self.assertEqual(set(urls), checkpoint.done)
+
+    def test_writes_metrics(self):
+        self.run_batch(self.urls)
+        self.assertTrue(os.path.exists(self.output_csv + '.metrics.json'))
+        self.assertTrue(os.path.exists(self.output_csv + '.prom'))
+
+
+if __name__ == "__main__":
+    unittest.main()
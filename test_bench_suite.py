@@ -0,0 +1,26 @@
+import json
+import tempfile
+import unittest
+
+import bench_suite
+import get_paper_info
+
+
+class TestBenchSuite(unittest.TestCase):
+    def test_compare(self):
+        baseline = {'parse/pnas': 100.0, 'get_title/pnas': 1000.0, 'extract/pnas': 500.0}
+        results = {'parse/pnas': 85.0, 'get_title/pnas': 700.0, 'doi_extract/pnas': 1.0}
+        self.assertEqual([('get_title/pnas', 1000.0, 700.0)], bench_suite.compare(results, baseline, 0.2))
+        self.assertEqual([], bench_suite.compare(results, baseline, 0.5))
+
+    def test_run_and_save(self):
+        results = bench_suite.run(min_time=0.001, rounds=1, only='get_')
+        self.assertEqual(len(get_paper_info.paper_info_classes) * len(get_paper_info.PaperInfo.fields), len(results))
+        with tempfile.NamedTemporaryFile('r', suffix='.json') as baseline_file:
+            bench_suite.save(results, baseline_file.name)
+            self.assertEqual(results, bench_suite.load(baseline_file.name))
+            self.assertIn('python', json.load(baseline_file)['environment'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,168 @@
+import json
+import pathlib
+import tempfile
+import threading
+import time
+import unittest
+
+import browser_pool
+import replay
+import sd_selenium_scraper
+import selenium_doi_scraper
+
+
+class FakeDriver(object):
+    # stands in for a selenium webdriver, serving page_source from a dict of pages
+    started = []
+    lock = threading.Lock()
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.page_source = ''
+        self.quit_called = False
+        with FakeDriver.lock:
+            FakeDriver.started.append(self)
+
+    def get(self, url):
+        if url not in self.pages:
+            raise TimeoutError(url)
+        time.sleep(0.01)
+        self.page_source = self.pages[url]
+
+    def quit(self):
+        self.quit_called = True
+
+
+class TestBrowserPool(unittest.TestCase):
+    def setUp(self):
+        FakeDriver.started = []
+
+    def test_results_in_order(self):
+        pages = {'url%d' % i: 'page%d' % i for i in range(20)}
+        pool = browser_pool.BrowserPool(4, driver_factory=lambda: FakeDriver(pages))
+
+        def load(driver, url):
+            driver.get(url)
+            return driver.page_source
+
+        self.assertEqual(['page%d' % i for i in range(20)], pool.map(load, sorted(pages, key=lambda url: int(url[3:]))))
+        self.assertEqual(4, len(FakeDriver.started))
+        self.assertTrue(all(driver.quit_called for driver in FakeDriver.started))
+
+    def test_drivers_are_recycled(self):
+        pool = browser_pool.BrowserPool(1, driver_factory=lambda: FakeDriver({}), pages_per_driver=3)
+        pool.map(lambda driver, item: item, range(7))
+        self.assertEqual(3, len(FakeDriver.started))
+
+    def test_failed_page_replaces_driver(self):
+        pages = {'good': 'page'}
+        pool = browser_pool.BrowserPool(1, driver_factory=lambda: FakeDriver(pages))
+
+        def load(driver, url):
+            driver.get(url)
+            return driver.page_source
+
+        results = pool.map(load, ['good', 'slow', 'good'], return_exceptions=True)
+        self.assertEqual('page', results[0])
+        self.assertIsInstance(results[1], TimeoutError)
+        self.assertEqual('page', results[2])
+        self.assertEqual(2, len(FakeDriver.started))
+
+        with self.assertRaises(TimeoutError):
+            pool.map(load, ['good', 'slow'])
+
+    def test_scrapers_run_on_the_pool(self):
+        pages = {
+            'https://jeb.biologists.org/content/223/20/jeb226654':
+                '<html><body><a href="https://doi.org/10.1242/jeb.226654">doi</a></body></html>',
+            'https://www.sciencedaily.com/releases/2020/10/201028195617.htm':
+                '<html><body><div id="journal_references"><a href="https://doi.org/10.1242/jeb.226654">ref</a></div></body></html>',
+        }
+        pool = browser_pool.BrowserPool(2, driver_factory=lambda: FakeDriver(pages))
+
+        rows = [{'Primary lit site': 'https://jeb.biologists.org/content/223/20/jeb226654', 'DOI': None}]
+        self.assertEqual(['10.1242/jeb.226654'], pool.map(selenium_doi_scraper.doi_scraper, rows))
+
+        rows = [{'Journal URL': float('nan'), 'Press release': 'https://www.sciencedaily.com/releases/2020/10/201028195617.htm'},
+                {'Journal URL': 'https://www.nature.com/articles/s42004-019-0202-8', 'Press release': float('nan')}]
+        self.assertEqual(['https://doi.org/10.1242/jeb.226654', 'https://www.nature.com/articles/s42004-019-0202-8'],
+                         pool.map(sd_selenium_scraper.science_daily_scraper, rows))
+
+
+
+class TestPressReleaseResolver(unittest.TestCase):
+    #press releases served over plain HTTP from a temporary manifest, and the ones
+    #the fast path can't resolve as the browser would show them
+    served = {
+        'https://www.sciencedaily.com/releases/2020/10/201028195617.htm':
+            '<html><body><div id="first">x</div><div class="ref" id="journal_references">'
+            '<b>Journal Reference</b>: <a href="https://doi.org/10.1242/jeb.226654?a=1&amp;b=2">ref</a></div></body></html>',
+        'https://www.sciencedaily.com/releases/2019/03/190319100000.htm':
+            '<html><body><div id=journal_references><a href=https://doi.org/10.1111/jav.01972>ref</a></div></body></html>',
+        'https://www.sciencedaily.com/releases/2019/01/190101000000.htm':
+            '<html><body><div id="journal_references"></div><a href="https://example.org/unrelated">x</a></body></html>',
+    }
+    in_browser = {
+        'https://www.sciencedaily.com/releases/2019/01/190101000000.htm':
+            '<html><body><div id="journal_references"><a href="https://doi.org/10.1000/rendered">ref</a></div></body></html>',
+    }
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        manifest = {}
+        for i, (url, page) in enumerate(self.served.items()):
+            (pathlib.Path(self.tmp_dir.name) / ('%d.html' % i)).write_text(page, encoding='utf-8')
+            manifest[url] = {'file': '%d.html' % i, 'content_type': 'text/html; charset=utf-8'}
+        manifest_path = pathlib.Path(self.tmp_dir.name) / 'manifest.json'
+        manifest_path.write_text(json.dumps(manifest), encoding='utf-8')
+        self.fetcher = replay.replay_fetcher(replay.ReplayAdapter(manifest_path))
+        FakeDriver.started = []
+
+    def tearDown(self):
+        self.fetcher.close()
+        self.tmp_dir.cleanup()
+
+    def test_find_journal_reference(self):
+        pages = list(self.served.values())
+        self.assertEqual('https://doi.org/10.1242/jeb.226654?a=1&b=2', sd_selenium_scraper.find_journal_reference(pages[0]))
+        #markup the pattern doesn't expect is parsed with lxml
+        self.assertEqual('https://doi.org/10.1111/jav.01972', sd_selenium_scraper.find_journal_reference(pages[1]))
+        #a link after the div isn't taken for the reference
+        self.assertIsNone(sd_selenium_scraper.find_journal_reference(pages[2]))
+        self.assertIsNone(sd_selenium_scraper.find_journal_reference('<html><body></body></html>'))
+
+    def test_fast_path_then_browser(self):
+        nan = float('nan')
+        rows = [{'Journal URL': nan, 'Press release': url} for url in self.served]
+        rows += [{'Journal URL': nan, 'Press release': 'https://www.sciencedaily.com/releases/2018/05/180501000000.htm'},
+                 {'Journal URL': 'https://www.nature.com/articles/s42004-019-0202-8', 'Press release': nan}]
+        loaded = []
+
+        def load(driver, row):
+            loaded.append(row['Press release'])
+            return sd_selenium_scraper.science_daily_scraper(driver, row)
+
+        pool = browser_pool.BrowserPool(2, driver_factory=lambda: FakeDriver(self.in_browser))
+        pool_map = pool.map
+        pool.map = lambda func, items, return_exceptions=False: pool_map(load, items, return_exceptions)
+        results = sd_selenium_scraper.resolve_journal_urls(rows, self.fetcher, pool)
+
+        self.assertEqual([('https://doi.org/10.1242/jeb.226654?a=1&b=2', 'http'),
+                          ('https://doi.org/10.1111/jav.01972', 'http'),
+                          ('https://doi.org/10.1000/rendered', 'browser')], results[:3])
+        #not recorded, so neither the download nor the browser could load it
+        self.assertEqual('unresolved', results[3][1])
+        self.assertEqual(('https://www.nature.com/articles/s42004-019-0202-8', 'table'), results[4])
+        #only the two pages the fast path missed were loaded in a browser
+        self.assertEqual(sorted([rows[2]['Press release'], rows[3]['Press release']]), sorted(loaded))
+
+    def test_browser_only_started_when_needed(self):
+        rows = [{'Journal URL': float('nan'), 'Press release': url} for url in list(self.served)[:2]]
+        pool = browser_pool.BrowserPool(2, driver_factory=lambda: FakeDriver({}))
+        results = sd_selenium_scraper.resolve_journal_urls(rows, self.fetcher, pool)
+        self.assertEqual(['http', 'http'], [resolved_by for _, resolved_by in results])
+        self.assertEqual([], FakeDriver.started)
+
+
+if __name__ == "__main__":
+    unittest.main()
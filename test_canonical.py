@@ -0,0 +1,85 @@
+import os
+import tempfile
+import unittest
+
+import canonical
+
+
+class TestCanonical(unittest.TestCase):
+    def assertSameKey(self, urls):
+        self.assertEqual(1, len({canonical.canonical_url(url) for url in urls}), urls)
+
+    def test_variants(self):
+        self.assertSameKey(['https://www.pnas.org/content/103/15/5764', 'http://pnas.org/content/103/15/5764/',
+                            'https://www.pnas.org/content/103/15/5764.full?m',
+                            'https://www.pnas.org/content/103/15/5764.full.pdf',
+                            'https://www.pnas.org/content/103/15/5764.short?rss=1', 'www.pnas.org/content/103/15/5764'])
+        self.assertSameKey(['https://jeb.biologists.org/content/203/23/3585',
+                            'https://jeb.biologists.org/content/jexbio/203/23/3585.full.pdf',
+                            'https://jeb.biologists.org/content/203/23/3585.abstract'])
+        self.assertSameKey(['https://www.nature.com/articles/ncomms12289',
+                            'https://www.nature.com/articles/ncomms12289?WT.ec_id=NCOMMS-20160727&spMailingID=51921378',
+                            'https://www.nature.com/articles/ncomms12289.pdf?origin=ppub',
+                            'https://www.nature.com/articles/ncomms12289.epdf'])
+
+    def test_doi_and_pubmed_keys(self):
+        self.assertEqual('doi:10.1007/s10886-009-9707-4',
+                         canonical.canonical_url('https://link.springer.com/article/10.1007%2Fs10886-009-9707-4'))
+        self.assertSameKey(['https://link.springer.com/article/10.1007/s10886-009-9707-4',
+                            'https://doi.org/10.1007/S10886-009-9707-4', 'http://dx.doi.org/10.1007/s10886-009-9707-4'])
+        self.assertSameKey(['https://royalsocietypublishing.org/doi/full/10.1098/rsif.2009.0203',
+                            'https://royalsocietypublishing.org/doi/pdf/10.1098/rsif.2009.0203'])
+        self.assertEqual('pubmed:19113150', canonical.canonical_url('https://pubmed.ncbi.nlm.nih.gov/19113150/'))
+        self.assertEqual('pubmed:19113150', canonical.canonical_url('https://www.ncbi.nlm.nih.gov/pubmed/19113150'))
+
+    def test_different_papers_stay_apart(self):
+        keys = {canonical.canonical_url(url) for url in [
+            'https://www.pnas.org/content/103/15/5764', 'https://www.pnas.org/content/103/15/5765',
+            'https://www.nature.com/articles/nature08943', 'https://www.nature.com/articles/nature08944',
+            'https://example.org/paper?id=1', 'https://example.org/paper?id=2']}
+        self.assertEqual(6, len(keys))
+
+    def test_article_params_are_kept(self):
+        #only known tracking parameters are dropped, not every one that looks like them
+        self.assertEqual('example.org/openurl?page=5&source=jbm&spage=12',
+                         canonical.canonical_url('https://example.org/openurl?spage=12&page=5&source=jbm&utm_source=x'))
+        keys = {canonical.canonical_url('https://example.org/openurl?issn=1&spage=%d' % page) for page in (12, 13)}
+        self.assertEqual(2, len(keys))
+
+    def test_is_pdf_url(self):
+        for url in ['https://www.pnas.org/content/103/15/5764.full.pdf', 'https://www.nature.com/articles/ncomms12289.pdf',
+                    'https://royalsocietypublishing.org/doi/pdf/10.1098/rsif.2009.0203',
+                    'https://onlinelibrary.wiley.com/doi/epdf/10.1111/1365-2435.12345']:
+            self.assertTrue(canonical.is_pdf_url(url), url)
+        for url in ['https://www.pnas.org/content/103/15/5764.full', 'https://www.nature.com/articles/ncomms12289',
+                    'https://royalsocietypublishing.org/doi/full/10.1098/rsif.2009.0203']:
+            self.assertFalse(canonical.is_pdf_url(url), url)
+
+    def test_row_keys(self):
+        cells = ['https://www.pnas.org/content/103/15/5764.full', 'http://pnas.org/content/1\n\nhttps://doi.org/10.1000/X',
+                 None, 'https://pnas.org/content/103/15/5764', '']
+        self.assertEqual(['pnas.org/content/103/15/5764', 'pnas.org/content/1 doi:10.1000/x', '',
+                          'pnas.org/content/103/15/5764#2', '#2'], canonical.row_keys(cells))
+
+    def test_canonical_doi(self):
+        self.assertEqual('10.1103/physreve.78.051902', canonical.canonical_doi('https://doi.org/10.1103/PhysRevE.78.051902'))
+        self.assertEqual('10.1103/physreve.78.051902', canonical.canonical_doi('doi: 10.1103/PhysRevE.78.051902.'))
+        self.assertIsNone(canonical.canonical_doi('not a doi'))
+
+    def test_index_persists(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'index.jsonl')
+            index = canonical.PaperIndex(path)
+            index.set('pubmed:1', {'title': 'Old'})
+            index.set('pubmed:1', {'title': 'New'})
+            index.set('pubmed:2', {'title': 'Other'})
+
+            index = canonical.PaperIndex(path)
+            self.assertEqual({'title': 'New'}, index.get('pubmed:1'))
+            self.assertIn('pubmed:2', index)
+            self.assertNotIn('pubmed:3', index)
+            self.assertEqual(2, len(index))
+
+
+if __name__ == "__main__":
+    unittest.main()
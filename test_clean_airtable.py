@@ -0,0 +1,44 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+import bench_clean
+import clean_airtable
+
+
+class TestCleanAirtable(unittest.TestCase):
+    def setUp(self):
+        self.df = pd.DataFrame({
+            'DOI': ['10.1/a', np.nan, '10.1/c', '10.1/a'],
+            'Paper title': ['A', 'B', 'C', 'A'],
+            'Primary lit site': ['http://a.org/1', 'http://b.org/1\nhttp://b.org/2\n', 'http://c.org/1',
+                                 'http://a.org/1'],
+            'Functions Level I': ['Move', 'Attach', np.nan, 'Protect'],
+        }, index=[10, 11, 12, 13])
+
+    def test_explodes_multiple_urls(self):
+        cleaned = clean_airtable.clean_multiple_urls(self.df)
+        self.assertEqual(['http://a.org/1', 'http://b.org/1', 'http://b.org/2', 'http://c.org/1'],
+                         cleaned['Primary lit site'].tolist())
+        self.assertEqual([10, 11, 11, 12], cleaned.index.tolist())
+        self.assertEqual(['Attach', 'Attach'], cleaned.loc[11, 'Functions Level I'].tolist())
+        self.assertEqual(list(self.df.columns), list(cleaned.columns))
+
+    def test_deduplicates_on_key_columns(self):
+        cleaned = clean_airtable.clean_multiple_urls(self.df)
+        self.assertEqual('Move', cleaned.loc[10, 'Functions Level I'])
+        self.assertNotIn(13, cleaned.index)
+
+        whole_rows = clean_airtable.clean_multiple_urls(self.df, key_columns=list(self.df.columns))
+        self.assertIn(13, whole_rows.index)
+
+    def test_matches_original_on_export(self):
+        df = bench_clean.synthetic_export(300)
+        original = bench_clean.clean_multiple_urls_loop(df)
+        cleaned = clean_airtable.clean_multiple_urls(df)
+        self.assertEqual(original[4].tolist(), cleaned['Primary lit site'].tolist())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import os
+import tempfile
+import unittest
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import columnar
+import get_urls
+
+
+class TestColumnar(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.df = pd.DataFrame({
+            'URL': ['https://www.pnas.org/content/%d' % i for i in range(250)],
+            'Journal': ['PNAS', 'Nature', None, 'PNAS', 'Science'] * 50,
+            'Abstract': ['Abstract %d, with "quotes", commas\nand newlines' % i for i in range(250)],
+            'Year': list(range(250)),
+        })
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.tmp_dir.name, name)
+
+    def test_round_trip(self):
+        for name in ['papers.parquet', 'papers.arrow']:
+            columnar.write_frame(self.df, self.path(name), batch_size=100)
+            df = columnar.read_columns(self.path(name))
+            self.assertEqual(list(self.df.columns), list(df.columns))
+            self.assertEqual(self.df['Abstract'].tolist(), df['Abstract'].tolist())
+            self.assertEqual(self.df['Year'].tolist(), df['Year'].tolist())
+            self.assertEqual(self.df['Journal'].fillna('').tolist(), df['Journal'].astype(object).fillna('').tolist())
+            self.assertIsInstance(df['Journal'].dtype, pd.CategoricalDtype)
+
+    def test_mixed_object_columns(self):
+        #e.g. a DOI column where pandas kept some values as numbers
+        df = pd.DataFrame({'a': [1, 'x', None], 'b': [1.5, float('nan'), 'y'], 'c': [True, False, None]})
+        for name in ['mixed.parquet', 'mixed.arrow']:
+            columnar.write_frame(df, self.path(name))
+            written = columnar.read_columns(self.path(name))
+            self.assertEqual(['1', 'x', ''], written['a'].fillna('').tolist())
+            self.assertEqual(['1.5', '', 'y'], written['b'].fillna('').tolist())
+            self.assertEqual([True, False, ''], written['c'].fillna('').tolist())
+        #the DataFrame passed in is left as it was
+        self.assertEqual([1, 'x', None], df['a'].tolist())
+
+    def test_encodings(self):
+        columnar.write_frame(self.df, self.path('papers.parquet'))
+        metadata = pq.ParquetFile(self.path('papers.parquet')).metadata.row_group(0)
+        columns = {metadata.column(i).path_in_schema: metadata.column(i) for i in range(metadata.num_columns)}
+        self.assertEqual('ZSTD', columns['Abstract'].compression)
+        self.assertEqual('SNAPPY', columns['URL'].compression)
+        self.assertIn('RLE_DICTIONARY', columns['Journal'].encodings)
+
+    def test_only_asked_columns_are_read(self):
+        columnar.write_frame(self.df, self.path('papers.parquet'))
+        self.df.to_csv(self.path('papers.csv'), index=False)
+        for name in ['papers.parquet', 'papers.csv']:
+            self.assertEqual(['URL'], list(columnar.read_columns(self.path(name), ['URL']).columns))
+            self.assertEqual(self.df['URL'].tolist(), get_urls.get_urls(self.path(name)))
+
+    def test_arrow_columns_are_not_copied(self):
+        #the IPC file is uncompressed, so a column read from it points into the mapped file
+        df = pd.DataFrame({'URL': ['https://x.org/%d' % i for i in range(2000)], 'Abstract': ['a' * 1000] * 2000})
+        columnar.write_frame(df, self.path('papers.arrow'))
+        before = pa.total_allocated_bytes()
+        table = columnar.read_table(self.path('papers.arrow'), ['URL'])
+        self.assertEqual(before, pa.total_allocated_bytes())
+        self.assertEqual(['URL'], table.column_names)
+        self.assertEqual(df['URL'].tolist(), table.column('URL').to_pylist())
+
+    def test_writer_appends_batches(self):
+        schema = columnar.make_schema(['url', 'publisher'])
+        with columnar.ColumnarWriter(self.path('rows.parquet'), schema, batch_size=3) as writer:
+            for i in range(10):
+                writer.write(['u%d' % i, 'pnas' if i % 2 else 'nature'])
+        self.assertEqual(4, pq.ParquetFile(self.path('rows.parquet')).metadata.num_row_groups)
+        batches = list(columnar.iter_batches(self.path('rows.parquet'), ['url'], batch_size=4))
+        self.assertEqual(['u%d' % i for i in range(10)], pd.concat(batches)['url'].tolist())
+
+    def test_parts(self):
+        directory = self.path('output.parquet')
+        schema = columnar.make_schema(['url'])
+        for expected in ['part-00000.parquet', 'part-00001.parquet']:
+            part = columnar.new_part(directory)
+            self.assertEqual(expected, part.name)
+            with columnar.ColumnarWriter(part, schema) as writer:
+                writer.write([part.name])
+        self.assertEqual(['part-00000.parquet', 'part-00001.parquet'],
+                         columnar.read_columns(directory)['url'].tolist())
+        self.assertEqual('part-00000.parquet', columnar.new_part(directory, clear=True).name)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+import unittest
+
+import bench_parse
+import doi_extract
+
+
+class TestDoiExtract(unittest.TestCase):
+    def test_meta_tags_rank_first(self):
+        html = ('<html><head><meta content="10.1242/JEB.226654" name="citation_doi"></head>'
+                '<body><a href="https://doi.org/10.1000/other">ref</a> see 10.1000/other.</body></html>')
+        candidates = doi_extract.find_candidates(html)
+        self.assertEqual(doi_extract.DoiCandidate('10.1242/JEB.226654', 'meta', 1), candidates[0])
+        self.assertEqual(doi_extract.DoiCandidate('10.1000/other', 'link', 2), candidates[1])
+
+    def test_dc_identifier(self):
+        html = b"<meta name='dc.identifier' content='doi:10.1038/s42004-019-0202-8'>"
+        self.assertEqual('10.1038/s42004-019-0202-8', doi_extract.best_doi(html))
+
+    def test_escaped_link(self):
+        html = '<a href="https://dx.doi.org/10.1007%2Fs10886-009-9707-4">link</a>'
+        self.assertEqual('10.1007/s10886-009-9707-4', doi_extract.best_doi(html))
+
+    def test_text(self):
+        html = '<p>Journal of Experimental Biology (2020) 223, jeb226654 (doi:10.1242/jeb.226654).</p>'
+        self.assertEqual('10.1242/jeb.226654', doi_extract.best_doi(html))
+
+    def test_not_a_doi(self):
+        self.assertEqual('', doi_extract.best_doi('<p>version 110.12345/abc and v10.1234/xyz</p>'))
+        self.assertEqual('', doi_extract.best_doi(''))
+
+    def test_unbalanced_parentheses(self):
+        self.assertEqual('10.1002/(SICI)1097-4636', doi_extract.clean_doi(b'10.1002/(SICI)1097-4636'))
+        self.assertEqual('10.1103/PhysRevE.78.051902', doi_extract.clean_doi(b'10.1103/PhysRevE.78.051902).'))
+
+    def test_case(self):
+        #spellings differing only in case are one DOI, written as in the meta tag
+        html = ('<meta name="citation_doi" content="10.1103/PhysRevE.78.051902">'
+                '<p>10.1103/physreve.78.051902 and 10.1103/PHYSREVE.78.051902</p>')
+        self.assertEqual([doi_extract.DoiCandidate('10.1103/PhysRevE.78.051902', 'meta', 3)],
+                         doi_extract.find_candidates(html))
+        self.assertEqual('10.1103/physreve.78.051902', doi_extract.doi_key('10.1103/PhysRevE.78.051902'))
+
+    def test_fixture_pages(self):
+        dois = {publisher: doi_extract.best_doi(html) for publisher, _, html in bench_parse.load_fixtures()}
+        self.assertEqual('10.1103/PhysRevE.78.051902', dois['pubmed'])
+        self.assertEqual('10.1038/s42004-019-0202-8', dois['nature'])
+        self.assertEqual('10.1242/jeb.226654', dois['jeb'])
+        self.assertEqual('10.1007/s10886-009-9707-4', dois['springer'])
+        self.assertEqual('10.1098/rsif.2009.0203', dois['rsp'])
+
+    def test_batch(self):
+        pages = [html for _, _, html in bench_parse.load_fixtures()]
+        serial = doi_extract.find_candidates_many(pages, workers=1)
+        self.assertEqual(serial, doi_extract.find_candidates_many(pages, workers=2, chunksize=2))
+        self.assertEqual([doi_extract.find_candidates(html) for html in pages], serial)
+
+
+if __name__ == "__main__":
+    unittest.main()
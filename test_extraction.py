@@ -0,0 +1,92 @@
+import unittest
+from unittest import mock
+
+import bench_parse
+import extraction
+import get_paper_info
+import parsing
+
+WILEY_PAGE = '''<html><head>
+<meta name="citation_title" content="Stick-slip friction in gecko toes">
+<meta name="Citation_DOI" content="10.1111/1365-2435.12345">
+<meta name="citation_pdf_url" content="https://besjournals.onlinelibrary.wiley.com/doi/pdf/10.1111/1365-2435.12345">
+</head><body>
+<section class="article-section article-section__abstract"><h2>Abstract</h2>
+<div class="article-section__content en main"><p> Geckos hold on. </p></div></section>
+</body></html>'''
+
+
+class TestExtraction(unittest.TestCase):
+    def test_meta_spec(self):
+        url = 'https://besjournals.onlinelibrary.wiley.com/doi/full/10.1111/1365-2435.12345'
+        paper = get_paper_info.PaperInfo(url, html=WILEY_PAGE, publisher='wiley')
+        self.assertEqual({'title': 'Stick-slip friction in gecko toes',
+                          'doi': '10.1111/1365-2435.12345',
+                          'abstract': 'Geckos hold on.',
+                          'full_doc_link': 'https://besjournals.onlinelibrary.wiley.com/doi/pdf/10.1111/1365-2435.12345'},
+                         paper.extract())
+        self.assertEqual('10.1111/1365-2435.12345', paper.get_doi())
+
+    def test_first_steps_found_in_one_walk(self):
+        #every field gives the same value as searching for it alone, with one walk over the page
+        for publisher, url, html in bench_parse.load_fixtures():
+            plan = extraction.load_plan(publisher)
+            tree = parsing.parse_html(html)
+            walks = []
+            traversal = plan.traversal
+            with mock.patch.object(plan, 'traversal', side_effect=lambda tree: walks.append(1) or traversal(tree)):
+                info = plan.extract(tree, url)
+            self.assertEqual(1 if plan.groups else 0, len(walks))
+            self.assertEqual({name: plan.extract_field(tree, url, name) for name in plan.fields}, info)
+
+    def test_pubmed_doi_outside_heading(self):
+        #the DOI is read wherever the page lists it, as before the specs
+        tree = parsing.parse_html('<div id="full-view-heading"><h1>Hovering</h1></div>'
+                                  '<ul id="full-view-identifiers"><li><span class="identifier doi">'
+                                  '<a href="https://doi.org/10.1103/PhysRevE.78.051902">10.1103/PhysRevE.78.051902</a>'
+                                  '</span></li></ul>')
+        info = extraction.load_plan('pubmed').extract(tree, 'https://pubmed.ncbi.nlm.nih.gov/19113150/')
+        self.assertEqual({'title': 'Hovering', 'doi': '10.1103/PhysRevE.78.051902', 'abstract': '',
+                          'full_doc_link': ''}, info)
+
+    def test_pubmed_pmc_link(self):
+        #articles with a free copy in PubMed Central link to it, and its PDF is the full_doc_link
+        tree = parsing.parse_html('<ul id="full-view-identifiers"><li><span class="identifier pmc">'
+                                  '<span class="id-label">PMCID: </span><a class="id-link" '
+                                  'href="https://www.ncbi.nlm.nih.gov/pmc/articles/PMC2780017">PMC2780017</a>'
+                                  '</span></li></ul>')
+        info = extraction.load_plan('pubmed').extract(tree, 'https://pubmed.ncbi.nlm.nih.gov/19113150/')
+        self.assertEqual('https://www.ncbi.nlm.nih.gov/pmc/articles/PMC2780017/pdf/', info['full_doc_link'])
+
+    def test_missing_elements_are_empty(self):
+        tree = parsing.parse_html('<html><body><p>nothing here</p></body></html>')
+        info = extraction.load_plan('pnas').extract(tree, 'https://www.pnas.org/content/103/46/17543.full')
+        self.assertEqual({'title': '', 'doi': '', 'abstract': '',
+                          'full_doc_link': 'https://www.pnas.org/content/103/46/17543.full.pdf'}, info)
+
+    def test_contains_and_pick_last(self):
+        spec = {'publisher': 'test', 'fields': {
+            'link': {'select': [{'tag': 'a', 'has': {'href': 'pdf'}}], 'attr': 'href', 'contains': 'x.org',
+                     'pick': 'last'}}}
+        tree = parsing.parse_html('<a href="http://x.org/1.pdf"></a><a href="http://y.org/2.pdf"></a>'
+                                  '<a href="http://x.org/3.pdf"></a><a href="http://x.org/4.html"></a>')
+        self.assertEqual({'link': 'http://x.org/3.pdf'}, extraction.ExtractionPlan(spec).extract(tree, ''))
+
+    def test_specs_load_lazily(self):
+        extraction.load_plan.cache_clear()
+        extraction.load_plan('nature')
+        self.assertEqual(1, extraction.load_plan.cache_info().currsize)
+        with self.assertRaises(KeyError):
+            extraction.load_plan('no-such-publisher')
+        with self.assertRaises(KeyError):
+            extraction.load_plan(None)
+
+    def test_every_spec_compiles(self):
+        for publisher in extraction.available():
+            plan = extraction.load_plan(publisher)
+            self.assertEqual(publisher, plan.publisher)
+            self.assertTrue(set(plan.fields) <= set(get_paper_info.PaperInfo.fields))
+
+
+if __name__ == '__main__':
+    unittest.main()
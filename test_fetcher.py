@@ -0,0 +1,81 @@
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import fetcher
+
+
+class SlowHandler(BaseHTTPRequestHandler):
+    # answers every GET with its own path, after a short delay
+    in_flight = 0
+    max_in_flight = 0
+    lock = threading.Lock()
+
+    def do_GET(self):
+        cls = type(self)
+        with cls.lock:
+            cls.in_flight += 1
+            cls.max_in_flight = max(cls.max_in_flight, cls.in_flight)
+        time.sleep(0.05)
+        with cls.lock:
+            cls.in_flight -= 1
+
+        body = self.path.encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestFetcher(unittest.TestCase):
+    def setUp(self):
+        SlowHandler.in_flight = 0
+        SlowHandler.max_in_flight = 0
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), SlowHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base_url = 'http://127.0.0.1:%d' % self.server.server_address[1]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_map_keeps_input_order(self):
+        urls = ['%s/paper/%d' % (self.base_url, i) for i in range(20)]
+        with fetcher.Fetcher(concurrency=8, per_host=8) as f:
+            pages = f.map(f.get_html, urls)
+
+        self.assertEqual(['/paper/%d' % i for i in range(20)], pages)
+
+    def test_per_host_cap(self):
+        urls = ['%s/paper/%d' % (self.base_url, i) for i in range(12)]
+        with fetcher.Fetcher(concurrency=8, per_host=2) as f:
+            f.map(f.get_html, urls)
+
+        self.assertEqual(2, SlowHandler.max_in_flight)
+
+    def test_return_exceptions(self):
+        def fail_on_odd(i):
+            if i % 2:
+                raise ValueError(i)
+            return i
+
+        with fetcher.Fetcher(concurrency=4) as f:
+            results = f.map(fail_on_odd, range(4), return_exceptions=True)
+            self.assertEqual(0, results[0])
+            self.assertIsInstance(results[1], ValueError)
+            self.assertEqual(2, results[2])
+
+            with self.assertRaises(ValueError):
+                f.map(fail_on_odd, range(4))
+
+    def test_host_of(self):
+        self.assertEqual('www.pnas.org', fetcher.host_of('https://WWW.pnas.org/content/117/1/1'))
+
+
+if __name__ == "__main__":
+    unittest.main()
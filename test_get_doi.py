@@ -1,25 +1,44 @@
 import unittest
+import doi_extract
+import fetcher as fetching
 import get_doi
 import get_urls
+import replay
 
 
 class TestGetDOI(unittest.TestCase):
     def setUp(self):
         self.urls = get_urls.get_urls("test_papers_jq.csv")
+        #pages come from the synthetic fixtures instead of the live sites
+        self.replay = replay.replaying()
+        self.replay.__enter__()
+
+    def tearDown(self):
+        self.replay.__exit__(None, None, None)
 
 
     def test_get_doi_from_href(self):
         url = self.urls[0]
         doi = get_doi.pull_doi(url)
 
-        self.assertEqual(doi, '10.1103/physreve.78.051902')
+        self.assertEqual(doi, '10.1103/PhysRevE.78.051902')
 
-    def test_get_doi_from_text(self):
+    def test_get_doi_from_meta_tag(self):
         url = self.urls[2]
         doi = get_doi.pull_doi(url)
 
         self.assertEqual(doi, '10.1242/jeb.226654')
 
+    def test_get_doi_from_text(self):
+        #a synthetic page without meta tags or doi.org links, whose DOIs are only in the text
+        url = 'https://journals.example.org/articles/doi-in-text'
+        candidates = doi_extract.find_candidates(fetching.default_fetcher.get(url).text)
+        self.assertEqual({'text'}, {candidate.source for candidate in candidates})
+
+        #the paper's DOI is cited more often than the one in its references
+        doi = get_doi.pull_doi(url)
+        self.assertEqual(doi, '10.5555/synth.2020.0101')
+
 
 if __name__ == "__main__":
     unittest.main()
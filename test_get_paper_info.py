@@ -1,5 +1,12 @@
+import json
+import pathlib
+import tempfile
 import unittest
+
+import requests
+
 import get_paper_info
+import replay
 import pandas as pd
 
 
@@ -7,6 +14,12 @@ class TestGetPaperInfo(unittest.TestCase):
     def setUp(self):
         df = pd.read_csv('test_papers_jq.csv')
         self.url_titles = df[['Paper title', 'URL']].values
+        #pages come from the synthetic fixtures instead of the live sites
+        self.replay = replay.replaying()
+        self.replay_adapter = self.replay.__enter__()
+
+    def tearDown(self):
+        self.replay.__exit__(None, None, None)
 
     def test_nature(self):
         #nature article
@@ -24,6 +37,15 @@ class TestGetPaperInfo(unittest.TestCase):
         self.assertEqual('https://www.nature.com/articles/s42004-019-0202-8.pdf', full_doc_link)
         self.assertTrue(paper.is_open_access(full_doc_link))
 
+    def test_doi_link(self):
+        #a doi.org link redirects to the article, and the PDF link is built from the article's url
+        record = get_paper_info.get_paper_info('https://doi.org/10.1038/s42004-019-0202-8')
+        self.assertEqual(self.url_titles[1][0], record.title)
+        self.assertEqual('https://www.nature.com/articles/s42004-019-0202-8.pdf', record.full_doc_link)
+        self.assertTrue(record.is_open_access)
+        probed = [url for method, url in self.replay_adapter.requests_seen if url.endswith('.pdf')]
+        self.assertEqual({'https://www.nature.com/articles/s42004-019-0202-8.pdf'}, set(probed))
+
     def test_pubmed(self):
         #pubmed article
         url = self.url_titles[0][1]
@@ -33,6 +55,12 @@ class TestGetPaperInfo(unittest.TestCase):
         #title
         self.assertEqual(paper.get_title(), title)
 
+        #the article has no free copy in PubMed Central, so whether it is open access is unknown
+        record = get_paper_info.get_paper_info(url)
+        self.assertEqual('', record.full_doc_link)
+        self.assertIsNone(record.is_open_access)
+        self.assertEqual([], [seen for seen in self.replay_adapter.requests_seen if seen[0] == 'HEAD'])
+
     def test_jeb(self):
         #JEB article
         url = self.url_titles[2][1]
@@ -74,6 +102,57 @@ class TestGetPaperInfo(unittest.TestCase):
         #Testing which_journal function
         url = self.url_titles[0][1]
         self.assertEqual(get_paper_info.which_journal(url), 'pubmed')
-        
+
+    def test_record_drops_page(self):
+        #the record holds only the extracted values, and the page is released
+        paper = get_paper_info.PaperInfoNature(self.url_titles[1][1])
+        paper.extract()
+        paper.release()
+        self.assertIsNone(paper.html)
+        self.assertIsNone(paper.tree)
+        record = get_paper_info.get_paper_info(self.url_titles[1][1])
+        self.assertEqual(self.url_titles[1][0], record.title)
+        self.assertEqual(('title', 'doi', 'abstract', 'full_doc_link', 'is_open_access'), record._fields)
+
+    def test_iter_paper_info(self):
+        urls = [url for _, url in self.url_titles] + ['https://www.pnas.org/content/not/recorded']
+        pulled = []
+
+        def url_source():
+            for url in urls:
+                pulled.append(url)
+                yield url
+
+        with replay.replay_fetcher(self.replay_adapter) as offline_fetcher:
+            offline_fetcher.concurrency = 1
+            results = get_paper_info.iter_paper_info(url_source(), window=2, fetcher=offline_fetcher)
+            url, record = next(results)
+            #urls are only read as far as the window allows
+            self.assertEqual(urls[0], url)
+            self.assertLessEqual(len(pulled), 3)
+            results = [(url, record)] + list(results)
+
+        self.assertEqual(urls, [url for url, _ in results])
+        self.assertEqual([title for title, _ in self.url_titles], [record.title for _, record in results[:-1]])
+        self.assertIsInstance(results[-1][1], Exception)
+
+    def test_error_pages_fail(self):
+        #a 404 page, and a captcha page served with a 200, are not papers
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            directory = pathlib.Path(tmp_dir)
+            (directory / 'captcha.html').write_text('<html><body><h1>Are you a robot?</h1></body></html>')
+            manifest = {
+                'https://www.nature.com/articles/missing': {'file': 'captcha.html', 'status': 404,
+                                                            'content_type': 'text/html'},
+                'https://www.nature.com/articles/captcha': {'file': 'captcha.html', 'content_type': 'text/html'},
+            }
+            (directory / 'manifest.json').write_text(json.dumps(manifest))
+            with replay.replay_fetcher(replay.ReplayAdapter(directory / 'manifest.json')) as offline_fetcher:
+                with self.assertRaises(requests.HTTPError):
+                    get_paper_info.get_paper_info('https://www.nature.com/articles/missing', fetcher=offline_fetcher)
+                with self.assertRaises(get_paper_info.NoPaperFound):
+                    get_paper_info.get_paper_info('https://www.nature.com/articles/captcha', fetcher=offline_fetcher)
+
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
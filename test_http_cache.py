@@ -0,0 +1,131 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import fetcher
+import http_cache
+
+
+class ETagHandler(BaseHTTPRequestHandler):
+    # serves one page with an ETag, answering 304 when the client already has it
+    etag = '"v1"'
+    requests_seen = []
+
+    def do_GET(self):
+        type(self).requests_seen.append((self.path, self.headers.get('If-None-Match')))
+        if self.path.startswith('/doi/'):
+            self.send_response(302)
+            self.send_header('Location', '/paper')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if self.headers.get('If-None-Match') == type(self).etag:
+            self.send_response(304)
+            self.send_header('ETag', type(self).etag)
+            self.end_headers()
+            return
+
+        body = ('<html>%s %s %s</html>' % (self.path, type(self).etag, self.headers.get('Accept'))).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('ETag', type(self).etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestHTTPCache(unittest.TestCase):
+    def setUp(self):
+        ETagHandler.etag = '"v1"'
+        ETagHandler.requests_seen = []
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), ETagHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base_url = 'http://127.0.0.1:%d' % self.server.server_address[1]
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmp_dir.cleanup()
+
+    def test_normalize_url(self):
+        self.assertEqual(http_cache.normalize_url('HTTPS://WWW.Nature.com:443/articles/x?b=2&a=1#Abs1'),
+                         'https://www.nature.com/articles/x?a=1&b=2')
+        self.assertEqual(http_cache.cache_key('https://www.pnas.org/content/1#x'),
+                         http_cache.cache_key('https://WWW.PNAS.ORG/content/1'))
+
+    def test_cached_redirect_keeps_final_url(self):
+        cache = http_cache.HTTPCache(self.tmp_dir.name, ttl=3600)
+        with fetcher.Fetcher(cache=cache) as f:
+            first = f.get(self.base_url + '/doi/10.1000/x')
+            second = f.get(self.base_url + '/doi/10.1000/x')
+        self.assertEqual(self.base_url + '/paper', first.url)
+        self.assertTrue(second.from_cache)
+        self.assertEqual(self.base_url + '/paper', second.url)
+
+    def test_fresh_entry_is_read_from_disk(self):
+        cache = http_cache.HTTPCache(self.tmp_dir.name, ttl=3600)
+        with fetcher.Fetcher(cache=cache) as f:
+            first = f.get_html(self.base_url + '/paper')
+            second = f.get_html(self.base_url + '/paper#abstract')
+
+        self.assertEqual(first, second)
+        self.assertEqual(1, len(ETagHandler.requests_seen))
+
+    def test_stale_entry_is_revalidated(self):
+        cache = http_cache.HTTPCache(self.tmp_dir.name, ttl=0)
+        with fetcher.Fetcher(cache=cache) as f:
+            first = f.get_html(self.base_url + '/paper')
+            second = f.get(self.base_url + '/paper')
+
+            self.assertEqual(first, second.text)
+            self.assertTrue(second.from_cache)
+            self.assertEqual(('/paper', '"v1"'), ETagHandler.requests_seen[-1])
+
+            #the page changed on the server, so the new body replaces the cached one
+            ETagHandler.etag = '"v2"'
+            third = f.get_html(self.base_url + '/paper')
+            self.assertIn('"v2"', third)
+            self.assertEqual(cache.lookup(self.base_url + '/paper')[1].decode(), third)
+
+    def test_lru_eviction(self):
+        cache = http_cache.HTTPCache(self.tmp_dir.name, ttl=3600, max_bytes=100)
+        with fetcher.Fetcher(cache=cache) as f:
+            for i in range(3):
+                f.get(self.base_url + '/paper/%d' % i)
+                #make sure each entry has a distinct access time
+                body_path = cache.paths(self.base_url + '/paper/%d' % i)[0]
+                os.utime(body_path, (time.time() - 100 + i, time.time() - 100 + i))
+
+            f.get(self.base_url + '/paper/3')
+
+        self.assertLessEqual(cache.size(), 100)
+        self.assertIsNone(cache.lookup(self.base_url + '/paper/0'))
+        self.assertIsNotNone(cache.lookup(self.base_url + '/paper/3'))
+
+    def test_headers_that_vary_the_response(self):
+        cache = http_cache.HTTPCache(self.tmp_dir.name, ttl=3600)
+        with fetcher.Fetcher(cache=cache) as f:
+            html = f.get(self.base_url + '/paper').text
+            xml = f.get(self.base_url + '/paper', headers={'Accept': 'application/xml'}).text
+            self.assertIn('application/xml', xml)
+            self.assertNotEqual(html, xml)
+            self.assertEqual(xml, f.get(self.base_url + '/paper', headers={'accept': 'application/xml'}).text)
+            self.assertEqual(2, len(ETagHandler.requests_seen))
+
+            #a range request is neither answered from the cache nor stored in it
+            f.get(self.base_url + '/paper', headers={'Range': 'bytes=0-9'})
+            self.assertEqual(3, len(ETagHandler.requests_seen))
+        self.assertEqual(html, cache.lookup(self.base_url + '/paper')[1].decode())
+        self.assertNotEqual(http_cache.cache_key(self.base_url, {'Cookie': 'a=1'}),
+                            http_cache.cache_key(self.base_url, {'Cookie': 'a=2'}))
+
+
+if __name__ == "__main__":
+    unittest.main()
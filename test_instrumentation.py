@@ -0,0 +1,87 @@
+import json
+import pathlib
+import tempfile
+import unittest
+
+import get_doi
+import get_paper_info
+import instrumentation
+import replay
+
+NATURE_URL = 'https://www.nature.com/articles/s42004-019-0202-8'
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.metrics = instrumentation.Metrics()
+
+    def test_histogram(self):
+        for seconds in [0.002] * 9 + [3.0]:
+            self.metrics.observe('parse', 'pnas', seconds, nbytes=100)
+        summary = self.metrics.summary()['stages']['parse']['pnas']
+        self.assertEqual(10, summary['count'])
+        self.assertEqual(1000, summary['bytes'])
+        self.assertEqual(0.0025, summary['p50'])
+        self.assertEqual(3.0, summary['p99'])
+        self.assertEqual(3.0, summary['max'])
+
+    def test_unknown_publisher_and_disabled(self):
+        self.metrics.observe('parse', None, 0.1)
+        self.metrics.enabled = False
+        self.metrics.observe('parse', None, 0.1)
+        self.assertEqual(1, self.metrics.summary()['stages']['parse'][instrumentation.UNKNOWN]['count'])
+
+    def test_prometheus(self):
+        self.metrics.observe('fetch', 'nature', 0.2, nbytes=5000)
+        self.metrics.observe('fetch', 'nature', 100.0, nbytes=5000)
+        lines = self.metrics.prometheus().splitlines()
+        self.assertIn('scraper_stage_seconds_bucket{stage="fetch",publisher="nature",le="0.25"} 1', lines)
+        self.assertIn('scraper_stage_seconds_bucket{stage="fetch",publisher="nature",le="+Inf"} 2', lines)
+        self.assertIn('scraper_stage_seconds_count{stage="fetch",publisher="nature"} 2', lines)
+        self.assertIn('scraper_stage_bytes_total{stage="fetch",publisher="nature"} 10000', lines)
+
+    def test_profiles_only_the_slowest(self):
+        self.metrics.profile_slowest = 2
+        for i, size in enumerate([10, 100000, 10, 200000]):
+            self.metrics.profile('url%d' % i, 'pnas', sum, range(size))
+        self.assertEqual(['url3', 'url1'], [entry['url'] for entry in self.metrics.summary()['slowest']])
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            summary = self.metrics.export(pathlib.Path(tmp_dir) / 'output.csv')
+            self.assertIn('url3', pathlib.Path(summary['slowest'][0]['profile']).read_text())
+            with open(pathlib.Path(tmp_dir) / 'output.csv.metrics.json') as in_file:
+                self.assertEqual(4, json.load(in_file)['stages']['paper']['pnas']['count'])
+            self.assertTrue((pathlib.Path(tmp_dir) / 'output.csv.prom').exists())
+
+
+class TestPipelineStages(unittest.TestCase):
+    def setUp(self):
+        self.replaying = replay.replaying()
+        self.replaying.__enter__()
+        instrumentation.metrics.reset()
+
+    def tearDown(self):
+        self.replaying.__exit__(None, None, None)
+        instrumentation.metrics.reset()
+
+    def test_get_paper_info_stages(self):
+        get_paper_info.get_paper_info(NATURE_URL)
+        stages = instrumentation.metrics.summary()['stages']
+        for stage in ['paper', 'fetch', 'wait', 'download', 'parse', 'get_title', 'get_doi',
+                      'get_abstract', 'get_full_doc_link', 'open_access']:
+            self.assertEqual(1, stages[stage]['nature']['count'], stage)
+        self.assertGreater(stages['download']['nature']['bytes'], 10000)
+
+    def test_get_methods_and_pull_doi(self):
+        paper = get_paper_info.PaperInfoNature(NATURE_URL)
+        paper.get_title()
+        paper.get_title()
+        get_doi.pull_doi(NATURE_URL)
+        stages = instrumentation.metrics.summary()['stages']
+        self.assertEqual(2, stages['get_title']['nature']['count'])
+        self.assertEqual(1, stages['pull_doi']['nature']['count'])
+        self.assertEqual(2, stages['fetch']['nature']['count'])
+
+
+if __name__ == "__main__":
+    unittest.main()
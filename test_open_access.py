@@ -0,0 +1,100 @@
+import os
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import fetcher
+import open_access
+
+PDF = b'%PDF-1.4\n' + b'0' * 100000
+
+
+class PublisherHandler(BaseHTTPRequestHandler):
+    # /open.pdf is a PDF, /paywall.pdf is a login page and /nohead.pdf refuses HEAD
+    requests_seen = []
+
+    def do_HEAD(self):
+        type(self).requests_seen.append(('HEAD', self.path, None))
+        if self.path == '/nohead.pdf':
+            self.send_response(405)
+            self.end_headers()
+        elif self.path == '/redirect.pdf':
+            self.send_response(302)
+            self.send_header('Location', '/open.pdf')
+            self.end_headers()
+        else:
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html' if self.path == '/paywall.pdf' else 'application/pdf')
+            self.end_headers()
+
+    def do_GET(self):
+        range_header = self.headers.get('Range')
+        type(self).requests_seen.append(('GET', self.path, range_header))
+        body = PDF
+        if range_header:
+            start, end = range_header.split('=')[1].split('-')
+            body = PDF[int(start):int(end) + 1]
+            self.send_response(206)
+        else:
+            self.send_response(200)
+        #no Content-Type, so the probe has to look at the first bytes
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestOpenAccess(unittest.TestCase):
+    def setUp(self):
+        PublisherHandler.requests_seen = []
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), PublisherHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base_url = 'http://127.0.0.1:%d' % self.server.server_address[1]
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache = open_access.ProbeCache(os.path.join(self.tmp_dir.name, 'probes.jsonl'))
+        self.fetcher = fetcher.Fetcher()
+
+    def tearDown(self):
+        self.fetcher.close()
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmp_dir.cleanup()
+
+    def probe(self, path):
+        return open_access.probe(self.base_url + path, fetcher=self.fetcher, cache=self.cache)
+
+    def test_head_only(self):
+        self.assertTrue(self.probe('/open.pdf'))
+        self.assertFalse(self.probe('/paywall.pdf'))
+        self.assertEqual(['HEAD', 'HEAD'], [method for method, _, _ in PublisherHandler.requests_seen])
+
+    def test_follows_redirects(self):
+        self.assertTrue(self.probe('/redirect.pdf'))
+
+    def test_range_fallback(self):
+        self.assertTrue(self.probe('/nohead.pdf'))
+        self.assertEqual(('GET', '/nohead.pdf', 'bytes=0-1023'), PublisherHandler.requests_seen[-1])
+
+    def test_results_are_cached(self):
+        self.assertTrue(self.probe('/open.pdf'))
+        self.assertTrue(self.probe('/open.pdf'))
+        self.assertEqual(1, len(PublisherHandler.requests_seen))
+
+        #a new cache reading the same file doesn't probe again either
+        reloaded = open_access.ProbeCache(self.cache.path)
+        self.assertTrue(reloaded.get(self.base_url + '/open.pdf'))
+
+    def test_missing_link(self):
+        self.assertFalse(open_access.probe('', cache=self.cache))
+        self.assertFalse(open_access.probe(None, cache=self.cache))
+
+    def test_probe_many(self):
+        links = [self.base_url + path for path in ['/open.pdf', '/paywall.pdf', '/nohead.pdf']]
+        self.assertEqual([True, False, True], open_access.probe_many(links, cache=self.cache))
+
+
+if __name__ == "__main__":
+    unittest.main()
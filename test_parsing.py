@@ -0,0 +1,62 @@
+import unittest
+
+import bench_parse
+import get_doi
+import get_paper_info
+import parsing
+
+
+class TestParsing(unittest.TestCase):
+    def setUp(self):
+        self.tree = parsing.parse_html(
+            '<html><body><div class="section abstract" id="abstract-1"><p>First <i>paragraph</i></p></div>'
+            '<h1 class="c-article-title extra">A title</h1><span class="x">It\'s here</span></body></html>')
+
+    def test_find_by_class_and_id(self):
+        self.assertEqual('A title', parsing.text(parsing.find(self.tree, 'h1', class_='c-article-title')))
+        div = parsing.find(self.tree, 'div', class_='section abstract', id='abstract-1')
+        self.assertEqual('First paragraph', parsing.text(parsing.find(div, 'p')))
+        self.assertIsNone(parsing.find(self.tree, 'div', class_='abstract', id='abstract-2'))
+
+    def test_class_must_be_a_whole_word(self):
+        self.assertIsNone(parsing.find(self.tree, 'h1', class_='c-article'))
+
+    def test_quotes_in_values(self):
+        self.assertEqual([], parsing.find_all(self.tree, 'span', id="it's"))
+
+
+class TestExtractFixtures(unittest.TestCase):
+    def setUp(self):
+        self.fixtures = {publisher: (url, html) for publisher, url, html in bench_parse.load_fixtures()}
+
+    def paper(self, publisher):
+        url, html = self.fixtures[publisher]
+        return get_paper_info.paper_info_classes[publisher](url, html=html)
+
+    def test_nature(self):
+        info = self.paper('nature').extract()
+        self.assertEqual('Liquid–liquid phase separation morphologies in ultra-white beetle scales and a synthetic equivalent',
+                         info['title'])
+        self.assertEqual('https://doi.org/10.1038/s42004-019-0202-8', info['doi'])
+        self.assertTrue(info['abstract'].startswith('Cyphochilus beetle scales are amongst'))
+        self.assertTrue(info['abstract'].endswith('via liquid–liquid phase separation.'))
+        self.assertEqual('https://www.nature.com/articles/s42004-019-0202-8.pdf', info['full_doc_link'])
+
+    def test_jeb(self):
+        info = self.paper('jeb').extract()
+        self.assertEqual('Remoras pick where they stick on blue whales', info['title'])
+        self.assertEqual('10.1242/jeb.226654', info['doi'])
+        self.assertEqual('https://jeb.biologists.org/content/jeb/223/20/jeb226654.full.pdf', info['full_doc_link'])
+
+    def test_pubmed(self):
+        paper = self.paper('pubmed')
+        self.assertEqual('10.1103/PhysRevE.78.051902', paper.get_doi())
+        self.assertEqual(5, len(paper.get_similar_articles()))
+
+    def test_doi_from_tree(self):
+        url, html = self.fixtures['pubmed']
+        self.assertEqual('10.1103/PhysRevE.78.051902', get_doi.pull_doi(url, html=html))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,157 @@
+import pathlib
+import sys
+import tempfile
+import unittest
+
+import pandas as pd
+
+import pipeline
+import replay
+
+PAPERS = pd.read_csv(pathlib.Path(__file__).parent / 'test_papers_jq.csv')
+URLS = PAPERS['URL'].tolist()
+
+sys.path.append(str(pathlib.Path(__file__).parent / 'detecting_changes_in_airtable_downloads'))
+import fingerprint_diff
+
+
+class TestPipeline(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.dir = pathlib.Path(self.tmp_dir.name)
+        self.replaying = replay.replaying()
+        self.adapter = self.replaying.__enter__()
+        self.fetcher = replay.replay_fetcher(self.adapter)
+        self.export = self.dir / 'export.csv'
+        self.changes = self.dir / 'changed_data.csv'
+        self.output = self.dir / 'papers.parquet'
+
+    def tearDown(self):
+        self.fetcher.close()
+        self.replaying.__exit__(None, None, None)
+        self.tmp_dir.cleanup()
+
+    def write_export(self, rows):
+        pd.DataFrame(rows, columns=['id', 'Paper title', 'Primary lit site']).to_csv(self.export, index=False)
+
+    def write_changes(self, changes):
+        #the layout detect_changes.py writes: the snapshot header, then rows ending with the operation
+        lines = ['id,journal_title,author,last_mod'] + ['%s,0.1,0.2,2020-12-18 00:00:00,%s' % change for change in changes]
+        self.changes.write_text('\n'.join(lines) + '\n')
+
+    def run_pipeline(self, changes=True):
+        self.adapter.requests_seen = []
+        return pipeline.run(self.export, self.output, self.dir / 'mturk.csv',
+                            changes_path=self.changes if changes else None,
+                            cache_dir=self.dir / 'cache', fetcher=self.fetcher)
+
+    def fetched_pages(self):
+        return sorted(url for method, url in self.adapter.requests_seen if method == 'GET')
+
+    def test_incremental_runs(self):
+        self.write_export([['rec%d' % i, title, url] for i, (title, url) in enumerate(zip(PAPERS['Paper title'], URLS[:3]))])
+        self.assertEqual({'clean': 'ran', 'scrape': 'ran', 'mturk': 'ran'}, self.run_pipeline(changes=False))
+        self.assertEqual(sorted(URLS[:3]), self.fetched_pages())
+
+        #nothing changed, so every stage comes from the cache
+        self.assertEqual({'clean': 'cached', 'scrape': 'cached', 'mturk': 'cached'}, self.run_pipeline(changes=False))
+        self.assertEqual([], self.adapter.requests_seen)
+
+        #rec1 points to another paper, rec2 is deleted and rec3 is new: only rec1 and rec3 are fetched
+        self.write_export([['rec0', '', URLS[0]], ['rec1', '', URLS[3]], ['rec3', '', URLS[4]]])
+        self.write_changes([('rec1', 'updated'), ('rec2', 'deleted'), ('rec3', 'created')])
+        self.assertEqual('ran', self.run_pipeline()['scrape'])
+        self.assertEqual(sorted([URLS[3], URLS[4]]), self.fetched_pages())
+
+        output = pipeline.read_table(self.output).set_index('id')
+        self.assertEqual(['rec0', 'rec1', 'rec3', 'rec2'], list(output.index))
+        self.assertEqual(PAPERS['Paper title'][3], output.loc['rec1', 'title'])
+        self.assertTrue(output.loc['rec2', 'deleted'])
+        self.assertTrue(pd.isna(output.loc['rec2', 'title']))
+        hits = pd.read_csv(self.dir / 'mturk.csv')
+        self.assertEqual(sorted([URLS[0], URLS[3], URLS[4]]), sorted(hits['url']))
+
+        #the same delta applied again changes nothing
+        self.assertEqual('cached', self.run_pipeline()['scrape'])
+        self.assertEqual([], self.adapter.requests_seen)
+
+    def test_export_without_ids(self):
+        #rows are keyed on their canonical url, so removing and reordering rows keeps each row's record
+        pd.DataFrame({'Paper title': PAPERS['Paper title'][:4], 'Primary lit site': URLS[:4]}).to_csv(self.export, index=False)
+        self.run_pipeline(changes=False)
+        self.assertEqual(sorted(URLS[:4]), self.fetched_pages())
+
+        #URLS[1] is removed, the others are reordered and URLS[4] is added, without a changes file
+        urls = [URLS[3], URLS[0], URLS[4], URLS[2]]
+        pd.DataFrame({'Paper title': '', 'Primary lit site': urls}).to_csv(self.export, index=False)
+        self.assertEqual('ran', self.run_pipeline(changes=False)['scrape'])
+        self.assertEqual([urls[2]], self.fetched_pages())
+
+        output = pipeline.read_table(self.output)
+        live = output[~output['deleted']]
+        self.assertEqual(sorted(urls), sorted(live['url']))
+        titles = dict(zip(live['url'], live['title']))
+        for i in [0, 2, 3]:
+            self.assertEqual(PAPERS['Paper title'][i], titles[URLS[i]])
+        self.assertEqual(PAPERS['Paper title'][4], titles[urls[2]])
+        tombstones = output[output['deleted']]
+        self.assertEqual([pipeline.canonical.canonical_url(URLS[1])], tombstones['id'].tolist())
+        self.assertEqual(sorted(urls), sorted(pd.read_csv(self.dir / 'mturk.csv')['url']))
+
+        #the removed row comes back and is scraped again
+        pd.DataFrame({'Paper title': '', 'Primary lit site': urls + [URLS[1]]}).to_csv(self.export, index=False)
+        self.run_pipeline(changes=False)
+        self.assertEqual([URLS[1]], self.fetched_pages())
+        self.assertFalse(pipeline.read_table(self.output)['deleted'].any())
+
+    def test_fingerprint_changes(self):
+        #changes found by detect_changes.py --fingerprint in an export without ids use the pipeline's ids
+        old = pd.DataFrame({'Paper title': PAPERS['Paper title'][:3], 'Primary lit site': URLS[:3]})
+        old.to_csv(self.export, index=False)
+        self.run_pipeline(changes=False)
+        old_export = fingerprint_diff.read_export(self.export, url_column='Primary lit site')
+
+        #URLS[1] is edited, URLS[2] removed and URLS[3] added
+        new = pd.DataFrame({'Paper title': [PAPERS['Paper title'][0], 'Edited title', PAPERS['Paper title'][3]],
+                            'Primary lit site': [URLS[0], URLS[1], URLS[3]]})
+        new.to_csv(self.export, index=False)
+        changes = fingerprint_diff.diff(old_export, fingerprint_diff.read_export(self.export, url_column='Primary lit site'))
+        fingerprint_diff.write_changes(changes, str(self.changes))
+        self.assertEqual({'updated', 'deleted', 'created'}, set(pipeline.read_changes(self.changes).values()))
+
+        self.run_pipeline()
+        #the edited row is scraped again, which an id that didn't match wouldn't be
+        self.assertEqual(sorted([URLS[1], URLS[3]]), self.fetched_pages())
+        output = pipeline.read_table(self.output).set_index('id')
+        self.assertEqual({pipeline.canonical.canonical_url(URLS[2])}, set(output.index[output['deleted']]))
+        self.assertEqual(sorted(pipeline.canonical.canonical_url(url) for url in [URLS[0], URLS[1], URLS[3]]),
+                         sorted(output.index[~output['deleted']]))
+
+    def test_stage_cache(self):
+        cache = pipeline.StageCache(self.dir / 'cache', keep=2)
+        source = self.dir / 'source.txt'
+        target = self.dir / 'target.txt'
+        calls = []
+
+        def stage():
+            calls.append(1)
+            target.write_text(source.read_text().upper())
+            return [target]
+
+        for text in ['a', 'b', 'a', 'c', 'a']:
+            source.write_text(text)
+            cache.run('upper', [source], {}, stage)
+            self.assertEqual(text.upper(), target.read_text())
+        #'a' was cached the second and last time, the least recently used 'b' was evicted by 'c'
+        self.assertEqual(3, len(calls))
+        self.assertEqual(2, len(list((self.dir / 'cache' / 'upper').iterdir())))
+
+    def test_read_changes(self):
+        self.write_changes([('1', 'created'), ('2', 'updated'), ('1', 'deleted')])
+        self.assertEqual({'1': 'deleted', '2': 'updated'}, pipeline.read_changes(self.changes))
+        self.changes.write_text('id,journal_title,author,last_mod\n')
+        self.assertEqual({}, pipeline.read_changes(self.changes))
+
+
+if __name__ == "__main__":
+    unittest.main()
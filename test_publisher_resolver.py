@@ -0,0 +1,50 @@
+import unittest
+
+import pandas as pd
+
+import extraction
+import get_paper_info
+import publisher_resolver
+
+
+class TestPublisherResolver(unittest.TestCase):
+    urls = [
+        ('https://pubmed.ncbi.nlm.nih.gov/19113150/', 'pubmed'),
+        ('https://www.pnas.org/content/117/51/32196', 'pnas'),
+        ('https://www.nature.com/articles/s42004-019-0202-8', 'nature'),
+        ('https://jeb.biologists.org/content/223/23/jeb226654', 'jeb'),
+        ('https://link.springer.com/article/10.1007/s10886-009-9707-4', 'springer'),
+        ('https://royalsocietypublishing.org/doi/10.1098/rsif.2009.0203', 'rsp'),
+        ('http://WWW.Nature.com:443/articles/nature01234', 'nature'),
+        ('https://doi.org/10.1073/pnas.0000000103', 'pnas'),
+        ('https://dx.doi.org/10.1007%2Fs10886-009-9707-4', 'springer'),
+        ('https://doi.org/10.1016/j.cell.2020.01.001', 'sciencedirect'),
+        ('https://www.sciencedirect.com/science/article/pii/S0092867420300015', 'sciencedirect'),
+        ('https://besjournals.onlinelibrary.wiley.com/doi/full/10.1111/1365-2435.12345', 'wiley'),
+        ('https://doi.org/10.1126/science.1234567', None),
+        ('https://www.ncbi.nlm.nih.gov/pubmed/19113150', 'pubmed'),
+        ('http://ncbi.nlm.nih.gov/pubmed/19113150/?dopt=Abstract', 'pubmed'),
+        ('https://www.ncbi.nlm.nih.gov/pmc/articles/PMC1234567/', None),
+        ('https://notnature.com/articles/x', None),
+    ]
+
+    def test_resolve(self):
+        for url, publisher in self.urls:
+            self.assertEqual(publisher, publisher_resolver.resolve(url), url)
+
+    def test_classify_matches_resolve(self):
+        urls = pd.Series([url for url, _ in self.urls] + [None, 'not a url'], index=range(100, 119))
+        publishers = publisher_resolver.classify(urls)
+        self.assertEqual(list(urls.index), list(publishers.index))
+        self.assertEqual([publisher for _, publisher in self.urls] + [None, None], publishers.tolist())
+
+    def test_every_publisher_has_a_spec(self):
+        publishers = set(publisher_resolver.DOMAINS.values()) | set(publisher_resolver.DOI_PREFIXES.values())
+        self.assertEqual(set(extraction.available()), publishers)
+
+    def test_which_journal(self):
+        self.assertEqual('rsp', get_paper_info.which_journal('https://royalsocietypublishing.org/doi/10.1098/rsif.2009.0203'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,159 @@
+import pathlib
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+from lxml import etree
+
+import fetcher
+import get_paper_info
+import pubmed
+import replay
+
+RECORDED = pathlib.Path(__file__).parent / 'fixtures' / 'pubmed'
+
+
+def recorded(name, tag, key):
+    # recorded elements of a response by id, e.g. every <PubmedArticle> by its PMID
+    root = etree.parse(str(RECORDED / name)).getroot()
+    return {element.findtext(key): element for element in root.iter(tag)}
+
+
+class EUtilsHandler(BaseHTTPRequestHandler):
+    # stand-in for efetch and elink, answering from the recorded responses in fixtures/pubmed
+    articles = recorded('efetch.xml', 'PubmedArticle', 'MedlineCitation/PMID')
+    link_sets = recorded('elink.xml', 'LinkSet', 'IdList/Id')
+    requests_seen = []
+
+    def do_POST(self):
+        form = parse_qs(self.rfile.read(int(self.headers['Content-Length'])).decode())
+        if self.path.endswith('/efetch.fcgi'):
+            ids = form['id'][0].split(',')
+            type(self).requests_seen.append(('efetch', ids))
+            root = etree.Element('PubmedArticleSet')
+            root.extend(etree.fromstring(etree.tostring(self.articles[pmid])) for pmid in ids if pmid in self.articles)
+        elif self.path.endswith('/elink.fcgi'):
+            ids = form['id']
+            type(self).requests_seen.append(('elink', ids))
+            root = etree.Element('eLinkResult')
+            root.extend(etree.fromstring(etree.tostring(self.link_sets[pmid])) for pmid in ids if pmid in self.link_sets)
+        else:
+            self.send_response(404)
+            self.end_headers()
+            return
+
+        body = etree.tostring(root, xml_declaration=True, encoding='UTF-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/xml; charset=UTF-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestPubMed(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), EUtilsHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.eutils_url = 'http://127.0.0.1:%d/entrez/eutils/' % cls.server.server_address[1]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        EUtilsHandler.requests_seen = []
+        self.eutils = pubmed.EUtils(fetcher.Fetcher(), eutils_url=self.eutils_url, api_key='', batch_size=3)
+
+    def tearDown(self):
+        self.eutils.close()
+
+    def test_pmid_from_url(self):
+        self.assertEqual('19113150', pubmed.pmid_from_url('https://pubmed.ncbi.nlm.nih.gov/19113150/'))
+        self.assertEqual('19113150', pubmed.pmid_from_url('/19113150/'))
+        self.assertEqual('19113150', pubmed.pmid_from_url('19113150'))
+        #legacy links, as canonical.canonical_url reads them
+        self.assertEqual('19113150', pubmed.pmid_from_url('https://www.ncbi.nlm.nih.gov/pubmed/19113150'))
+        self.assertEqual('19113150', pubmed.pmid_from_url('http://ncbi.nlm.nih.gov/pubmed/19113150/?dopt=Abstract'))
+        self.assertEqual('19113150', pubmed.pmid_from_url('/pubmed/19113150'))
+        self.assertIsNone(pubmed.pmid_from_url('https://www.ncbi.nlm.nih.gov/pmc/articles/PMC2642682/'))
+        self.assertIsNone(pubmed.pmid_from_url('https://www.nature.com/articles/s42004-019-0202-8'))
+
+    def test_fetch_articles_in_batches(self):
+        pmids = ['19113150', '20000000', '20000001', '20000002', '20000003', '19113150', '99999999']
+        articles = self.eutils.fetch_articles(pmids)
+
+        self.assertEqual([['19113150', '20000000', '20000001'], ['20000002', '20000003', '99999999']],
+                         [ids for _, ids in EUtilsHandler.requests_seen])
+        self.assertEqual({'19113150', '20000000', '20000001', '20000002', '20000003'}, set(articles))
+        self.assertEqual('Mechanics of the Venus flytrap closure', articles['19113150']['title'])
+        self.assertEqual('10.1103/PhysRevE.78.051902', articles['19113150']['doi'])
+        #DOI only given as the article's ELocationID
+        self.assertEqual('10.1000/jbm.6.0001', articles['20000001']['doi'])
+        self.assertEqual('BACKGROUND: Biological materials combine stiffness and toughness. '
+                         'RESULTS: Design principles transfer to engineered materials.', articles['20000000']['abstract'])
+        self.assertEqual('', articles['20000003']['abstract'])
+        self.assertEqual('PMC9000001', articles['20000001']['pmc'])
+        self.assertEqual('', articles['19113150']['pmc'])
+
+    def test_similar(self):
+        links = self.eutils.similar(['20000000', '20000003'])
+        self.assertEqual(['19113150', '30000000', '20000001'], links['20000000'])
+        self.assertEqual([], links['20000003'])
+
+    def test_crawl_breadth_first(self):
+        depths = self.eutils.crawl_similar(['19113150'], max_depth=2, max_articles=100)
+        self.assertEqual({'19113150': 0, '20000000': 1, '20000001': 1, '20000002': 1, '20000003': 1,
+                          '20000004': 1, '30000000': 2, '30000001': 2}, depths)
+        self.assertEqual(list(depths), sorted(depths, key=depths.get))
+        #one request for the seed, then the five articles of the first level in batches of 3
+        self.assertEqual([['19113150'], ['20000000', '20000001', '20000002'], ['20000003', '20000004']],
+                         [ids for _, ids in EUtilsHandler.requests_seen])
+
+    def test_crawl_budget(self):
+        self.assertEqual(['19113150', '20000000', '20000001'],
+                         list(self.eutils.crawl_similar(['19113150'], max_depth=3, max_articles=3)))
+        depths = self.eutils.crawl_similar(['19113150'], max_depth=1, per_article=2)
+        self.assertEqual(['19113150', '20000000', '20000001'], list(depths))
+        self.assertEqual(['19113150'], list(self.eutils.crawl_similar(['19113150'], max_depth=0)))
+
+    def test_paper_info_many(self):
+        urls = ['https://pubmed.ncbi.nlm.nih.gov/19113150/', 'https://pubmed.ncbi.nlm.nih.gov/20000002/',
+                'https://www.nature.com/articles/s42004-019-0202-8']
+        info = pubmed.paper_info_many(urls, self.eutils)
+        self.assertEqual(urls[:2], list(info))
+        self.assertEqual('Similar article 2', info[urls[1]]['title'])
+        self.assertEqual(1, len(EUtilsHandler.requests_seen))
+
+    def test_iter_paper_info_uses_eutils(self):
+        urls = ['https://pubmed.ncbi.nlm.nih.gov/19113150/', 'https://www.ncbi.nlm.nih.gov/pubmed/20000002',
+                'https://www.nature.com/articles/s42004-019-0202-8']
+        adapter = replay.ReplayAdapter()
+        with replay.replay_fetcher(adapter) as offline_fetcher:
+            results = list(get_paper_info.iter_paper_info(urls, fetcher=offline_fetcher, eutils=self.eutils))
+        self.assertEqual(urls, [url for url, _ in results])
+        self.assertEqual('Mechanics of the Venus flytrap closure', results[0][1].title)
+        self.assertEqual('10.1103/PhysRevE.78.051902', results[0][1].doi)
+        self.assertIsNone(results[0][1].is_open_access)
+        self.assertEqual('Similar article 2', results[1][1].title)
+        #both PubMed articles in one request, and no PubMed page downloaded
+        self.assertEqual([('efetch', ['19113150', '20000002'])], EUtilsHandler.requests_seen)
+        self.assertEqual([urls[2]], [url for method, url in adapter.requests_seen if method == 'GET'])
+
+    def test_pmc_pdf_link(self):
+        #an article in PubMed Central links to its PDF there, which is probed for open access
+        article = self.eutils.fetch_articles(['20000001'])['20000001']
+        adapter = replay.ReplayAdapter()
+        with replay.replay_fetcher(adapter) as offline_fetcher:
+            record = get_paper_info.paper_record_from_article(article, fetcher=offline_fetcher)
+        self.assertEqual('https://www.ncbi.nlm.nih.gov/pmc/articles/PMC9000001/pdf/', record.full_doc_link)
+        self.assertEqual([('HEAD', record.full_doc_link)], adapter.requests_seen)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+
+import fetcher
+import get_paper_info
+import open_access
+import replay
+
+
+class TestReplay(unittest.TestCase):
+    def setUp(self):
+        self.adapter = replay.ReplayAdapter()
+        self.fetcher = replay.replay_fetcher(self.adapter)
+
+    def tearDown(self):
+        self.fetcher.close()
+
+    def test_every_publisher_is_recorded(self):
+        urls = {get_paper_info.which_journal(url) for url in replay.load_manifest()}
+        self.assertTrue(set(get_paper_info.paper_info_classes) <= urls)
+
+    def test_recorded_page(self):
+        r = self.fetcher.get('https://www.nature.com/articles/s42004-019-0202-8')
+        self.assertEqual(200, r.status_code)
+        self.assertIn('c-article-title', r.text)
+
+    def test_unrecorded_url_never_goes_out(self):
+        with self.assertRaises(replay.NotRecorded):
+            self.fetcher.get('https://www.nature.com/articles/not-recorded')
+
+    def test_head_and_range(self):
+        pdf = 'https://www.nature.com/articles/s42004-019-0202-8.pdf'
+        r = self.fetcher.head(pdf)
+        self.assertEqual('application/pdf', r.headers['Content-Type'])
+        self.assertEqual(b'', r.content)
+
+        r = self.fetcher.get(pdf, headers={'Range': 'bytes=0-3'})
+        self.assertEqual(206, r.status_code)
+        self.assertEqual(b'%PDF', r.content)
+
+    def test_replaying_swaps_defaults(self):
+        real_fetcher, real_cache = fetcher.default_fetcher, open_access.default_cache
+        with replay.replaying() as adapter:
+            self.assertTrue(open_access.probe('https://www.nature.com/articles/s42004-019-0202-8.pdf'))
+            self.assertEqual([('HEAD', 'https://www.nature.com/articles/s42004-019-0202-8.pdf')],
+                             adapter.requests_seen)
+        self.assertIs(real_fetcher, fetcher.default_fetcher)
+        self.assertIs(real_cache, open_access.default_cache)
+
+
+if __name__ == '__main__':
+    unittest.main()
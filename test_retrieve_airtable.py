@@ -0,0 +1,139 @@
+import json
+import re
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import retrieve_airtable
+
+OLD = '2020-06-01T00:00:00.000Z'
+
+
+class AirtableHandler(BaseHTTPRequestHandler):
+    # stand-in for the Airtable list records API, with pages of pageSize records
+    # and filterByFormula support for modified_since_formula
+    records = []
+    requests_seen = []
+    rate_limit_next = 0
+
+    def do_GET(self):
+        cls = type(self)
+        query = parse_qs(urlsplit(self.path).query)
+        cls.requests_seen.append((urlsplit(self.path).path, query))
+        if self.headers.get('Authorization') != 'Bearer key':
+            return self.send_json(401, {'error': 'AUTHENTICATION_REQUIRED'})
+        if cls.rate_limit_next:
+            cls.rate_limit_next -= 1
+            return self.send_json(429, {'errors': 'RATE_LIMIT_REACHED'}, {'Retry-After': '0'})
+
+        records = cls.records
+        if 'filterByFormula' in query:
+            since = re.search(r"DATETIME_PARSE\('([^']+)'\)", query['filterByFormula'][0]).group(1)
+            records = [r for r in records if r['modified'] > since]
+        start = int(query.get('offset', ['0'])[0])
+        page_size = int(query['pageSize'][0])
+        page = {'records': [{'id': r['id'], 'createdTime': OLD, 'fields': r['fields']}
+                            for r in records[start:start + page_size]]}
+        if start + page_size < len(records):
+            page['offset'] = str(start + page_size)
+        self.send_json(200, page)
+
+    def send_json(self, status, data, headers=None):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def now():
+    return time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime(time.time() + 1))
+
+
+class TestRetrieveAirtable(unittest.TestCase):
+    def setUp(self):
+        AirtableHandler.records = [{'id': 'rec%03d' % i, 'modified': OLD,
+                                    'fields': {'Paper title': 'Paper %d' % i, 'DOI': '10.1000/%d' % i}}
+                                   for i in range(250)]
+        AirtableHandler.requests_seen = []
+        AirtableHandler.rate_limit_next = 0
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), AirtableHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.api_url = 'http://127.0.0.1:%d/v0' % self.server.server_address[1]
+        self.limiter = retrieve_airtable.RateLimiter(rate=1000)
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.session = retrieve_airtable.airtable_session('key')
+
+    def tearDown(self):
+        self.session.close()
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmp_dir.cleanup()
+
+    def sync(self, **kwargs):
+        return retrieve_airtable.sync('Colleen%20and%20Alex', self.tmp_dir.name, session=self.session,
+                                      limiter=self.limiter, api_url=self.api_url, **kwargs)
+
+    def test_retrieve_all_pages(self):
+        df = retrieve_airtable.retrieve_airtable_data('Colleen%20and%20Alex', api_key='key',
+                                                      api_url=self.api_url, limiter=self.limiter)
+        self.assertEqual(250, len(df))
+        self.assertEqual('Paper 249', df['Paper title'].iloc[-1])
+        self.assertEqual(3, len(AirtableHandler.requests_seen))
+        self.assertEqual('/v0/%s/Colleen%%20and%%20Alex' % retrieve_airtable.BASE_ID,
+                         AirtableHandler.requests_seen[0][0])
+
+    def test_incremental_sync(self):
+        self.assertEqual(250, self.sync())
+        self.assertNotIn('filterByFormula', AirtableHandler.requests_seen[0][1])
+
+        AirtableHandler.records[5]['fields'] = {'Paper title': 'Paper 5, edited', 'DOI': '10.1000/5'}
+        AirtableHandler.records[5]['modified'] = now()
+        AirtableHandler.records.append({'id': 'rec250', 'modified': now(), 'fields': {'Paper title': 'Paper 250'}})
+        AirtableHandler.requests_seen = []
+
+        self.assertEqual(2, self.sync())
+        self.assertEqual(1, len(AirtableHandler.requests_seen))
+        self.assertIn('LAST_MODIFIED_TIME()', AirtableHandler.requests_seen[0][1]['filterByFormula'][0])
+
+        df = retrieve_airtable.read_store(self.tmp_dir.name, 'Colleen and Alex')
+        self.assertEqual(251, len(df))
+        self.assertEqual('Paper 5, edited', df['Paper title'].iloc[5])
+        self.assertEqual('Paper 250', df['Paper title'].iloc[-1])
+
+    def test_full_sync_drops_deleted_records(self):
+        self.sync()
+        del AirtableHandler.records[:10]
+        self.assertEqual(0, self.sync())
+        self.assertEqual(240, self.sync(full=True))
+        self.assertEqual(240, len(retrieve_airtable.read_store(self.tmp_dir.name, 'Colleen and Alex')))
+
+    def test_backs_off_after_rate_limit(self):
+        AirtableHandler.rate_limit_next = 2
+        self.assertEqual(250, self.sync())
+        self.assertEqual(5, len(AirtableHandler.requests_seen))
+        self.assertGreater(self.limiter.interval, self.limiter.min_interval)
+
+    def test_rate_limiter_spaces_requests(self):
+        limiter = retrieve_airtable.RateLimiter(rate=50)
+        start = time.monotonic()
+        for _ in range(11):
+            limiter.wait()
+        self.assertGreaterEqual(time.monotonic() - start, 0.19)
+
+    def test_needs_api_key(self):
+        with self.assertRaises(RuntimeError):
+            retrieve_airtable.airtable_session('')
+
+
+if __name__ == '__main__':
+    unittest.main()
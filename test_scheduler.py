@@ -0,0 +1,167 @@
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+import fetcher
+import scheduler
+
+
+class ThrottlingHandler(BaseHTTPRequestHandler):
+    # answers the first `throttle` requests with `status` and Retry-After, then 200
+    throttle = 0
+    status = 429
+    retry_after = '1'
+    requests_seen = 0
+    lock = threading.Lock()
+
+    def do_GET(self):
+        cls = type(self)
+        with cls.lock:
+            cls.requests_seen += 1
+            throttled = cls.throttle > 0
+            cls.throttle -= 1
+        self.send_response(cls.status if throttled else 200)
+        if throttled and cls.retry_after is not None:
+            self.send_header('Retry-After', cls.retry_after)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'ok')
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestScheduler(unittest.TestCase):
+    def setUp(self):
+        ThrottlingHandler.throttle = 0
+        ThrottlingHandler.status = 429
+        ThrottlingHandler.retry_after = '1'
+        ThrottlingHandler.requests_seen = 0
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), ThrottlingHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = 'http://127.0.0.1:%d/paper' % self.server.server_address[1]
+        self.old_backoff_base = scheduler.BACKOFF_BASE
+        scheduler.BACKOFF_BASE = 0.01
+
+    def tearDown(self):
+        scheduler.BACKOFF_BASE = self.old_backoff_base
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_retry_after_pauses_host(self):
+        ThrottlingHandler.throttle = 1
+        with fetcher.Fetcher(per_host=4) as f:
+            start = time.monotonic()
+            r = f.get(self.url)
+            self.assertGreaterEqual(time.monotonic() - start, 0.9)
+            state = f.scheduler.host(fetcher.host_of(self.url))
+        self.assertEqual(200, r.status_code)
+        self.assertEqual(2, ThrottlingHandler.requests_seen)
+        self.assertEqual(2, state.limit)
+        self.assertEqual(scheduler.DEFAULT_RATE / 2, state.bucket.rate)
+
+    def test_long_retry_after_gives_up(self):
+        #a day's Retry-After, or a date far ahead, pauses the host for max_pause and isn't retried
+        for value in ['86400', 'Fri, 01 Jan 2100 00:00:00 GMT']:
+            ThrottlingHandler.throttle = 1
+            ThrottlingHandler.requests_seen = 0
+            ThrottlingHandler.retry_after = value
+            with fetcher.Fetcher(scheduler=scheduler.Scheduler(max_pause=0.5)) as f:
+                start = time.monotonic()
+                self.assertEqual(429, f.get(self.url).status_code)
+                self.assertLess(time.monotonic() - start, 0.4)
+                state = f.scheduler.host(fetcher.host_of(self.url))
+                self.assertLessEqual(state.paused_until, time.monotonic() + 0.5)
+                #the next request waits out the pause, then goes through
+                self.assertEqual(200, f.get(self.url).status_code)
+                self.assertGreaterEqual(time.monotonic() - start, 0.45)
+            self.assertEqual(2, ThrottlingHandler.requests_seen)
+
+    def test_503_without_retry_after(self):
+        ThrottlingHandler.throttle = 2
+        ThrottlingHandler.status = 503
+        ThrottlingHandler.retry_after = None
+        with fetcher.Fetcher() as f:
+            self.assertEqual(200, f.get(self.url).status_code)
+        self.assertEqual(3, ThrottlingHandler.requests_seen)
+
+    def test_retries_are_bounded(self):
+        ThrottlingHandler.throttle = 100
+        ThrottlingHandler.status = 500
+        ThrottlingHandler.retry_after = None
+        with fetcher.Fetcher(scheduler=scheduler.Scheduler(max_retries=2)) as f:
+            self.assertEqual(500, f.get(self.url).status_code)
+        self.assertEqual(3, ThrottlingHandler.requests_seen)
+
+    def test_connection_errors_are_retried_then_raised(self):
+        attempts = []
+
+        def refuse():
+            attempts.append(1)
+            raise requests.ConnectionError('refused')
+
+        with self.assertRaises(requests.ConnectionError):
+            scheduler.Scheduler(max_retries=3).send('example.org', refuse)
+        self.assertEqual(4, len(attempts))
+
+    def test_other_errors_free_their_slot(self):
+        def invalid():
+            raise requests.exceptions.InvalidURL('bad url')
+
+        s = scheduler.Scheduler(max_concurrency=1)
+        for _ in range(3):
+            with self.assertRaises(requests.exceptions.InvalidURL):
+                s.send('example.org', invalid)
+        self.assertEqual(0, s.host('example.org').in_flight)
+
+    def test_additive_increase(self):
+        state = scheduler.HostState(max_concurrency=4)
+        state.decrease(0.5)
+        self.assertEqual(2, state.limit)
+        for _ in range(2):
+            state.acquire()
+            state.release(200, 0.1)
+        self.assertEqual(3, state.limit)
+        self.assertEqual(scheduler.DEFAULT_RATE / 2 + scheduler.RATE_STEP, state.bucket.rate)
+
+    def test_rising_latency_lowers_concurrency(self):
+        state = scheduler.HostState(max_concurrency=4)
+        for _ in range(5):
+            state.acquire()
+            state.release(200, 0.2)
+        rate = state.bucket.rate
+        for _ in range(10):
+            state.acquire()
+            state.release(200, 5.0)
+        self.assertEqual(1, state.limit)
+        self.assertEqual(rate, state.bucket.rate)
+
+    def test_one_decrease_per_window(self):
+        state = scheduler.HostState(max_concurrency=8)
+        for _ in range(4):
+            state.acquire()
+        for _ in range(4):
+            state.release(429, 0.1)
+        self.assertEqual(4, state.limit)
+
+    def test_token_bucket_spaces_requests(self):
+        state = scheduler.HostState(max_concurrency=1, rate=20, burst=1)
+        start = time.monotonic()
+        for _ in range(5):
+            state.acquire()
+            state.release()
+        self.assertGreaterEqual(time.monotonic() - start, 0.19)
+
+    def test_retry_after_date(self):
+        response = requests.Response()
+        response.headers['Retry-After'] = 'Wed, 21 Oct 2015 07:28:00 GMT'
+        self.assertEqual(0, scheduler.retry_after(response))
+        response.headers['Retry-After'] = '120'
+        self.assertEqual(120, scheduler.retry_after(response))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import csv
+import pathlib
+import tempfile
+import unittest
+
+import get_paper_info
+import write_mturk_csv
+
+RECORD = get_paper_info.PaperRecord('Geckos & <their> "feet"', '10.1038/35015073',
+                                    'Setae\x07 stick\n\n  to walls.', 'https://www.nature.com/articles/35015073.pdf', True)
+
+
+def read_rows(path):
+    with open(path, newline='', encoding='utf-8') as in_file:
+        return list(csv.DictReader(in_file))
+
+
+class TestWriteMturkCsv(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.output = pathlib.Path(self.tmp_dir.name) / 'hits.csv'
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_hit_row(self):
+        row = write_mturk_csv.hit_row(RECORD, 'https://www.nature.com/articles/35015073?a=1&b=2')
+        self.assertEqual('Geckos &amp; &lt;their&gt; &quot;feet&quot;', row['title'])
+        self.assertEqual('Setae stick to walls.', row['abstract'])
+        self.assertEqual('https://www.nature.com/articles/35015073?a=1&amp;b=2', row['url'])
+        #without the page's url, the DOI is the link
+        self.assertEqual('https://doi.org/10.1038/35015073', write_mturk_csv.hit_row(RECORD)['url'])
+        self.assertIsNone(write_mturk_csv.hit_row(RECORD._replace(abstract=float('nan'))))
+        self.assertIsNone(write_mturk_csv.hit_row(RECORD, 'javascript:alert(1)'))
+
+    def test_single_file(self):
+        records = [('https://example.org/%d' % i, RECORD) for i in range(3)] + [RECORD._replace(title='')]
+        summary = write_mturk_csv.write_mturk_csv(iter(records), self.output)
+        self.assertEqual([str(self.output)], summary['files'])
+        self.assertEqual((3, 1), (summary['rows'], summary['skipped']))
+        rows = read_rows(self.output)
+        self.assertEqual(write_mturk_csv.COLUMNS, list(rows[0]))
+        self.assertEqual(['https://example.org/0', 'https://example.org/1', 'https://example.org/2'],
+                         [row['url'] for row in rows])
+
+    def test_shards(self):
+        records = [('https://example.org/%d' % i, RECORD) for i in range(7)]
+        summary = write_mturk_csv.write_mturk_csv(records, self.output, max_rows=3)
+        self.assertEqual(['hits-00000.csv', 'hits-00001.csv', 'hits-00002.csv'],
+                         [pathlib.Path(path).name for path in summary['files']])
+        self.assertEqual([3, 3, 1], [len(read_rows(path)) for path in summary['files']])
+
+        summary = write_mturk_csv.write_mturk_csv(records, self.output, max_bytes=300)
+        sizes = [pathlib.Path(path).stat().st_size for path in summary['files']]
+        self.assertTrue(all(size <= 300 for size in sizes), sizes)
+        self.assertEqual(7, sum(len(read_rows(path)) for path in summary['files']))
+        with self.assertRaises(ValueError):
+            write_mturk_csv.write_mturk_csv(records, self.output, max_bytes=100)
+
+    def test_preview(self):
+        records = (('https://example.org/%d' % i, RECORD) for i in range(50))
+        summary = write_mturk_csv.write_mturk_csv(records, self.output, preview=3)
+        self.assertEqual(3, len(summary['preview']))
+        page = pathlib.Path(summary['preview'][0]).read_text(encoding='utf-8')
+        self.assertIn('Geckos &amp; &lt;their&gt; &quot;feet&quot;', page)
+        self.assertIn('Setae stick to walls.', page)
+        self.assertNotIn('${', page)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,2 +1,187 @@
-def write_mturk_csv(info_on_papers,output_csv_filename):
-    pass
\ No newline at end of file
+#Writes the input CSVs of an MTurk batch from a stream of paper records.
+#MTurk puts each CSV value into mturk_template.html as it is, in place of
+#${title}, ${abstract} and ${url}, so values are cleaned up and HTML escaped once
+#here, and rows a worker couldn't label (no title or abstract, or a link that
+#isn't http/https) are skipped. Rows are written one at a time, so any number
+#of records takes the same memory. With max_rows or max_bytes the batch is split
+#into shards, e.g. hits-00000.csv, hits-00001.csv, each a batch MTurk accepts.
+#A sample of the HITs can be rendered with the template into <output>.preview/
+#to check how they look before publishing
+import html
+import pathlib
+import random
+import re
+import string
+
+TEMPLATE = pathlib.Path(__file__).parent / 'mturk_template.html'
+#columns of the HIT input CSV. title, abstract and url are the template's fields
+COLUMNS = ['title', 'abstract', 'url', 'doi']
+DOI_URL = 'https://doi.org/'
+ENCODING = 'utf-8'
+
+#control characters, which MTurk rejects
+CONTROL_CHARACTERS = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f\x7f]')
+URL_SCHEMES = ('http://', 'https://')
+
+
+def clean_text(value):
+    # value as one line of text without control characters, '' for None or NaN.
+    # Runs of whitespace become one space, as HTML shows them anyway
+    if value is None or value != value:
+        return ''
+    value = str(value)
+    if CONTROL_CHARACTERS.search(value):
+        value = CONTROL_CHARACTERS.sub('', value)
+    return ' '.join(value.split())
+
+
+def link_of(url, doi, full_doc_link):
+    # link shown to the worker: the paper's page, else its DOI, else its full document
+    if url:
+        return url
+    if doi:
+        return doi if doi.startswith(URL_SCHEMES) else DOI_URL + doi
+    return full_doc_link
+
+
+def hit_row(record, url=None):
+    '''
+    Returns the HIT input row {column: value} of a paper, with every value HTML
+    escaped, or None if the paper can't be labeled.
+
+    Parameters
+    record : get_paper_info.PaperRecord, or a tuple of its five fields
+    url : url the paper was scraped from, shown to the worker as its link
+    '''
+    title, doi, abstract, full_doc_link, _ = (clean_text(value) for value in record)
+    link = link_of(clean_text(url), doi, full_doc_link)
+    if not title or not abstract or not link.startswith(URL_SCHEMES):
+        return None
+    return {'title': html.escape(title), 'abstract': html.escape(abstract),
+            'url': html.escape(link), 'doi': html.escape(doi)}
+
+
+def shard_path(output_csv_filename, index):
+    # e.g. hits-00002.csv for the third shard of hits.csv
+    path = pathlib.Path(output_csv_filename)
+    return path.with_name('%s-%05d%s' % (path.stem, index, path.suffix))
+
+
+class ShardedWriter(object):
+    def __init__(self, output_csv_filename, max_rows=None, max_bytes=None):
+        '''
+        Writes rows to output_csv_filename, or to numbered shards of it when
+        either limit is given. Every shard starts with the header and keeps
+        within both limits, header included.
+
+        Parameters
+        output_csv_filename : CSV file to write
+        max_rows : most rows in a shard, not counting the header
+        max_bytes : most bytes in a shard
+        '''
+        self.output_csv_filename = output_csv_filename
+        self.sharded = bool(max_rows or max_bytes)
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.paths = []
+        self.out_file = None
+        self.header = self.encode(COLUMNS)
+
+    def encode(self, values):
+        # one CSV line as bytes, every value quoted. hit_row has already escaped every
+        # quote and removed every line break, so nothing inside a value needs escaping,
+        # which is several times faster than the csv module on long abstracts
+        return ('"' + '","'.join(values) + '"\n').encode(ENCODING)
+
+    def open(self):
+        self.close()
+        path = shard_path(self.output_csv_filename, len(self.paths)) if self.sharded \
+            else pathlib.Path(self.output_csv_filename)
+        self.paths.append(path)
+        self.out_file = path.open('wb')
+        self.out_file.write(self.header)
+        self.rows = 0
+        self.nbytes = len(self.header)
+
+    def write(self, row):
+        line = self.encode([row[column] for column in COLUMNS])
+        if self.max_bytes and len(self.header) + len(line) > self.max_bytes:
+            raise ValueError('A row of %d bytes can never fit in a shard of %d bytes' % (len(line), self.max_bytes))
+        if self.out_file is None or (self.max_rows and self.rows >= self.max_rows) \
+                or (self.max_bytes and self.nbytes + len(line) > self.max_bytes):
+            self.open()
+        self.out_file.write(line)
+        self.rows += 1
+        self.nbytes += len(line)
+
+    def close(self):
+        if self.out_file is not None:
+            self.out_file.close()
+            self.out_file = None
+
+
+def render_preview(rows, directory, template=TEMPLATE):
+    '''
+    Writes each row substituted into the HIT template to directory/hit_NNN.html
+    the way MTurk would show it, and returns the paths written.
+    '''
+    template = string.Template(pathlib.Path(template).read_text(encoding=ENCODING))
+    directory = pathlib.Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    for old_page in directory.glob('hit_*.html'):
+        old_page.unlink()
+    paths = []
+    for i, row in enumerate(rows):
+        path = directory / ('hit_%03d.html' % i)
+        path.write_text(template.safe_substitute(row), encoding=ENCODING)
+        paths.append(path)
+    return paths
+
+
+def write_mturk_csv(info_on_papers, output_csv_filename, max_rows=None, max_bytes=None, preview=0, seed=0):
+    '''
+    Writes the HIT input CSV of an MTurk batch, reading info_on_papers one
+    record at a time. Returns {'files': [CSV files written], 'rows': rows
+    written, 'skipped': records that couldn't be labeled, 'preview': [pages]}.
+
+    Parameters
+    info_on_papers : iterable of get_paper_info.PaperRecords, or of
+        (url, PaperRecord) pairs as yielded by get_paper_info.iter_paper_info
+    output_csv_filename : CSV file to write, or the name the shards are numbered after
+    max_rows : most rows in each CSV file, None for no limit
+    max_bytes : most bytes in each CSV file, None for no limit
+    preview : number of HITs, picked at random, rendered with mturk_template.html
+        into <output>.preview/
+    seed : seed of the random choice of HITs to preview
+    '''
+    writer = ShardedWriter(output_csv_filename, max_rows, max_bytes)
+    #reservoir sample of the rows, so the preview is picked without keeping every row
+    sample = []
+    rng = random.Random(seed)
+    rows = skipped = 0
+    try:
+        for item in info_on_papers:
+            url, record = item if len(item) == 2 else (None, item)
+            row = hit_row(record, url)
+            if row is None:
+                skipped += 1
+                continue
+            writer.write(row)
+            if len(sample) < preview:
+                sample.append(row)
+            elif preview:
+                i = rng.randrange(rows + 1)
+                if i < preview:
+                    sample[i] = row
+            rows += 1
+        if writer.out_file is None:
+            #a header-only file, so the batch always has an output
+            writer.open()
+    finally:
+        writer.close()
+
+    preview_paths = []
+    if preview:
+        preview_paths = render_preview(sample, pathlib.Path(output_csv_filename).with_suffix('.preview'))
+    return {'files': [str(path) for path in writer.paths], 'rows': rows, 'skipped': skipped,
+            'preview': [str(path) for path in preview_paths]}